@@ -1,138 +1,117 @@
 import os
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import secrets
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Literal
 from urllib.parse import urlsplit
+from uuid import UUID
 from fastapi import FastAPI, Depends, HTTPException, Response, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db, engine
-from modelos import Usuario, UsuarioOAuth, Lista, ListaItem, Producto, Unidad
+from db import (
+    get_db, get_db_async, DB_ASYNC,
+    iniciar_chequeo_salud, detener_chequeo_salud, diagnostico,
+)
+from modelos import Usuario, UsuarioOAuth
 from esquemas import (
     RegistroIn, LoginIn, GoogleIn, UsuarioOut,
-    ListaCrearIn, ListaOut, ListaDetalleOut,
-    ItemCrearIn, ItemPatchIn, LinkOut, ProductoOut, UnidadOut
+    ListaCrearIn, ListaOut, ListaDetalleOut, CambiosOut,
+    ItemCrearIn, ItemPatchIn, ItemsLoteIn, ItemsLoteOut, ItemLoteOut, ItemsLotePatchIn,
+    SyncIn, SyncOut, LinkOut, ProductoOut, UnidadOut, SeriePreciosOut, CostoEstimadoOut
 )
 from auth import (
-    hash_password, verify_password, crear_token, set_cookie, clear_cookie,
-    usuario_actual, a_mayusculas
+    hash_password, verificar_y_actualizar, crear_token, set_cookie, clear_cookie,
+    usuario_actual, usuario_actual_async, invalidar_usuario, UsuarioActual, a_mayusculas
 )
 import crud
+import claves
+import permisos
+import migraciones
+import metricas
+from respuestas import RespuestaJSON
+from eventos import distribuidor
+from catalogo import catalogo, CANAL as CANAL_CATALOGO
+from verificador_google import verificador, TokenInvalido, CertificadosNoDisponibles
 
 APP_BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:5174")
+EVENTOS_PING_SEG = float(os.getenv("EVENTOS_PING_SEG", "15"))  # keep-alive del stream SSE
+UNIDADES_MAX_AGE = int(os.getenv("UNIDADES_MAX_AGE", "86400"))  # segundos de caché del catálogo de unidades
+DIAG_TOKEN = os.getenv("DIAG_TOKEN", "")  # habilita /api/listas/diagnostico/* (vacío = cerrado, 404)
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 _parsed_app_base = urlsplit(APP_BASE_URL)
 APP_ORIGIN = f"{_parsed_app_base.scheme}://{_parsed_app_base.netloc}" if _parsed_app_base.scheme and _parsed_app_base.netloc else ""
 
-app = FastAPI()
+
+app = FastAPI(default_response_class=RespuestaJSON)
 
 
-def aplicar_migraciones_compatibilidad():
+def ruta(fn):
     """
-    Compatibilidad para entornos ya desplegados sin Alembic:
-    - Corrige typo `lista.usuario_ud` -> `lista.usuario_id`.
-    - Asegura `created_at` en tablas usadas por ORM.
-    - Permite `usuario.password` nullable (usuarios OAuth).
+    Con DB_ASYNC=1 expone el endpoint como `async def`: recibe una AsyncSession
+    (y el usuario vía `usuario_actual_async`) y ejecuta el cuerpo sync con
+    `run_sync`, sin ocupar el threadpool; los que no usan la base (p. ej.
+    `unidades`, desde el catálogo) van al threadpool para no bloquear el loop.
+    En ambos modos marca el fin del endpoint para medir la serialización de
+    la respuesta.
     """
-    with engine.begin() as conn:
-        conn.execute(text("""
-DO $$
-BEGIN
-  IF to_regclass('public.lista') IS NOT NULL THEN
-    IF EXISTS (
-      SELECT 1
-      FROM information_schema.columns
-      WHERE table_schema = 'public'
-        AND table_name = 'lista'
-        AND column_name = 'usuario_ud'
-    ) AND NOT EXISTS (
-      SELECT 1
-      FROM information_schema.columns
-      WHERE table_schema = 'public'
-        AND table_name = 'lista'
-        AND column_name = 'usuario_id'
-    ) THEN
-      ALTER TABLE public.lista RENAME COLUMN usuario_ud TO usuario_id;
-    END IF;
-
-    IF NOT EXISTS (
-      SELECT 1
-      FROM information_schema.columns
-      WHERE table_schema = 'public'
-        AND table_name = 'lista'
-        AND column_name = 'created_at'
-    ) THEN
-      ALTER TABLE public.lista
-      ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
-    END IF;
-  END IF;
-
-  IF to_regclass('public.usuario') IS NOT NULL THEN
-    IF NOT EXISTS (
-      SELECT 1
-      FROM information_schema.columns
-      WHERE table_schema = 'public'
-        AND table_name = 'usuario'
-        AND column_name = 'created_at'
-    ) THEN
-      ALTER TABLE public.usuario
-      ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
-    END IF;
-
-    IF EXISTS (
-      SELECT 1
-      FROM information_schema.columns
-      WHERE table_schema = 'public'
-        AND table_name = 'usuario'
-        AND column_name = 'password'
-    ) THEN
-      ALTER TABLE public.usuario ALTER COLUMN password DROP NOT NULL;
-    END IF;
-  END IF;
-END
-$$;
-        """))
-        conn.execute(text("""
-INSERT INTO public.producto (nombre, usuario_id)
-SELECT p.nombre, NULL::uuid
-FROM (VALUES
-  ('AREPAS'),
-  ('HUEVOS'),
-  ('ARROZ'),
-  ('FRIJOL'),
-  ('LENTEJA'),
-  ('ACEITE'),
-  ('SAL'),
-  ('AZUCAR'),
-  ('PANELA'),
-  ('CAFE'),
-  ('LECHE'),
-  ('QUESO'),
-  ('MANTEQUILLA'),
-  ('POLLO'),
-  ('CARNE DE RES'),
-  ('CHORIZO'),
-  ('PAPA'),
-  ('PLATANO'),
-  ('YUCA'),
-  ('TOMATE'),
-  ('CEBOLLA'),
-  ('AJO'),
-  ('CILANTRO'),
-  ('ZANAHORIA'),
-  ('BANANO'),
-  ('NARANJA')
-) AS p(nombre)
-WHERE NOT EXISTS (
-  SELECT 1 FROM public.producto e WHERE e.nombre = p.nombre
-);
-        """))
+    if not DB_ASYNC:
+        @functools.wraps(fn)
+        def sincrona(**kwargs):
+            try:
+                return fn(**kwargs)
+            finally:
+                metricas.marcar_fin_endpoint()
+        return sincrona
+    sig = inspect.signature(fn)
+    params = []
+    for p in sig.parameters.values():
+        dep = getattr(p.default, "dependency", None)
+        if dep is get_db:
+            p = p.replace(default=Depends(get_db_async), annotation=AsyncSession)
+        elif dep is usuario_actual:
+            p = p.replace(default=Depends(usuario_actual_async))
+        params.append(p)
+
+    @functools.wraps(fn)
+    async def envoltura(**kwargs):
+        db = kwargs.get("db")
+        try:
+            if db is None:
+                return await run_in_threadpool(fn, **kwargs)
+            return await db.run_sync(lambda s: fn(**{**kwargs, "db": s}))
+        finally:
+            metricas.marcar_fin_endpoint()
+
+    envoltura.__signature__ = sig.replace(parameters=params)
+    return envoltura
 
 
 @app.on_event("startup")
 def startup_compat():
-    aplicar_migraciones_compatibilidad()
+    migraciones.migrar()
+    iniciar_chequeo_salud()
+    distribuidor.escuchar(CANAL_CATALOGO, catalogo.al_notificar)
+    distribuidor.escuchar(permisos.CANAL, permisos.al_notificar)
+    distribuidor.iniciar()
+    catalogo.cargar()
+    if GOOGLE_CLIENT_ID:
+        verificador.iniciar()
+
+@app.on_event("shutdown")
+def shutdown_claves():
+    claves.cerrar_pool()
+    detener_chequeo_salud()
+    verificador.detener()
 
 # CORS (para dev con Vite + cookies)
 origins = [
@@ -151,10 +130,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def instrumentar(request: Request, call_next):
+    m, token = metricas.abrir(request.scope)
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metricas.cerrar(token)
+    duracion = time.perf_counter() - t0
+    metricas.registro.observar(request.method, m.ruta, response.status_code, m, duracion)
+    response.headers["Server-Timing"] = metricas.server_timing(m, duracion)
+    return response
+
 @app.get("/api/listas/health")
 def health():
     return {"ok": True}
 
+def requiere_diagnostico(request: Request):
+    token = request.headers.get("x-diag-token") or ""
+    if not DIAG_TOKEN or not secrets.compare_digest(token.encode(), DIAG_TOKEN.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/api/listas/diagnostico/pool", dependencies=[Depends(requiere_diagnostico)])
+def diagnostico_pool():
+    return diagnostico()
+
+@app.get("/api/listas/diagnostico/metricas", dependencies=[Depends(requiere_diagnostico)])
+def diagnostico_metricas():
+    return PlainTextResponse(metricas.registro.prometheus(), media_type="text/plain; version=0.0.4")
+
 # ---------------- AUTH ----------------
 @app.post("/api/listas/auth/registro", response_model=UsuarioOut)
 def registro(payload: RegistroIn, response: Response, db: Session = Depends(get_db)):
@@ -166,7 +171,7 @@ def registro(payload: RegistroIn, response: Response, db: Session = Depends(get_
     db.add(u)
     db.flush()
 
-    token = crear_token(str(u.id))
+    token = crear_token(str(u.id), u.correo, u.nombre, u.foto)
     set_cookie(response, token)
     db.commit()
     return UsuarioOut(id=u.id, correo=u.correo, nombre=u.nombre, foto=u.foto)
@@ -175,10 +180,17 @@ def registro(payload: RegistroIn, response: Response, db: Session = Depends(get_
 def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
     correo = payload.correo.lower().strip()
     u = db.query(Usuario).filter(Usuario.correo == correo).first()
-    if not u or not u.password or not verify_password(payload.password, u.password):
+    if not u or not u.password:
+        raise HTTPException(status_code=400, detail="Credenciales inválidas")
+    ok, nuevo_hash = verificar_y_actualizar(payload.password, u.password)
+    if not ok:
         raise HTTPException(status_code=400, detail="Credenciales inválidas")
+    if nuevo_hash:
+        # el costo de bcrypt cambió: se rehace el hash de forma transparente
+        u.password = nuevo_hash
+        db.commit()
 
-    token = crear_token(str(u.id))
+    token = crear_token(str(u.id), u.correo, u.nombre, u.foto)
     set_cookie(response, token)
     return UsuarioOut(id=u.id, correo=u.correo, nombre=u.nombre, foto=u.foto)
 
@@ -188,13 +200,12 @@ def login_google(payload: GoogleIn, response: Response, db: Session = Depends(ge
         raise HTTPException(status_code=500, detail="GOOGLE_CLIENT_ID no configurado")
 
     try:
-        info = google_id_token.verify_oauth2_token(
-            payload.id_token,
-            google_requests.Request(),
-            GOOGLE_CLIENT_ID
-        )
-    except Exception:
+        # firma verificada en el proceso con los certificados en caché
+        info = verificador.verificar(payload.id_token, GOOGLE_CLIENT_ID)
+    except TokenInvalido:
         raise HTTPException(status_code=400, detail="Token de Google inválido")
+    except CertificadosNoDisponibles:
+        raise HTTPException(status_code=503, detail="No se pudo contactar a Google; intente de nuevo")
 
     sub = info.get("sub")
     email = (info.get("email") or "").lower().strip()
@@ -224,11 +235,14 @@ def login_google(payload: GoogleIn, response: Response, db: Session = Depends(ge
     # refresca perfil
     if name and not u.nombre:
         u.nombre = name
+        # aparece en "tocado_por" de las listas donde ya editó
+        crud.nombre_usuario_cambiado(db, u.id)
     if picture and not u.foto:
         u.foto = picture
 
     db.commit()
-    token = crear_token(str(u.id))
+    invalidar_usuario(u.id)
+    token = crear_token(str(u.id), u.correo, u.nombre, u.foto)
     set_cookie(response, token)
     return UsuarioOut(id=u.id, correo=u.correo, nombre=u.nombre, foto=u.foto)
 
@@ -238,152 +252,363 @@ def logout(response: Response):
     return {"ok": True}
 
 @app.get("/api/listas/me", response_model=UsuarioOut)
-def me(u: Usuario = Depends(usuario_actual)):
+@ruta
+def me(u: UsuarioActual = Depends(usuario_actual)):
     return UsuarioOut(id=u.id, correo=u.correo, nombre=u.nombre, foto=u.foto)
 
+# ---------------- ETAGS ----------------
+def _etag(*partes) -> str:
+    return '"' + hashlib.sha1(repr(partes).encode("utf-8")).hexdigest() + '"'
+
+def _coincide_etag(request: Request, etag: str) -> bool:
+    valor = request.headers.get("if-none-match")
+    if not valor:
+        return False
+    candidatos = [x.strip().removeprefix("W/") for x in valor.split(",")]
+    return "*" in candidatos or etag in candidatos
+
+def _no_modificado(etag: str, cache: str = "private, no-cache") -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache})
+
+def _version_if_match(request: Request) -> int | None:
+    # ETag de un item = '"<version>"'; sin If-Match (o "*") no se comprueba
+    valor = (request.headers.get("if-match") or "").strip()
+    if not valor or valor == "*":
+        return None
+    try:
+        return int(valor.removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match inválido")
+
 # ---------------- PRODUCTOS (autocomplete) ----------------
 @app.get("/api/listas/productos", response_model=list[ProductoOut])
-def productos(q: str = "", db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def productos(request: Request, response: Response, q: str = "", db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     rows = crud.buscar_productos(db, q, 12)
+    etag = _etag("productos", q, rows)
+    if _coincide_etag(request, etag):
+        return _no_modificado(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
     return [
         ProductoOut(
-            id=p.id,
-            nombre=p.nombre,
+            id=pid,
+            nombre=nombre,
             precio_ultimo=precio,
             unidad_id_ultima=uid,
             unidad_ultima=unom,
         )
-        for p, precio, uid, unom in rows
+        for pid, nombre, precio, uid, unom in rows
     ]
 
+@app.get("/api/listas/productos/{producto_id}/precios", response_model=SeriePreciosOut)
+@ruta
+def precios_producto(
+    producto_id: int,
+    periodo: Literal["dia", "semana"] = "semana",
+    desde: date | None = None,
+    db: Session = Depends(get_db),
+    u: UsuarioActual = Depends(usuario_actual),
+):
+    """Serie de precios desde los resúmenes (por defecto 90 días o 52 semanas)."""
+    if desde is None:
+        desde = date.today() - timedelta(days=90 if periodo == "dia" else 52 * 7)
+    rows = crud.serie_precios(db, producto_id, periodo, desde)
+    return RespuestaJSON({
+        "producto_id": producto_id, "periodo": periodo,
+        "puntos": [
+            {"inicio": inicio, "n": n, "minimo": int(mn), "mediana": int(md), "maximo": int(mx), "ultimo": int(ul)}
+            for inicio, n, mn, md, mx, ul in rows
+        ],
+    })
+
 @app.get("/api/listas/unidades", response_model=list[UnidadOut])
-def unidades(q: str = "", db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
-    qn = a_mayusculas(q or "")
-    query = db.query(Unidad)
-    if qn:
-        query = query.filter(Unidad.nombre.ilike(f"%{qn}%"))
-    rows = query.order_by(Unidad.nombre.asc()).limit(20).all()
-    return [UnidadOut(id=x.id, nombre=x.nombre) for x in rows]
+@ruta
+def unidades(request: Request, q: str = "", u: UsuarioActual = Depends(usuario_actual)):
+    # catálogo casi estático (bd/01_semillas.sql): en memoria y caché larga en el navegador
+    cache = f"private, max-age={UNIDADES_MAX_AGE}"
+    etag = _etag("unidades", q, catalogo.unidades_firma())
+    if _coincide_etag(request, etag):
+        return _no_modificado(etag, cache)
+    rows = catalogo.unidades(a_mayusculas(q or ""))
+    return RespuestaJSON([{"id": uid, "nombre": nombre} for uid, nombre in rows],
+                         headers={"ETag": etag, "Cache-Control": cache})
 
 # ---------------- LISTAS ----------------
 @app.get("/api/listas/listas", response_model=list[ListaOut])
-def listas(db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
-    data = crud.listar_listas(db, u.id)
-    out = []
-    for l, es_dueno, rol, tr, tc, tp in data:
-        out.append(ListaOut(
-            id=l.id, nombre=l.nombre, foto=l.foto,
-            es_dueno=es_dueno, rol=rol,
-            total_refs=tr, total_comprado=tc, total_pendiente=tp
-        ))
-    return out
+@ruta
+def listas(
+    request: Request,
+    after: UUID | None = None,
+    limit: int | None = Query(default=None, ge=1, le=200),
+    db: Session = Depends(get_db),
+    u: UsuarioActual = Depends(usuario_actual),
+):
+    etag = _etag("listas", u.id, after, limit, crud.firma_listas(db, u.id))
+    if _coincide_etag(request, etag):
+        return _no_modificado(etag)
+    try:
+        data = crud.listar_listas(db, u.id, after, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor `after` inválido: la lista ya no existe")
+    out = [
+        {
+            "id": l.id, "nombre": l.nombre, "foto": l.foto,
+            "es_dueno": es_dueno, "rol": rol,
+            "total_refs": tr, "total_comprado": tc, "total_pendiente": tp,
+        }
+        for l, es_dueno, rol, tr, tc, tp in data
+    ]
+    return RespuestaJSON(out, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 @app.post("/api/listas/listas", response_model=ListaOut)
-def crear_lista(payload: ListaCrearIn, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def crear_lista(payload: ListaCrearIn, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     nombre = payload.nombre.strip()
     if not nombre:
         raise HTTPException(status_code=400, detail="Nombre requerido")
     l = crud.crear_lista(db, u.id, nombre, payload.foto)
     db.commit()
-    tr, tc, tp = crud.resumen_lista(db, l.id)
     return ListaOut(id=l.id, nombre=l.nombre, foto=l.foto, es_dueno=True, rol="dueno",
-                   total_refs=tr, total_comprado=tc, total_pendiente=tp)
+                   total_refs=0, total_comprado=0, total_pendiente=0)
+
+def _item_out(it, pnom, unom, tocados: dict) -> dict:
+    # ya con los tipos de ItemOut: se responde sin revalidar (respuestas.py)
+    return {
+        "id": it.id,
+        "producto_id": it.producto_id,
+        "producto": pnom,
+        "unidad_id": it.unidad_id,
+        "unidad": unom,
+        "cantidad": it.cantidad,
+        "precio": int(it.precio),
+        "comprado": it.comprado,
+        "tocado_por": tocados.get(it.id, []),
+        "version": int(it.version),
+    }
 
 @app.get("/api/listas/listas/{lista_id}", response_model=ListaDetalleOut)
-def detalle(lista_id, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def detalle(lista_id, request: Request, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     try:
-        rol = crud.requiere_acceso(db, lista_id, u.id)
+        l, rol = crud.version_lista(db, lista_id, u.id)
     except ValueError:
         raise HTTPException(status_code=403, detail="Sin acceso")
+    # la versión cambia con cada escritura de items (y cuando cambia el nombre
+    # de alguien en "tocado_por", ver crud.nombre_usuario_cambiado): 304 sin
+    # cargar items
+    etag = _etag("detalle", l.id, l.version, rol)
+    if _coincide_etag(request, etag):
+        return _no_modificado(etag)
 
-    l = db.query(Lista).filter(Lista.id == lista_id).first()
-    if not l:
-        raise HTTPException(status_code=404, detail="Lista no existe")
+    l, rol, items, tocados, (tr, tc, tp) = crud.detalle_lista(db, lista_id, u.id, precargada=(l, rol))
 
-    # items + joins básicos
-    items = db.query(ListaItem, Producto.nombre, Unidad.nombre)\
-        .join(Producto, Producto.id == ListaItem.producto_id)\
-        .outerjoin(Unidad, Unidad.id == ListaItem.unidad_id)\
-        .filter(ListaItem.lista_id == lista_id)\
-        .order_by(Producto.nombre.asc())\
-        .all()
-
-    out_items = []
-    for it, pnom, unom in items:
-        tocados = crud.item_tocados(db, it.id)
-        out_items.append({
-            "id": it.id,
-            "producto_id": it.producto_id,
-            "producto": pnom,
-            "unidad_id": it.unidad_id,
-            "unidad": unom,
-            "cantidad": it.cantidad,
-            "precio": int(it.precio),
-            "comprado": it.comprado,
-            "tocado_por": tocados,
-        })
+    out_items = [_item_out(it, pnom, unom, tocados) for it, pnom, unom in items]
 
-    tr, tc, tp = crud.resumen_lista(db, lista_id)
-    es_dueno = (l.usuario_id == u.id)
-    rol_out = "dueno" if es_dueno else rol
-    return {
+    return RespuestaJSON({
         "id": l.id, "nombre": l.nombre, "foto": l.foto,
-        "es_dueno": es_dueno, "rol": rol_out,
+        "es_dueno": rol == "dueno", "rol": rol,
         "items": out_items,
-        "total_refs": tr, "total_comprado": tc, "total_pendiente": tp
-    }
+        "total_refs": tr, "total_comprado": tc, "total_pendiente": tp,
+        "cursor": int(l.version),
+    }, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@app.get("/api/listas/listas/{lista_id}/cambios", response_model=CambiosOut)
+@ruta
+def cambios(lista_id: UUID, desde: int = Query(default=0, ge=0), db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    """Sincronización incremental: solo lo que cambió después del cursor `desde`."""
+    try:
+        res = crud.cambios_lista(db, lista_id, u.id, desde)
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Sin acceso")
+    if res is None:
+        return {"id": lista_id, "cursor": desde, "borrada": True}
+
+    l, rol, completo, items, tocados, borrados = res
+    return RespuestaJSON({
+        "id": l.id, "cursor": int(l.version), "completo": completo,
+        "items": [_item_out(it, pnom, unom, tocados) for it, pnom, unom in items],
+        "borrados": borrados,
+        "total_refs": int(l.total_refs), "total_comprado": int(l.total_comprado),
+        "total_pendiente": int(l.total_pendiente),
+        "borrada": False,
+    })
+
+@app.get("/api/listas/listas/{lista_id}/eventos")
+@ruta
+def eventos_lista(lista_id, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    """
+    Server-Sent Events con los cambios de la lista (deltas por item).
+    El acceso se valida al abrir; la sesión de BD no se mantiene durante el stream.
+    """
+    try:
+        crud.requiere_acceso(db, lista_id, u.id)
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Sin acceso")
+
+    async def stream():
+        sub = distribuidor.suscribir(lista_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.cola.get(), timeout=EVENTOS_PING_SEG)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {ev['tipo']}\ndata: {json.dumps(ev)}\n\n"
+                if ev["tipo"] == "lista_borrada":
+                    break
+        finally:
+            distribuidor.desuscribir(lista_id, sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.delete("/api/listas/listas/{lista_id}")
-def eliminar_lista(lista_id, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def eliminar_lista(lista_id, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     if not crud.es_dueno(db, lista_id, u.id):
         raise HTTPException(status_code=403, detail="Solo el dueño puede eliminar la lista")
     crud.borrar_lista(db, lista_id)
     db.commit()
     return {"ok": True}
 
+@app.get("/api/listas/listas/{lista_id}/costo", response_model=CostoEstimadoOut)
+@ruta
+def costo_lista(lista_id: UUID, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    """Costo estimado de la lista con la mediana semanal más reciente de cada producto."""
+    try:
+        rows = crud.costo_estimado(db, lista_id, u.id)
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Sin acceso")
+    items, total, minimo, maximo, sin_historial = [], Decimal(0), Decimal(0), Decimal(0), 0
+    for iid, pid, nombre, cantidad, precio, comprado, mediana, mn, mx, semana in rows:
+        precio = int(precio)
+        if semana is None:
+            sin_historial += 1
+        estimado = int(mediana) if mediana is not None else precio
+        total += cantidad * estimado
+        minimo += cantidad * (int(mn) if mn is not None else precio)
+        maximo += cantidad * (int(mx) if mx is not None else precio)
+        items.append({
+            "id": iid, "producto_id": pid, "producto": nombre, "cantidad": cantidad,
+            "precio": precio, "comprado": comprado, "precio_estimado": estimado,
+            "minimo": None if mn is None else int(mn), "maximo": None if mx is None else int(mx),
+            "semana": semana,
+        })
+    return RespuestaJSON({
+        "lista_id": lista_id,
+        "total_estimado": int(total), "total_minimo": int(minimo), "total_maximo": int(maximo),
+        "sin_historial": sin_historial,
+        "items": items,
+    })
+
 # ---------------- ITEMS ----------------
 @app.post("/api/listas/listas/{lista_id}/items")
-def crear_item(lista_id, payload: ItemCrearIn, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def crear_item(lista_id, payload: ItemCrearIn, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     if not crud.puede_editar(db, lista_id, u.id):
         raise HTTPException(status_code=403, detail="Sin permiso para editar")
 
     prod = a_mayusculas(payload.producto)
     try:
-        it, p = crud.agregar_item(db, lista_id, u.id, prod, payload.cantidad, payload.unidad_id, payload.precio)
+        it = crud.agregar_item(db, lista_id, u.id, prod, payload.cantidad, payload.unidad_id, payload.precio)
     except ValueError as e:
         if str(e) == "ITEM_DUPLICADO":
             raise HTTPException(status_code=400, detail="Ese producto ya está en la lista")
         raise
 
     db.commit()
-    return {"ok": True, "item_id": str(it.id)}
+    return {"ok": True, "item_id": str(it.id), "version": int(it.version)}
+
+@app.post("/api/listas/listas/{lista_id}/items:batch", response_model=ItemsLoteOut)
+@ruta
+def crear_items_lote(lista_id, payload: ItemsLoteIn, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    if not crud.puede_editar(db, lista_id, u.id):
+        raise HTTPException(status_code=403, detail="Sin permiso para editar")
+
+    items = [x.model_dump() for x in payload.items]
+    if payload.texto:
+        items += crud.items_desde_texto(payload.texto)
+    if len(items) > 500:
+        raise HTTPException(status_code=400, detail="Máximo 500 productos por lote")
+    try:
+        agregados, duplicados = crud.agregar_items_lote(db, lista_id, u.id, items)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Lista no existe")
+    db.commit()
+    return ItemsLoteOut(
+        agregados=[ItemLoteOut(id=iid, producto=nombre) for iid, nombre in agregados],
+        duplicados=duplicados,
+    )
+
+@app.patch("/api/listas/listas/{lista_id}/items:batch")
+@ruta
+def editar_items_lote(lista_id, payload: ItemsLotePatchIn, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    """Marcar todo como comprado (`comprado=true`) o limpiar comprados (`comprado=false`)."""
+    if not crud.puede_editar(db, lista_id, u.id):
+        raise HTTPException(status_code=403, detail="Sin permiso para editar")
+    try:
+        n = crud.marcar_items_lote(db, lista_id, u.id, payload.comprado, payload.item_ids)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Lista no existe")
+    db.commit()
+    return {"ok": True, "actualizados": n}
 
 @app.patch("/api/listas/listas/{lista_id}/items/{item_id}")
-def editar_item(lista_id, item_id, payload: ItemPatchIn, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def editar_item(lista_id, item_id, payload: ItemPatchIn, request: Request, response: Response,
+                db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     if not crud.puede_editar(db, lista_id, u.id):
         raise HTTPException(status_code=403, detail="Sin permiso para editar")
 
     patch = payload.model_dump(exclude_unset=True)
     try:
-        crud.patch_item(db, lista_id, item_id, u.id, patch)
-    except ValueError:
+        it = crud.patch_item(db, lista_id, item_id, u.id, patch, version=_version_if_match(request))
+    except ValueError as e:
+        if str(e) == "CONFLICTO":
+            raise HTTPException(status_code=409, detail="El item cambió; recargue la lista")
         raise HTTPException(status_code=404, detail="Item no existe")
     db.commit()
-    return {"ok": True}
+    response.headers["ETag"] = f'"{it.version}"'
+    return {"ok": True, "version": int(it.version)}
 
 @app.delete("/api/listas/listas/{lista_id}/items/{item_id}")
-def borrar_item(lista_id, item_id, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def borrar_item(lista_id, item_id, request: Request, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     # dueño o editor pueden borrar items
     rol = crud.rol_en_lista(db, lista_id, u.id)
     if rol not in ("dueno", "editor"):
         raise HTTPException(status_code=403, detail="Sin permiso")
-    crud.borrar_item(db, lista_id, item_id)
+    try:
+        crud.borrar_item(db, lista_id, item_id, version=_version_if_match(request))
+    except ValueError:
+        raise HTTPException(status_code=409, detail="El item cambió; recargue la lista")
     db.commit()
     return {"ok": True}
 
+@app.post("/api/listas/listas/{lista_id}/sync", response_model=SyncOut)
+@ruta
+def sync(lista_id: UUID, payload: SyncIn, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
+    """Aplica en orden las mutaciones encoladas offline (idempotente por `id`)."""
+    if not crud.puede_editar(db, lista_id, u.id):
+        raise HTTPException(status_code=403, detail="Sin permiso para editar")
+    resultados = crud.aplicar_sync(db, lista_id, u.id, [op.model_dump() for op in payload.ops])
+    db.commit()
+    l, _ = crud.version_lista(db, lista_id, u.id)
+    return SyncOut(
+        resultados=resultados, cursor=int(l.version),
+        total_refs=int(l.total_refs), total_comprado=int(l.total_comprado), total_pendiente=int(l.total_pendiente),
+    )
+
 # ---------------- COMPARTIR ----------------
 @app.post("/api/listas/listas/{lista_id}/compartir/link", response_model=LinkOut)
-def crear_link(lista_id, rol: str = Query(default="editor"), db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def crear_link(lista_id, rol: str = Query(default="editor"), db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     if not crud.puede_editar(db, lista_id, u.id):
         raise HTTPException(status_code=403, detail="Sin permiso")
     rol = (rol or "editor").lower()
@@ -396,7 +621,8 @@ def crear_link(lista_id, rol: str = Query(default="editor"), db: Session = Depen
     return LinkOut(url=url, token=lk.token)
 
 @app.post("/api/listas/aceptar/{token}")
-def aceptar(token: str, db: Session = Depends(get_db), u: Usuario = Depends(usuario_actual)):
+@ruta
+def aceptar(token: str, db: Session = Depends(get_db), u: UsuarioActual = Depends(usuario_actual)):
     try:
         lista_id, rol = crud.aceptar_link(db, token, u.id)
     except ValueError:
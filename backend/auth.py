@@ -1,22 +1,19 @@
 import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import HTTPException, Request, Response, Depends
 from sqlalchemy.orm import Session
-from db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db, get_db_async
+from metricas import medir_auth
+import claves
 from modelos import Usuario
-import hashlib
-
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def _bcrypt_input(password: str) -> str:
-    b = password.encode("utf-8")
-    if len(b) > 72:
-        # Pre-hash estable (no truncar)
-        return hashlib.sha256(b).hexdigest()  # 64 chars ascii
-    return password
+from uuid import UUID
 
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME")
 JWT_EXP_MIN = int(os.getenv("JWT_EXP_MIN", "43200"))  # 30 días
@@ -24,17 +21,89 @@ COOKIE_NAME = os.getenv("COOKIE_NAME", "listas_token")
 COOKIE_SECURE = os.getenv("COOKIE_SECURE", "0") == "1"  # prod=1
 COOKIE_SAMESITE = os.getenv("COOKIE_SAMESITE", "lax")   # lax funciona bien
 COOKIE_DOMAIN = os.getenv("COOKIE_DOMAIN")              # opcional (deja vacío en dev)
+# Perfil (correo/nombre/foto) dentro del token: usuario_actual no consulta la BD.
+# Un usuario borrado sigue autenticado hasta que el token expire.
+JWT_CLAIMS_PERFIL = os.getenv("JWT_CLAIMS_PERFIL", "0") == "1"
+USUARIO_CACHE_TTL = float(os.getenv("USUARIO_CACHE_TTL", "60"))  # segundos, 0 = desactivado
+USUARIO_CACHE_MAX = int(os.getenv("USUARIO_CACHE_MAX", "10000"))
+
+@dataclass(frozen=True)
+class UsuarioActual:
+    """Datos del usuario autenticado (no ligados a una sesión de BD)."""
+    id: UUID
+    correo: str
+    nombre: str | None = None
+    foto: str | None = None
+
+class _CacheUsuarios:
+    # LRU con TTL por proceso, clave = `sub` del token
+    def __init__(self, ttl: float, maximo: int):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, uid: str) -> UsuarioActual | None:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entrada = self._datos.get(uid)
+            if not entrada:
+                return None
+            expira, usr = entrada
+            if expira <= time.monotonic():
+                del self._datos[uid]
+                return None
+            self._datos.move_to_end(uid)
+            return usr
+
+    def guardar(self, uid: str, usr: UsuarioActual):
+        if self.ttl <= 0 or self.maximo <= 0:
+            return
+        with self._lock:
+            self._datos[uid] = (time.monotonic() + self.ttl, usr)
+            self._datos.move_to_end(uid)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, uid: str):
+        with self._lock:
+            self._datos.pop(uid, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+cache_usuarios = _CacheUsuarios(USUARIO_CACHE_TTL, USUARIO_CACHE_MAX)
+
+def invalidar_usuario(usuario_id):
+    cache_usuarios.invalidar(str(usuario_id))
+
+def _pool_saturado() -> HTTPException:
+    return HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo", headers={"Retry-After": "1"})
 
 def hash_password(p: str) -> str:
-    return pwd.hash(_bcrypt_input(p))
+    try:
+        return claves.hash_password(p)
+    except claves.PoolSaturado:
+        raise _pool_saturado()
 
 def verify_password(p: str, hashed: str) -> bool:
-    return pwd.verify(_bcrypt_input(p), hashed)
+    return verificar_y_actualizar(p, hashed)[0]
+
+def verificar_y_actualizar(p: str, hashed: str) -> tuple[bool, str | None]:
+    # devuelve también el hash nuevo si BCRYPT_ROUNDS cambió desde que se guardó
+    try:
+        return claves.verificar_password(p, hashed)
+    except claves.PoolSaturado:
+        raise _pool_saturado()
 
-def crear_token(usuario_id) -> str:
+def crear_token(usuario_id, correo: str | None = None, nombre: str | None = None, foto: str | None = None) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(minutes=JWT_EXP_MIN)
     payload = {"sub": str(usuario_id), "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
+    if JWT_CLAIMS_PERFIL and correo:
+        payload.update({"correo": correo, "nombre": nombre, "foto": foto})
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 def set_cookie(resp: Response, token: str):
@@ -55,7 +124,8 @@ def clear_cookie(resp: Response):
 def leer_token(request: Request) -> str | None:
     return request.cookies.get(COOKIE_NAME)
 
-def usuario_actual(request: Request, db: Session = Depends(get_db)) -> Usuario:
+def _leer_claims(request: Request) -> tuple[str, UsuarioActual | None]:
+    # (sub, usuario si el token trae el perfil o está en caché)
     token = leer_token(request)
     if not token:
         raise HTTPException(status_code=401, detail="No autenticado")
@@ -64,17 +134,42 @@ def usuario_actual(request: Request, db: Session = Depends(get_db)) -> Usuario:
         uid = data.get("sub")
         if not uid:
             raise HTTPException(status_code=401, detail="Token inválido")
-    except JWTError:
+        if JWT_CLAIMS_PERFIL and data.get("correo"):
+            return uid, UsuarioActual(id=UUID(uid), correo=data["correo"], nombre=data.get("nombre"), foto=data.get("foto"))
+    except (JWTError, ValueError):
         raise HTTPException(status_code=401, detail="Token inválido")
+    return uid, cache_usuarios.obtener(uid)
 
-    usr = db.query(Usuario).filter(Usuario.id == uid).first()
-    if not usr:
+def _cargar_usuario(db: Session, uid: str) -> UsuarioActual:
+    row = db.query(Usuario).filter(Usuario.id == uid).first()
+    if not row:
         raise HTTPException(status_code=401, detail="Usuario no existe")
+    usr = UsuarioActual(id=row.id, correo=row.correo, nombre=row.nombre, foto=row.foto)
+    cache_usuarios.guardar(uid, usr)
     return usr
 
+def usuario_actual(request: Request, db: Session = Depends(get_db)) -> UsuarioActual:
+    with medir_auth():
+        uid, usr = _leer_claims(request)
+        return usr or _cargar_usuario(db, uid)
+
+async def usuario_actual_async(request: Request, db: AsyncSession = Depends(get_db_async)) -> UsuarioActual:
+    with medir_auth():
+        uid, usr = _leer_claims(request)
+        return usr or await db.run_sync(_cargar_usuario, uid)
+
 def a_mayusculas(valor: str) -> str:
     return " ".join((valor or "").strip().upper().split())
 
+# Misma tabla que usa la columna generada `producto.nombre_norm` (translate en SQL)
+_CON_TILDE = "ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÇ"
+_SIN_TILDE = "AAAAAEEEEIIIIOOOOOUUUUC"
+_TABLA_TILDES = str.maketrans(_CON_TILDE, _SIN_TILDE)
+
+def normalizar_busqueda(valor: str) -> str:
+    # mayúsculas y sin tildes (la Ñ se conserva)
+    return a_mayusculas(valor).translate(_TABLA_TILDES)
+
 def token_compartir() -> str:
     t = secrets.token_urlsafe(32)
     return t[:80]
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""
+Recalcula `producto_unidad_ultima` (última unidad usada por producto)
+a partir de `lista_item`.
+
+Uso:
+    python backfill_unidades.py
+"""
+from db import SessionLocal
+import crud
+
+
+def main():
+    db = SessionLocal()
+    try:
+        n = crud.backfill_unidad_ultima(db)
+        db.commit()
+        print(f"{n} producto(s) con última unidad actualizada")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
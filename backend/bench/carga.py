@@ -0,0 +1,300 @@
+"""
+Generador de carga para /api/listas: mezclas realistas de uso contra la app
+FastAPI y reporte JSON por endpoint (p50/p95/p99, throughput, errores y
+consultas SQL por petición).
+
+Requiere DB_URL con el esquema creado. Desde backend/:
+    python -m bench.carga --sembrar --listas 10000 --items 100000
+    python -m bench.carga --mezcla realista --duracion 30 --concurrencia 16 --salida bench.json
+    python -m bench.carga --url http://localhost:8011   # contra un servidor ya levantado
+    python -m bench.carga --limpiar
+
+Sin --url la app se levanta en este proceso (uvicorn en un hilo), lo que
+permite contar las consultas SQL con eventos del engine. Ese conteo se hace
+en una fase de calibración serial (concurrencia 1) tras la fase de carga.
+Con --url se toma del header Server-Timing de cada respuesta.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from sqlalchemy import event
+
+from db import engine, async_engine
+from bench.datos import sembrar, limpiar, tamanos, id_sintetico
+import auth
+
+
+class Contador:
+    """Sentencias SQL ejecutadas por los engines de este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valor = 0
+
+    def __call__(self, *args):
+        with self._lock:
+            self.valor += 1
+
+    def instalar(self):
+        engines = [engine]
+        if async_engine is not None:
+            engines.append(async_engine.sync_engine)
+        for e in engines:
+            event.listen(e, "before_cursor_execute", self)
+
+
+_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.consultas = defaultdict(list)
+
+    def anotar(self, etiqueta: str, segundos: float, ok: bool, consultas: int | None):
+        with self._lock:
+            self.latencias[etiqueta].append(segundos)
+            if not ok:
+                self.errores[etiqueta] += 1
+            if consultas is not None:
+                self.consultas[etiqueta].append(consultas)
+
+
+class Cliente:
+    """Un usuario virtual: sesión HTTP con su cookie y sus listas sintéticas."""
+
+    def __init__(self, base: str, p: dict, n: int, registro: Registro, contador: Contador | None):
+        self.base = base.rstrip("/")
+        self.p = p
+        self.n = n
+        self.uid = id_sintetico("u", n)
+        self.registro = registro
+        self.contador = contador
+        self.http = requests.Session()
+        self.http.cookies.set(auth.COOKIE_NAME, auth.crear_token(self.uid))
+        self.listas = list(range(n, p["listas"], p["usuarios"]))
+
+    def pedir(self, etiqueta: str, metodo: str, ruta: str, **kw):
+        q0 = self.contador.valor if self.contador else None
+        t0 = time.perf_counter()
+        try:
+            r = self.http.request(metodo, self.base + ruta, timeout=30, **kw)
+            ok = r.status_code < 400
+        except requests.RequestException:
+            r, ok = None, False
+        dt = time.perf_counter() - t0
+        if self.contador:
+            consultas = self.contador.valor - q0
+        else:
+            # servidor remoto: el conteo viene en Server-Timing (metricas.py)
+            m = _CONSULTAS.search(r.headers.get("Server-Timing", "")) if r is not None else None
+            consultas = int(m.group(1)) if m else None
+        self.registro.anotar(etiqueta, dt, ok, consultas)
+        return r
+
+    def lista(self):
+        g = random.choice(self.listas)
+        return g, id_sintetico("l", g)
+
+    def items(self, g: int) -> list:
+        return [id_sintetico("i", i) for i in range(g, self.p["items"], self.p["listas"])]
+
+
+# ---------------- acciones ----------------
+def hogar(c: Cliente):
+    c.pedir("GET /listas", "GET", "/api/listas/listas")
+
+def detalle(c: Cliente):
+    _, lid = c.lista()
+    c.pedir("GET /listas/{id}", "GET", f"/api/listas/listas/{lid}")
+
+def autocompletar(c: Cliente):
+    # una petición por tecla a partir del segundo carácter
+    nombre = f"BENCH {random.randrange(c.p['productos']):06d}"
+    for i in range(2, len(nombre) + 1):
+        c.pedir("GET /productos", "GET", "/api/listas/productos", params={"q": nombre[:i]})
+
+def marcar(c: Cliente):
+    # ráfaga de "comprado" sobre varios items de la misma lista
+    g, lid = c.lista()
+    items = c.items(g)
+    for item_id in random.sample(items, min(len(items), 5)):
+        c.pedir("PATCH /listas/{id}/items/{item}", "PATCH", f"/api/listas/listas/{lid}/items/{item_id}",
+                json={"comprado": random.random() < 0.5})
+
+def compartir(c: Cliente, clientes: list):
+    _, lid = c.lista()
+    r = c.pedir("POST /listas/{id}/compartir/link", "POST", f"/api/listas/listas/{lid}/compartir/link",
+                params={"rol": "editor"})
+    if r is None or r.status_code >= 400:
+        return
+    otro = random.choice(clientes)
+    otro.pedir("POST /aceptar/{token}", "POST", f"/api/listas/aceptar/{r.json()['token']}")
+
+
+MEZCLAS = {
+    "realista": {hogar: 25, detalle: 35, autocompletar: 15, marcar: 20, compartir: 5},
+    "lectura": {hogar: 40, detalle: 60},
+    "autocompletar": {autocompletar: 100},
+    "marcar": {marcar: 100},
+    "compartir": {compartir: 100},
+}
+
+
+def _ejecutar(accion, c: Cliente, clientes: list):
+    if accion is compartir:
+        accion(c, clientes)
+    else:
+        accion(c)
+
+
+def correr(clientes: list, mezcla: dict, concurrencia: int, duracion: float) -> float:
+    acciones, pesos = list(mezcla), list(mezcla.values())
+    fin = time.perf_counter() + duracion
+
+    def trabajador(k: int):
+        rnd = random.Random(k)
+        while time.perf_counter() < fin:
+            c = clientes[rnd.randrange(len(clientes))]
+            _ejecutar(rnd.choices(acciones, pesos)[0], c, clientes)
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(k,), daemon=True) for k in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return time.perf_counter() - t0
+
+
+def _percentil(valores: list, p: float) -> float:
+    orden = sorted(valores)
+    # rango más cercano
+    return orden[max(0, math.ceil(p / 100 * len(orden)) - 1)]
+
+
+def resumen(registro: Registro, segundos: float, calibracion: Registro | None) -> dict:
+    out = {}
+    for etiqueta, lat in sorted(registro.latencias.items()):
+        consultas = (calibracion or registro).consultas.get(etiqueta)
+        out[etiqueta] = {
+            "n": len(lat),
+            "errores": registro.errores.get(etiqueta, 0),
+            "rps": round(len(lat) / segundos, 2),
+            "p50_ms": round(_percentil(lat, 50) * 1000, 2),
+            "p95_ms": round(_percentil(lat, 95) * 1000, 2),
+            "p99_ms": round(_percentil(lat, 99) * 1000, 2),
+            "consultas_por_req": round(sum(consultas) / len(consultas), 2) if consultas else None,
+        }
+    return out
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_app():
+    """uvicorn en un hilo de este proceso; devuelve (url, server)."""
+    import uvicorn
+    from app import app
+
+    puerto = _puerto_libre()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{puerto}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga sintética y benchmark de /api/listas")
+    parser.add_argument("--sembrar", action="store_true", help="(re)crea el conjunto sintético y termina")
+    parser.add_argument("--limpiar", action="store_true", help="borra el conjunto sintético y termina")
+    parser.add_argument("--listas", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--usuarios", type=int, default=None)
+    parser.add_argument("--productos", type=int, default=20_000)
+    parser.add_argument("--observaciones", type=int, default=None, help="historial de precios (por defecto = items)")
+    parser.add_argument("--url", default="", help="servidor ya levantado (consultas vía Server-Timing)")
+    parser.add_argument("--mezcla", choices=sorted(MEZCLAS), default="realista")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--duracion", type=float, default=20.0, help="segundos de la fase de carga")
+    parser.add_argument("--calibrar", type=float, default=5.0, help="segundos de la fase serial (0 = sin conteo)")
+    parser.add_argument("--clientes", type=int, default=200, help="usuarios virtuales distintos")
+    parser.add_argument("--salida", default="", help="archivo JSON (por defecto stdout)")
+    args = parser.parse_args()
+
+    if args.sembrar or args.limpiar:
+        with engine.begin() as conn:
+            limpiar(conn)
+            if args.sembrar:
+                p = sembrar(conn, listas=args.listas, items=args.items, usuarios=args.usuarios, productos=args.productos,
+                            observaciones=args.observaciones)
+                print(f"sembrado: {p}")
+        return
+
+    with engine.connect() as conn:
+        p = tamanos(conn)
+    if not p:
+        raise SystemExit("No hay datos sintéticos: ejecute primero con --sembrar")
+
+    contador, server = None, None
+    if args.url:
+        base = args.url
+    else:
+        base, server = levantar_app()
+        contador = Contador()
+        contador.instalar()
+
+    try:
+        registro = Registro()
+        n = min(args.clientes, p["usuarios"])
+        clientes = [Cliente(base, p, k, registro, None) for k in random.sample(range(p["usuarios"]), n)]
+        mezcla = MEZCLAS[args.mezcla]
+        segundos = correr(clientes, mezcla, args.concurrencia, args.duracion)
+
+        calibracion = None
+        if contador and args.calibrar > 0:
+            calibracion = Registro()
+            for c in clientes:
+                c.registro, c.contador = calibracion, contador
+            correr(clientes, mezcla, 1, args.calibrar)
+    finally:
+        if server:
+            server.should_exit = True
+
+    total = sum(len(v) for v in registro.latencias.values())
+    informe = {
+        "mezcla": args.mezcla,
+        "concurrencia": args.concurrencia,
+        "duracion_s": round(segundos, 2),
+        "datos": p,
+        "total": {
+            "n": total,
+            "errores": sum(registro.errores.values()),
+            "rps": round(total / segundos, 2),
+        },
+        "endpoints": resumen(registro, segundos, calibracion),
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
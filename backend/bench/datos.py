@@ -0,0 +1,174 @@
+"""
+Datos sintéticos para los benchmarks y el arnés de planes.
+
+Todo se genera en el servidor con generate_series dentro de la transacción
+de la conexión recibida: quien llama decide si hace commit o rollback. Los
+ids son deterministas (md5 del prefijo y el índice) para poder elegir
+usuarios, listas e items de muestra sin consultarlos:
+
+    usuario g -> md5('u' || g)    dueño de las listas g, g+usuarios, ...
+    lista g   -> md5('l' || g)
+    item g    -> md5('i' || g)    en la lista g % listas
+
+El historial de precios (`observaciones`, repartidas en el último año) se
+resume con una agregación equivalente a crud.registrar_historial_precios.
+"""
+import uuid
+import hashlib
+
+from sqlalchemy import text
+
+
+def id_sintetico(prefijo: str, n: int) -> uuid.UUID:
+    return uuid.UUID(hashlib.md5(f"{prefijo}{n}".encode()).hexdigest())
+
+
+def sembrar(conn, listas: int = 100_000, items: int = 1_000_000, usuarios: int | None = None, productos: int = 20_000,
+            observaciones: int | None = None):
+    """Inserta el conjunto sintético y actualiza estadísticas. Devuelve los tamaños usados."""
+    usuarios = usuarios or max(1, listas // 10)
+    observaciones = items if observaciones is None else observaciones
+    if items > listas * productos:
+        raise ValueError("items no caben: (lista, producto) es único")
+    p = {"listas": listas, "items": items, "usuarios": usuarios, "productos": productos,
+         "observaciones": observaciones}
+
+    conn.execute(text("""
+INSERT INTO usuario (id, correo, nombre)
+SELECT md5('u' || g)::uuid, 'bench-u' || g || '@example.com', 'BENCH ' || g
+FROM generate_series(0, :usuarios - 1) g
+    """), p)
+
+    conn.execute(text("""
+INSERT INTO producto (nombre)
+SELECT 'BENCH ' || lpad(g::text, 6, '0')
+FROM generate_series(0, :productos - 1) g
+    """), p)
+    conn.execute(text("""
+CREATE TEMP TABLE bench_producto ON COMMIT DROP AS
+SELECT (row_number() OVER (ORDER BY id) - 1)::int AS n, id
+FROM producto
+WHERE nombre LIKE 'BENCH %'
+    """))
+    conn.execute(text("CREATE INDEX ON bench_producto(n)"))
+    conn.execute(text("""
+INSERT INTO producto_precio (producto_id, precio)
+SELECT id, 100 + n * 10 FROM bench_producto
+    """))
+    conn.execute(text("""
+INSERT INTO producto_unidad_ultima (producto_id, unidad_id)
+SELECT bp.id, u.id
+FROM bench_producto bp
+CROSS JOIN (SELECT MIN(id) AS id FROM unidad) u
+WHERE bp.n % 2 = 0 AND u.id IS NOT NULL
+    """))
+
+    conn.execute(text("""
+INSERT INTO producto_precio_historial (producto_id, precio, usuario_id, registrado_en)
+SELECT bp.id, 100 + bp.n * 10 + 50 * (g % 7), md5('u' || (g % :usuarios))::uuid,
+       NOW() - (g % 525600) * INTERVAL '1 minute'
+FROM generate_series(0, :observaciones - 1) g
+JOIN bench_producto bp ON bp.n = g % :productos
+    """), p)
+    conn.execute(text("""
+INSERT INTO producto_precio_resumen
+  (producto_id, periodo, inicio, n, minimo, maximo, mediana, ultimo, ultimo_en, conteos)
+SELECT producto_id, periodo, inicio, SUM(c)::int, MIN(precio), MAX(precio),
+       precio_conteos_mediana(jsonb_object_agg(precio::text, c)),
+       (array_agg(precio ORDER BY ultimo_en DESC))[1], MAX(ultimo_en),
+       jsonb_object_agg(precio::text, c)
+FROM (
+  SELECT h.producto_id, p.periodo, date_trunc(p.unidad, h.registrado_en AT TIME ZONE precios_zona())::date AS inicio,
+         h.precio, COUNT(*) AS c, MAX(h.registrado_en) AS ultimo_en
+  FROM producto_precio_historial h
+  JOIN bench_producto bp ON bp.id = h.producto_id
+  CROSS JOIN (VALUES ('dia', 'day'), ('semana', 'week')) AS p(periodo, unidad)
+  GROUP BY 1, 2, 3, 4
+) t
+GROUP BY producto_id, periodo, inicio
+    """))
+
+    conn.execute(text("""
+INSERT INTO lista (id, nombre, usuario_id, created_at, version)
+SELECT md5('l' || g)::uuid, 'BENCH ' || g, md5('u' || (g % :usuarios))::uuid,
+       NOW() - g * INTERVAL '1 minute', 10
+FROM generate_series(0, :listas - 1) g
+    """), p)
+    conn.execute(text("""
+INSERT INTO lista_usuario (id, usuario_id, rol)
+SELECT md5('l' || g)::uuid, md5('u' || ((g + 1) % :usuarios))::uuid,
+       CASE WHEN g % 2 = 0 THEN 'editor' ELSE 'lector' END
+FROM generate_series(0, :listas - 1) g
+WHERE g % 3 = 0 AND (g + 1) % :usuarios <> g % :usuarios
+    """), p)
+    conn.execute(text("""
+INSERT INTO lista_link (lista_id, token, activo)
+SELECT md5('l' || g)::uuid, 'e_bench' || g, g % 20 <> 0
+FROM generate_series(0, :listas - 1, 10) g
+    """), p)
+
+    conn.execute(text("""
+WITH nuevos AS (
+  INSERT INTO lista_item (id, lista_id, producto_id, unidad_id, cantidad, precio, comprado,
+                          usuario_id, updated_by, updated_at, cambio)
+  SELECT md5('i' || g)::uuid, md5('l' || (g % :listas))::uuid, bp.id,
+         CASE WHEN g % 2 = 0 THEN u.id END, 1 + g % 5, 100 * (g % 50), g % 4 = 0,
+         md5('u' || ((g % :listas) % :usuarios))::uuid, md5('u' || ((g % :listas) % :usuarios))::uuid,
+         NOW() - g * INTERVAL '1 second', g % 10
+  FROM generate_series(0, :items - 1) g
+  JOIN bench_producto bp ON bp.n = ((g / :listas) + (g % :listas)) % :productos
+  CROSS JOIN (SELECT MIN(id) AS id FROM unidad) u
+  RETURNING id, updated_by, updated_at
+)
+INSERT INTO item (id, usuario_id, accion, updated_at)
+SELECT id, updated_by, 'agrego', updated_at FROM nuevos
+    """), p)
+    conn.execute(text("""
+INSERT INTO lista_item_borrado (id, lista_id, cambio)
+SELECT md5('b' || g)::uuid, md5('l' || (g % :listas))::uuid, g % 10
+FROM generate_series(0, :listas - 1, 10) g
+    """), p)
+    conn.execute(text("""
+UPDATE lista l
+SET total_refs = t.refs, total_comprado = t.comprado, total_pendiente = t.pendiente
+FROM (
+  SELECT lista_id, COUNT(*) AS refs,
+         COALESCE(SUM(precio * cantidad) FILTER (WHERE comprado), 0) AS comprado,
+         COALESCE(SUM(precio * cantidad) FILTER (WHERE NOT comprado), 0) AS pendiente
+  FROM lista_item GROUP BY lista_id
+) t
+WHERE t.lista_id = l.id AND l.nombre LIKE 'BENCH %'
+    """))
+
+    # ANALYZE dentro de la transacción ve las filas propias aún sin commit
+    for tabla in ("usuario", "producto", "producto_precio", "producto_precio_historial",
+                  "producto_precio_resumen", "producto_unidad_ultima", "lista",
+                  "lista_usuario", "lista_link", "lista_item", "item", "lista_item_borrado"):
+        conn.execute(text(f"ANALYZE {tabla}"))
+    return p
+
+
+def tamanos(conn) -> dict | None:
+    """Tamaños del conjunto sintético ya sembrado (None si no hay)."""
+    row = conn.execute(text("""
+SELECT
+  (SELECT COUNT(*) FROM usuario WHERE correo LIKE 'bench-u%@example.com'),
+  (SELECT COUNT(*) FROM lista WHERE nombre LIKE 'BENCH %'),
+  (SELECT COUNT(*) FROM producto WHERE nombre LIKE 'BENCH %')
+    """)).one()
+    usuarios, listas, productos = row
+    if not usuarios or not listas:
+        return None
+    items = conn.execute(text("SELECT COALESCE(SUM(total_refs), 0) FROM lista WHERE nombre LIKE 'BENCH %'")).scalar()
+    return {"listas": listas, "items": int(items), "usuarios": usuarios, "productos": productos}
+
+
+def limpiar(conn):
+    """Borra el conjunto sintético (las cascadas se llevan items, actividad, enlaces e historial de precios)."""
+    conn.execute(text("""
+DELETE FROM lista_item_borrado
+WHERE lista_id IN (SELECT id FROM lista WHERE nombre LIKE 'BENCH %')
+    """))
+    conn.execute(text("DELETE FROM lista WHERE nombre LIKE 'BENCH %'"))
+    conn.execute(text("DELETE FROM producto WHERE nombre LIKE 'BENCH %'"))
+    conn.execute(text("DELETE FROM usuario WHERE correo LIKE 'bench-u%@example.com'"))
@@ -0,0 +1,184 @@
+"""
+Servidor local de certificados de Google (sin Internet) y benchmark de la
+verificación de ID tokens: `verify_oauth2_token` (descarga los certificados
+en cada llamada) frente a `verificador_google` (caché + firma en el proceso).
+
+Genera una clave RSA y un certificado autofirmado, los sirve como
+`{kid: PEM}` con `Cache-Control: max-age` y firma tokens con esa clave.
+tests/test_verificador_google.py lo usa en lugar de Google.
+
+Desde backend/:
+    python -m bench.google_local --verificaciones 200
+    python -m bench.google_local --servir --puerto 8089 --audiencia TU_CLIENT_ID
+        (luego GOOGLE_CERTS_URL=http://127.0.0.1:8089/ al levantar la API)
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token as google_id_token
+
+from verificador_google import VerificadorGoogle
+
+
+def clave_y_certificado():
+    clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "listas-google-local")])
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder()\
+        .subject_name(nombre)\
+        .issuer_name(nombre)\
+        .public_key(clave.public_key())\
+        .serial_number(x509.random_serial_number())\
+        .not_valid_before(ahora - datetime.timedelta(days=1))\
+        .not_valid_after(ahora + datetime.timedelta(days=30))\
+        .sign(clave, hashes.SHA256())
+    clave_pem = clave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+    return clave_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class ServidorCertificados:
+    def __init__(self, puerto: int = 0, max_age: int = 3600):
+        self.max_age = max_age
+        self.descargas = 0
+        self._claves = {}      # kid -> clave PEM
+        self._certs = {}       # kid -> certificado PEM
+        self.kid = None
+        self.rotar()
+        self._http = ThreadingHTTPServer(("127.0.0.1", puerto), self._manejador())
+        self._http.daemon_threads = True
+        self._hilo = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._http.server_address[1]}/"
+
+    def rotar(self, conservar_anterior: bool = True):
+        """Nueva clave activa; como Google, la anterior se sigue publicando un tiempo."""
+        clave_pem, cert_pem = clave_y_certificado()
+        kid = uuid.uuid4().hex
+        if not conservar_anterior:
+            self._claves, self._certs = {}, {}
+        self._claves[kid] = clave_pem
+        self._certs = {**self._certs, kid: cert_pem}
+        self.kid = kid
+        return kid
+
+    def firmar(self, audiencia: str, sub: str = "1234567890", email: str = "ana@example.com",
+               vigencia: int = 3600, **extra) -> str:
+        firmante = crypt.RSASigner.from_string(self._claves[self.kid], key_id=self.kid)
+        ahora = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com", "aud": audiencia, "sub": sub,
+            "email": email, "email_verified": True, "name": "ANA PRUEBA",
+            "iat": ahora, "exp": ahora + vigencia, **extra,
+        }
+        return jwt.encode(firmante, claims).decode()
+
+    def _manejador(self):
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                cuerpo = json.dumps(servidor._certs).encode()
+                servidor.descargas += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Cache-Control", f"public, max-age={servidor.max_age}")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        return Manejador
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._http.serve_forever, name="google-local", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        if self._hilo is not None:
+            self._http.shutdown()
+            self._hilo = None
+        self._http.server_close()
+
+
+def medir(fn, tokens: list) -> float:
+    t0 = time.perf_counter()
+    for t in tokens:
+        fn(t)
+    return (time.perf_counter() - t0) / len(tokens) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Certificados de Google locales y benchmark de verificación")
+    parser.add_argument("--verificaciones", type=int, default=200)
+    parser.add_argument("--audiencia", default="listas-local.apps.googleusercontent.com")
+    parser.add_argument("--max-age", type=int, default=3600)
+    parser.add_argument("--servir", action="store_true", help="solo servir certificados y mostrar un token")
+    parser.add_argument("--puerto", type=int, default=0)
+    args = parser.parse_args()
+
+    servidor = ServidorCertificados(args.puerto, args.max_age).iniciar()
+    if args.servir:
+        print(json.dumps({"GOOGLE_CERTS_URL": servidor.url, "id_token": servidor.firmar(args.audiencia)}, indent=2))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.detener()
+        return
+
+    tokens = [servidor.firmar(args.audiencia, sub=str(i)) for i in range(args.verificaciones)]
+
+    # lo que hacía login_google: descarga los certificados en cada verificación
+    peticion = google_requests.Request()
+    antes = servidor.descargas
+    actual_ms = medir(
+        lambda t: google_id_token.verify_token(t, peticion, audience=args.audiencia, certs_url=servidor.url),
+        tokens,
+    )
+    descargas_actual = servidor.descargas - antes
+
+    verificador = VerificadorGoogle(servidor.url)
+    antes = servidor.descargas
+    cache_ms = medir(lambda t: verificador.verificar(t, args.audiencia), tokens)
+    descargas_cache = servidor.descargas - antes
+
+    # rotación: un kid nuevo fuerza una sola recarga en línea
+    servidor.rotar()
+    antes = servidor.descargas
+    verificador.verificar(servidor.firmar(args.audiencia), args.audiencia)
+    descargas_rotacion = servidor.descargas - antes
+    servidor.detener()
+
+    resultados = {
+        "verificaciones": args.verificaciones,
+        "verify_oauth2_token_ms": round(actual_ms, 3),
+        "verify_oauth2_token_descargas": descargas_actual,
+        "cache_local_ms": round(cache_ms, 3),
+        "cache_local_descargas": descargas_cache,
+        "descargas_tras_rotar": descargas_rotacion,
+    }
+    resultados["aceleracion"] = round(actual_ms / cache_ms, 1)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
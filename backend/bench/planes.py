@@ -0,0 +1,159 @@
+"""
+Arnés de planes: ejecuta las consultas de `crud` sobre un conjunto sintético
+y revisa su `EXPLAIN (ANALYZE, BUFFERS)`. Falla (código 1) si alguna recorre
+con Seq Scan una tabla grande.
+
+Todo ocurre en una transacción que se revierte al final: la base apuntada
+por DB_URL (con el esquema creado) queda como estaba. Desde backend/:
+    python -m bench.planes
+    python -m bench.planes --listas 10000 --items 100000 --verbose
+"""
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from db import engine
+from busqueda import cache_productos
+from catalogo import catalogo
+from bench.datos import sembrar, id_sintetico
+import crud
+
+def casos(p: dict) -> list:
+    """
+    (nombre, fn(db)) con las operaciones de crud que usan los endpoints. Quedan
+    fuera las de mantenimiento que recorren tablas completas a propósito
+    (backfill_unidad_ultima, reconciliar_totales, purgar_tombstones).
+    """
+    uid = id_sintetico("u", 0)
+    lid = id_sintetico("l", 0)                  # lista del usuario 0 (dueño)
+    ajeno = id_sintetico("u", 1)                # no es dueño de la lista 0
+    item = id_sintetico("i", 0)                 # primer item de la lista 0
+    otro = id_sintetico("i", p["listas"])       # segundo item de la lista 0
+    producto = lambda db: crud.crear_o_obtener_producto(db, uid, "BENCH 000000").id
+    return [
+        ("es_dueno", lambda db: crud.es_dueno(db, lid, uid)),
+        ("rol_en_lista", lambda db: crud.rol_en_lista(db, lid, ajeno)),
+        ("listar_listas", lambda db: crud.listar_listas(db, uid, limit=20)),
+        ("listar_listas_after", lambda db: crud.listar_listas(db, uid, after=lid, limit=20)),
+        ("firma_listas", lambda db: crud.firma_listas(db, uid)),
+        ("version_lista", lambda db: crud.version_lista(db, lid, uid)),
+        ("detalle_lista", lambda db: crud.detalle_lista(db, lid, uid)),
+        ("cambios_lista", lambda db: crud.cambios_lista(db, lid, uid, desde=5)),
+        ("buscar_productos", lambda db: crud.buscar_productos(db, "01234")),
+        ("buscar_productos_prefijo", lambda db: crud.buscar_productos(db, "BE")),
+        ("crear_o_obtener_producto", lambda db: crud.crear_o_obtener_producto(db, uid, "BENCH 000042")),
+        ("agregar_item", lambda db: crud.agregar_item(db, lid, uid, "BENCH PLANES", Decimal(1), None, 100)),
+        ("patch_item", lambda db: crud.patch_item(db, lid, item, uid, {"comprado": True, "cantidad": Decimal(2)})),
+        ("patch_item_precio", lambda db: crud.patch_item(db, lid, item, uid, {"precio": 123_456})),
+        ("serie_precios", lambda db: crud.serie_precios(db, producto(db), "dia", date.today() - timedelta(days=90))),
+        ("costo_estimado", lambda db: crud.costo_estimado(db, lid, uid)),
+        ("borrar_item", lambda db: crud.borrar_item(db, lid, otro)),
+        ("agregar_items_lote", lambda db: crud.agregar_items_lote(db, lid, uid, crud.items_desde_texto("BENCH 000100\nBENCH NUEVO LOTE"))),
+        ("marcar_items_lote", lambda db: crud.marcar_items_lote(db, lid, uid, True)),
+        ("aceptar_link", lambda db: crud.aceptar_link(db, "e_bench10", uid)),
+        ("purgar_mutaciones", lambda db: crud.purgar_mutaciones(db, 30)),
+    ]
+
+
+def _seq_scans(nodo: dict, grandes: set) -> list:
+    out = []
+    if nodo.get("Node Type") == "Seq Scan" and nodo.get("Relation Name") in grandes:
+        out.append(nodo["Relation Name"])
+    for hijo in nodo.get("Plans", []):
+        out += _seq_scans(hijo, grandes)
+    return out
+
+
+def _explicables(sentencias: list) -> list:
+    return [
+        (s, params) for s, params in sentencias
+        if s.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "WITH")
+    ]
+
+
+def revisar(conn, db: Session, p: dict, umbral: int, verbose: bool) -> list:
+    grandes = set(conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND reltuples >= :u"
+    ), {"u": umbral}).scalars())
+
+    capturadas = []
+    capturando = [True]
+
+    def capturar(conn_, cursor, statement, parameters, context, executemany):
+        if capturando[0] and not executemany:
+            capturadas.append((statement, parameters))
+
+    # el catálogo en memoria lee con otra conexión (sin los datos sembrados)
+    catalogo.productos_max = 0
+    event.listen(conn, "before_cursor_execute", capturar)
+    fallas = []
+    try:
+        for nombre, fn in casos(p):
+            cache_productos.limpiar()
+            capturadas.clear()
+            capturando[0] = True
+            try:
+                with db.begin_nested():
+                    fn(db)
+                    db.flush()
+            except ValueError as e:
+                print(f"{'error':5} {nombre:26} {e}")
+            capturando[0] = False
+
+            for sentencia, params in _explicables(capturadas):
+                with conn.begin_nested() as sp:
+                    plan = conn.exec_driver_sql(
+                        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sentencia, params
+                    ).scalar()
+                    sp.rollback()
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                raiz = plan[0]["Plan"]
+                scans = _seq_scans(raiz, grandes)
+                estado = "FALLA" if scans else "ok"
+                print(f"{estado:5} {nombre:26} {plan[0].get('Execution Time', 0):8.2f} ms  {raiz['Node Type']}"
+                      + (f"  seq scan: {', '.join(scans)}" if scans else ""))
+                if verbose or scans:
+                    print("      " + " ".join(sentencia.split())[:400])
+                if scans:
+                    fallas.append((nombre, scans))
+    finally:
+        event.remove(conn, "before_cursor_execute", capturar)
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revisa los planes de las consultas de crud sobre datos sintéticos")
+    parser.add_argument("--listas", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--productos", type=int, default=20_000)
+    parser.add_argument("--observaciones", type=int, default=None, help="historial de precios (por defecto = items)")
+    parser.add_argument("--umbral", type=int, default=10_000, help="filas a partir de las cuales una tabla es grande")
+    parser.add_argument("--verbose", action="store_true", help="muestra cada sentencia explicada")
+    args = parser.parse_args()
+
+    conn = engine.connect()
+    trans = conn.begin()
+    try:
+        print("sembrando datos sintéticos...")
+        p = sembrar(conn, listas=args.listas, items=args.items, productos=args.productos,
+                    observaciones=args.observaciones)
+        db = Session(bind=conn)
+        fallas = revisar(conn, db, p, args.umbral, args.verbose)
+        db.close()
+    finally:
+        trans.rollback()
+        conn.close()
+
+    if fallas:
+        print(f"{len(fallas)} plan(es) con Seq Scan en tablas grandes")
+        sys.exit(1)
+    print("sin Seq Scan en tablas grandes")
+
+
+if __name__ == "__main__":
+    main()
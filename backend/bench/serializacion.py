@@ -0,0 +1,78 @@
+"""
+Benchmark de serialización del detalle de una lista grande (sin base de
+datos): ruta de FastAPI (validación con ListaDetalleOut + json estándar)
+frente a RespuestaJSON (orjson sobre filas ya tipadas).
+
+Desde backend/:
+    python -m bench.serializacion --items 500 --repeticiones 200
+"""
+import argparse
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from esquemas import ListaDetalleOut
+from respuestas import a_json
+
+
+def detalle_sintetico(n: int) -> dict:
+    return {
+        "id": uuid.uuid4(), "nombre": "MERCADO DEL MES", "foto": None,
+        "es_dueno": True, "rol": "dueno",
+        "items": [
+            {
+                "id": uuid.uuid4(),
+                "producto_id": 1000 + i,
+                "producto": f"PRODUCTO DE PRUEBA {i:04d}",
+                "unidad_id": 1 + i % 12,
+                "unidad": "KILO",
+                "cantidad": Decimal(f"{1 + i % 7}.000"),
+                "precio": 1500 * (1 + i % 40),
+                "comprado": i % 3 == 0,
+                "tocado_por": ["ANA", "LUIS"][: i % 3],
+            }
+            for i in range(n)
+        ],
+        "total_refs": n, "total_comprado": 0, "total_pendiente": 0,
+        "cursor": 42,
+    }
+
+
+def fastapi_actual(payload: dict) -> bytes:
+    # lo que hace FastAPI con response_model + JSONResponse de Starlette
+    contenido = ListaDetalleOut.model_validate(payload).model_dump(mode="json")
+    return json.dumps(contenido, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def medir(fn, payload: dict, repeticiones: int) -> float:
+    fn(payload)
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        fn(payload)
+    return (time.perf_counter() - t0) / repeticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización del detalle de lista")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = detalle_sintetico(args.items)
+    a, b = fastapi_actual(payload), a_json(payload)
+    if json.loads(a) != json.loads(b):
+        raise SystemExit("las dos rutas producen JSON distinto")
+
+    resultados = {
+        "items": args.items,
+        "bytes": len(b),
+        "fastapi_validacion_ms": round(medir(fastapi_actual, payload, args.repeticiones), 3),
+        "orjson_directo_ms": round(medir(a_json, payload, args.repeticiones), 3),
+    }
+    resultados["aceleracion"] = round(resultados["fastapi_validacion_ms"] / resultados["orjson_directo_ms"], 1)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
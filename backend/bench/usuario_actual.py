@@ -0,0 +1,70 @@
+"""
+Benchmark de `auth.usuario_actual`: resoluciones por segundo sin caché,
+con caché de usuarios y con perfil embebido en el token.
+
+Requiere DB_URL apuntando a una base con el esquema creado. Desde backend/:
+    python -m bench.usuario_actual --segundos 5
+"""
+import argparse
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+from db import SessionLocal
+from modelos import Usuario
+import auth
+
+
+def medir(token: str, segundos: float) -> float:
+    req = SimpleNamespace(cookies={auth.COOKIE_NAME: token})
+    n = 0
+    db = SessionLocal()
+    try:
+        fin = time.perf_counter() + segundos
+        while time.perf_counter() < fin:
+            auth.usuario_actual(req, db)
+            n += 1
+    finally:
+        db.close()
+    return n / segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de usuario_actual")
+    parser.add_argument("--segundos", type=float, default=3.0)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    u = Usuario(correo=f"bench-{uuid.uuid4().hex[:12]}@example.com", nombre="BENCH")
+    db.add(u)
+    db.commit()
+    uid, correo, nombre = u.id, u.correo, u.nombre
+
+    resultados = {}
+    try:
+        auth.JWT_CLAIMS_PERFIL = False
+        token = auth.crear_token(uid)
+
+        ttl = auth.cache_usuarios.ttl
+        auth.cache_usuarios.ttl = 0
+        resultados["sin_cache"] = medir(token, args.segundos)
+
+        auth.cache_usuarios.ttl = ttl or 60
+        auth.cache_usuarios.limpiar()
+        resultados["cache"] = medir(token, args.segundos)
+        auth.cache_usuarios.ttl = ttl
+
+        auth.JWT_CLAIMS_PERFIL = True
+        token = auth.crear_token(uid, correo, nombre)
+        resultados["claims_perfil"] = medir(token, args.segundos)
+    finally:
+        db.query(Usuario).filter(Usuario.id == uid).delete()
+        db.commit()
+        db.close()
+
+    print(json.dumps({k: round(v, 1) for k, v in resultados.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
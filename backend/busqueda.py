@@ -0,0 +1,76 @@
+"""
+Caché en memoria (por proceso) para el autocomplete de productos.
+
+Guarda el resultado de cada consulta normalizada con TTL y desalojo LRU.
+Si un prefijo más corto ya está en caché y su resultado fue completo
+(menos filas que el límite), las consultas más largas se responden
+filtrando ese resultado sin tocar Postgres: todo nombre que contiene
+"ARRO" también contiene "ARR".
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PRODUCTOS_CACHE_TTL = float(os.getenv("PRODUCTOS_CACHE_TTL", "30"))   # segundos, 0 = desactivado
+PRODUCTOS_CACHE_MAX = int(os.getenv("PRODUCTOS_CACHE_MAX", "1000"))   # consultas guardadas
+
+
+def ordenar(rows, q: str):
+    # mismo orden que crud.buscar_productos: prefijos primero, luego por nombre
+    return sorted(rows, key=lambda r: (not r[1].startswith(q), r[0]))
+
+
+class CachePrefijos:
+    def __init__(self, ttl: float, maximo: int):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._datos = OrderedDict()  # (limit, q) -> (expira, filas)
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self) -> bool:
+        return self.ttl > 0 and self.maximo > 0
+
+    def obtener(self, q: str, limit: int):
+        """
+        Filas (nombre, nombre_norm, id, precio, unidad_id, unidad) para `q`,
+        o None si hay que ir a la base de datos.
+        """
+        if not self.activo:
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            for k in range(len(q), -1, -1):
+                clave = (limit, q[:k])
+                entrada = self._datos.get(clave)
+                if not entrada:
+                    continue
+                expira, filas = entrada
+                if expira <= ahora:
+                    del self._datos[clave]
+                    continue
+                if k < len(q) and len(filas) >= limit:
+                    # el prefijo corto pudo truncar coincidencias de `q`
+                    continue
+                self._datos.move_to_end(clave)
+                if k == len(q):
+                    return filas
+                return ordenar([r for r in filas if q in r[1]], q)[:limit]
+        return None
+
+    def guardar(self, q: str, limit: int, filas):
+        if not self.activo:
+            return
+        with self._lock:
+            self._datos[(limit, q)] = (time.monotonic() + self.ttl, filas)
+            self._datos.move_to_end((limit, q))
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+cache_productos = CachePrefijos(PRODUCTOS_CACHE_TTL, PRODUCTOS_CACHE_MAX)
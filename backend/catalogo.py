@@ -0,0 +1,187 @@
+"""
+Catálogos en memoria (por proceso): unidades y, si caben, todos los
+productos con su último precio y última unidad.
+
+`/unidades` y el autocomplete de productos se responden filtrando en memoria
+sin tocar Postgres. Las escrituras de `crud` avisan con `pg_notify` en su
+misma transacción; cada worker escucha el canal (hilo de
+`eventos.distribuidor`):
+- "productos" / "unidades": cambió el conjunto o los nombres (producto
+  nuevo, fusión, backfill). Se marca sucio; la siguiente lectura lanza la
+  recarga en un hilo y sigue respondiendo con la foto anterior (la carga
+  usa la sesión sync: en el camino de la petición bloquearía el event loop
+  con DB_ASYNC=1). Solo la primera carga, en el arranque, es síncrona.
+- `[[producto_id, precio, unidad_id], ...]` (JSON, null = sin cambio): último
+  precio o última unidad de esos productos. Se actualizan solo esas entradas,
+  sin recargar.
+Con cualquier aviso se vacía también `busqueda.cache_productos` del worker.
+Si la conexión de LISTEN se cae se recarga todo (pudieron perderse avisos).
+"""
+import os
+import json
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from modelos import Unidad, Producto, ProductoPrecio, ProductoUnidadUltima
+from busqueda import ordenar, cache_productos
+
+CANAL = "catalogo"
+# Máximo de productos para tenerlos todos en memoria (0 = solo unidades).
+# Con más, el autocomplete sigue por busqueda.cache_productos + Postgres.
+CATALOGO_PRODUCTOS_MAX = int(os.getenv("CATALOGO_PRODUCTOS_MAX", "5000"))
+# NOTIFY admite ~8000 bytes; un aviso de últimos más largo recarga todo
+AVISO_MAX = 7900
+
+
+def invalidar(db: Session, que: str):
+    """Avisa a todos los workers (al hacer commit) que `que` cambió: "productos" o "unidades"."""
+    db.execute(select(func.pg_notify(CANAL, que)))
+
+
+def avisar_ultimos(db: Session, filas):
+    """Avisa el último precio/unidad de productos: [(producto_id, precio|None, unidad_id|None)]."""
+    payload = json.dumps([list(f) for f in filas], separators=(",", ":"))
+    if len(payload) > AVISO_MAX:
+        invalidar(db, "productos")
+    else:
+        db.execute(select(func.pg_notify(CANAL, payload)))
+
+
+class Catalogo:
+    def __init__(self, productos_max: int):
+        self.productos_max = productos_max
+        self._lock = threading.Lock()
+        self._lock_recargas = threading.Lock()
+        self._sucio = {"unidades": True, "productos": True}
+        self._cargado = {"unidades": False, "productos": False}
+        self._recargas = {}        # que -> hilo de recarga en curso
+        self._unidades = []        # [(id, nombre)] ordenadas por nombre
+        self.firma_unidades = ""
+        self._productos = None     # [(nombre, nombre_norm, id, precio, unidad_id, unidad)] o None si no caben
+        self._posicion = {}        # producto id -> índice en _productos
+        self._nombre_unidad = {}   # unidad id -> nombre
+
+    def al_notificar(self, payload: str | None):
+        # hilo de LISTEN; None = reconexión
+        cache_productos.limpiar()
+        if payload in self._sucio:
+            self._sucio[payload] = True
+        elif payload and payload.startswith("["):
+            self._actualizar_ultimos(payload)
+        else:
+            self._sucio = dict.fromkeys(self._sucio, True)
+
+    def _actualizar_ultimos(self, payload: str):
+        # sin bloquear el hilo de LISTEN: si hay una carga en curso pudo leer
+        # el estado anterior, así que se repite
+        if not self._lock.acquire(blocking=False):
+            self._sucio["productos"] = True
+            return
+        try:
+            productos = self._productos
+            if self._sucio["productos"] or productos is None:
+                return
+            for pid, precio, unidad_id in json.loads(payload):
+                i = self._posicion.get(pid)
+                if i is None:
+                    continue
+                nombre, nombre_norm, _, precio_ant, unidad_ant, unidad_nom = productos[i]
+                if unidad_id is not None:
+                    if unidad_id not in self._nombre_unidad:
+                        self._sucio["productos"] = True
+                        return
+                    unidad_ant, unidad_nom = unidad_id, self._nombre_unidad[unidad_id]
+                productos[i] = (nombre, nombre_norm, pid, precio_ant if precio is None else precio, unidad_ant, unidad_nom)
+        except (ValueError, TypeError):
+            self._sucio["productos"] = True
+        finally:
+            self._lock.release()
+
+    def _cargar_unidades(self, db: Session):
+        rows = db.query(Unidad.id, Unidad.nombre, Unidad.created_at).order_by(Unidad.nombre.asc()).all()
+        ultima = max((r[2] for r in rows), default=None)
+        self._unidades = [(r[0], r[1]) for r in rows]
+        self._nombre_unidad = dict(self._unidades)
+        self.firma_unidades = f"{len(rows)}-{ultima.isoformat() if ultima else ''}"
+
+    def _cargar_productos(self, db: Session):
+        if self.productos_max <= 0 or db.query(func.count(Producto.id)).scalar() > self.productos_max:
+            self._productos = None
+            self._posicion = {}
+            return
+        rows = db.query(
+            Producto.nombre, Producto.nombre_norm, Producto.id,
+            func.coalesce(ProductoPrecio.precio, 0), ProductoUnidadUltima.unidad_id, Unidad.nombre,
+        )\
+            .outerjoin(ProductoPrecio, ProductoPrecio.producto_id == Producto.id)\
+            .outerjoin(ProductoUnidadUltima, ProductoUnidadUltima.producto_id == Producto.id)\
+            .outerjoin(Unidad, Unidad.id == ProductoUnidadUltima.unidad_id)\
+            .order_by(Producto.nombre.asc())\
+            .all()
+        self._productos = [tuple(r) for r in rows]
+        self._posicion = {r[2]: i for i, r in enumerate(self._productos)}
+
+    def _asegurar(self, que: str):
+        if not self._sucio[que]:
+            return
+        if not self._cargado[que]:
+            self._cargar(que)
+            return
+        with self._lock_recargas:
+            hilo = self._recargas.get(que)
+            if hilo is None or not hilo.is_alive():
+                hilo = threading.Thread(target=self._recargar, args=(que,), name=f"catalogo-{que}", daemon=True)
+                self._recargas[que] = hilo
+                hilo.start()
+
+    def _recargar(self, que: str):
+        try:
+            self._cargar(que)
+        except Exception:
+            pass  # sigue sucio: la próxima lectura lo reintenta
+
+    def _cargar(self, que: str):
+        with self._lock:
+            if not self._sucio[que]:
+                return
+            # se limpia antes de leer: un aviso que llegue durante la carga la repite
+            self._sucio[que] = False
+            db = SessionLocal()
+            try:
+                if que == "unidades":
+                    self._cargar_unidades(db)
+                else:
+                    self._cargar_productos(db)
+                self._cargado[que] = True
+            except Exception:
+                self._sucio[que] = True
+                raise
+            finally:
+                db.close()
+
+    def cargar(self):
+        for que in self._sucio:
+            self._asegurar(que)
+
+    def unidades_firma(self) -> str:
+        self._asegurar("unidades")
+        return self.firma_unidades
+
+    def unidades(self, q: str = "", limit: int = 20) -> list:
+        self._asegurar("unidades")
+        q = (q or "").upper()
+        return [u for u in self._unidades if q in u[1].upper()][:limit]
+
+    def buscar_productos(self, qn: str, limit: int):
+        """Mismas filas que la consulta de `crud.buscar_productos`, o None si no están en memoria."""
+        self._asegurar("productos")
+        productos = self._productos
+        if productos is None:
+            return None
+        return ordenar([r for r in productos if qn in r[1]], qn)[:limit]
+
+
+catalogo = Catalogo(CATALOGO_PRODUCTOS_MAX)
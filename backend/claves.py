@@ -0,0 +1,92 @@
+"""
+Hash y verificación de contraseñas (bcrypt) en un pool de procesos acotado.
+
+bcrypt es CPU puro: en el threadpool de uvicorn una ráfaga de logins bloquea
+las demás peticiones. Aquí se ejecuta en HASH_WORKERS procesos y, si ya hay
+HASH_COLA_MAX operaciones en curso o en espera, se rechaza de inmediato
+(PoolSaturado) en lugar de encolar sin límite.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from multiprocessing import get_context
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))      # 0 = en el mismo hilo (dev)
+HASH_COLA_MAX = int(os.getenv("HASH_COLA_MAX", "8"))    # operaciones en curso + en espera
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))   # segundos
+
+pwd = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PoolSaturado(Exception):
+    pass
+
+
+def _bcrypt_input(password: str) -> str:
+    b = password.encode("utf-8")
+    if len(b) > 72:
+        # Pre-hash estable (no truncar)
+        return hashlib.sha256(b).hexdigest()  # 64 chars ascii
+    return password
+
+
+def _hash(p: str) -> str:
+    return pwd.hash(_bcrypt_input(p))
+
+
+def _verificar(p: str, hashed: str):
+    # (ok, hash nuevo si el costo cambió)
+    return pwd.verify_and_update(_bcrypt_input(p), hashed)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(max(HASH_COLA_MAX, 1))
+
+
+def _obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _ejecutar(fn, *args):
+    if HASH_WORKERS <= 0:
+        return fn(*args)
+    if not _cupos.acquire(blocking=False):
+        raise PoolSaturado()
+    try:
+        fut = _obtener_pool().submit(fn, *args)
+    except Exception:
+        _cupos.release()
+        raise
+    # el cupo se libera cuando el trabajo termina o se cancela, no al dejar de
+    # esperarlo: un bcrypt que sigue corriendo tras el timeout también cuenta
+    fut.add_done_callback(lambda _: _cupos.release())
+    try:
+        return fut.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        fut.cancel()
+        raise PoolSaturado()
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def hash_password(p: str) -> str:
+    return _ejecutar(_hash, p)
+
+
+def verificar_password(p: str, hashed: str):
+    return _ejecutar(_verificar, p, hashed)
@@ -1,20 +1,45 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, case, and_, or_, tuple_, update, delete, select, text, true, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert, aggregate_order_by
+import uuid
 from uuid import UUID
+from decimal import Decimal
+from datetime import date, timedelta
 from modelos import (
-    Usuario, UsuarioOAuth, Lista, ListaUsuario, ListaItem, Producto, Unidad,
-    ProductoPrecio, ItemActividad, ListaLink
+    Usuario, Lista, ListaUsuario, ListaItem, Producto, Unidad,
+    ProductoPrecio, ProductoPrecioResumen, ProductoUnidadUltima, ItemActividad, ListaLink,
+    ListaItemBorrado, ListaBorrada, Mutacion
 )
-from auth import a_mayusculas, token_compartir
+from auth import a_mayusculas, normalizar_busqueda, token_compartir
+from busqueda import cache_productos
+from catalogo import catalogo, invalidar as invalidar_catalogo, avisar_ultimos, CANAL as CANAL_CATALOGO
+import permisos
+from permisos import cache_roles
+from eventos import publicar
 
 def es_dueno(db: Session, lista_id: UUID, usuario_id) -> bool:
-    return db.query(Lista).filter(Lista.id == lista_id, Lista.usuario_id == usuario_id).count() == 1
+    return rol_en_lista(db, lista_id, usuario_id) == "dueno"
 
 def rol_en_lista(db: Session, lista_id: UUID, usuario_id) -> str | None:
-    if es_dueno(db, lista_id, usuario_id):
-        return "dueno"
-    lu = db.query(ListaUsuario).filter(ListaUsuario.id == lista_id, ListaUsuario.usuario_id == usuario_id).first()
-    return lu.rol if lu else None
+    """
+    Rol del usuario en la lista (None = sin acceso) con una sola consulta,
+    memorizado en la sesión y en `permisos.cache_roles`.
+    """
+    k = permisos.clave(lista_id, usuario_id)
+    memo = permisos.memo(db)
+    if k in memo:
+        return memo[k]
+    rol = cache_roles.obtener(k)
+    if rol is permisos.FALTA:
+        rol = db.query(case((Lista.usuario_id == usuario_id, "dueno"), else_=ListaUsuario.rol))\
+            .select_from(Lista)\
+            .outerjoin(ListaUsuario, and_(ListaUsuario.id == Lista.id, ListaUsuario.usuario_id == usuario_id))\
+            .filter(Lista.id == lista_id)\
+            .scalar()
+        cache_roles.guardar(k, rol)
+    memo[k] = rol
+    return rol
 
 def requiere_acceso(db: Session, lista_id: UUID, usuario_id) -> str:
     rol = rol_en_lista(db, lista_id, usuario_id)
@@ -27,30 +52,139 @@ def puede_editar(db: Session, lista_id: UUID, usuario_id) -> bool:
     return rol in ("dueno", "editor")
 
 def resumen_lista(db: Session, lista_id: UUID):
-    total_refs = db.query(func.count(ListaItem.id)).filter(ListaItem.lista_id == lista_id).scalar() or 0
-    total_comprado = db.query(func.coalesce(func.sum(ListaItem.precio * ListaItem.cantidad), 0))\
-        .filter(ListaItem.lista_id == lista_id, ListaItem.comprado == True).scalar() or 0
-    total_pendiente = db.query(func.coalesce(func.sum(ListaItem.precio * ListaItem.cantidad), 0))\
-        .filter(ListaItem.lista_id == lista_id, ListaItem.comprado == False).scalar() or 0
-    return int(total_refs), int(total_comprado), int(total_pendiente)
-
-def listar_listas(db: Session, usuario_id):
-    propias = db.query(Lista).filter(Lista.usuario_id == usuario_id).all()
-    compartidas_ids = db.query(ListaUsuario.id).filter(ListaUsuario.usuario_id == usuario_id).all()
-    compartidas = db.query(Lista).filter(Lista.id.in_([x[0] for x in compartidas_ids])).all() if compartidas_ids else []
+    row = db.query(Lista.total_refs, Lista.total_comprado, Lista.total_pendiente)\
+        .filter(Lista.id == lista_id).first()
+    if not row:
+        return 0, 0, 0
+    return int(row[0]), int(row[1]), int(row[2])
+
+def ajustar_totales(db: Session, lista_id: UUID, refs: int = 0, comprado=0, pendiente=0, avanzar: bool = True) -> dict | None:
+    """
+    Incremento atómico de los totales en la misma transacción de la escritura
+    del item. También avanza `lista.version` (cursor de cambios): el UPDATE
+    bloquea la fila de la lista, así el orden de los cursores coincide con el
+    orden de commit. Devuelve los totales y el cursor resultantes.
+
+    Toda escritura de items bloquea primero la fila de la lista y después
+    los items (y productos): con un solo orden no hay interbloqueos entre,
+    p. ej., `patch_item` y `marcar_items_lote`.
+    """
+    row = db.execute(
+        update(Lista)
+        .where(Lista.id == lista_id)
+        .values(
+            total_refs=Lista.total_refs + refs,
+            total_comprado=Lista.total_comprado + comprado,
+            total_pendiente=Lista.total_pendiente + pendiente,
+            version=Lista.version + (1 if avanzar else 0),
+        )
+        .returning(Lista.total_refs, Lista.total_comprado, Lista.total_pendiente, Lista.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if not row:
+        return None
+    return {
+        "total_refs": int(row[0]), "total_comprado": int(row[1]), "total_pendiente": int(row[2]),
+        "cursor": int(row[3]),
+    }
+
+def _aporte_item(precio, cantidad, comprado: bool):
+    # (comprado, pendiente) con que un item contribuye a los totales de la lista
+    subtotal = Decimal(int(precio or 0)) * Decimal(str(cantidad))
+    return (subtotal, Decimal(0)) if comprado else (Decimal(0), subtotal)
+
+def totales_reales(db: Session):
+    # totales recalculados desde lista_item (para reconciliación)
+    subtotal = ListaItem.precio * ListaItem.cantidad
+    return db.query(
+        Lista.id.label("lista_id"),
+        func.count(ListaItem.id).label("refs"),
+        func.coalesce(func.sum(case((ListaItem.comprado == True, subtotal), else_=0)), 0).label("comprado"),
+        func.coalesce(func.sum(case((ListaItem.comprado == False, subtotal), else_=0)), 0).label("pendiente"),
+    )\
+        .outerjoin(ListaItem, ListaItem.lista_id == Lista.id)\
+        .group_by(Lista.id)\
+        .subquery()
+
+def reconciliar_totales(db: Session, reparar: bool = False):
+    """
+    Detecta listas cuyos totales desnormalizados no coinciden con sus items.
+    Con `reparar=True` los corrige en la transacción actual.
+    """
+    real = totales_reales(db)
+    desfase = or_(
+        Lista.total_refs != real.c.refs,
+        Lista.total_comprado != real.c.comprado,
+        Lista.total_pendiente != real.c.pendiente,
+    )
+    rows = db.query(
+        Lista.id, Lista.total_refs, Lista.total_comprado, Lista.total_pendiente,
+        real.c.refs, real.c.comprado, real.c.pendiente,
+    )\
+        .join(real, real.c.lista_id == Lista.id)\
+        .filter(desfase)\
+        .all()
+    if reparar and rows:
+        db.execute(
+            update(Lista)
+            .where(Lista.id == real.c.lista_id, desfase)
+            .values(
+                total_refs=real.c.refs, total_comprado=real.c.comprado, total_pendiente=real.c.pendiente,
+                version=Lista.version + 1,
+            )
+        )
+    return rows
+
+def _ids_visibles(usuario_id):
+    # propias ∪ compartidas: cada rama usa su índice (un OR sobre el outer join
+    # obligaría a recorrer toda `lista`)
+    return select(Lista.id).where(Lista.usuario_id == usuario_id)\
+        .union_all(select(ListaUsuario.id).where(ListaUsuario.usuario_id == usuario_id))
+
+def listar_listas(db: Session, usuario_id, after: UUID | None = None, limit: int | None = None):
+    """
+    Listas propias y compartidas con sus totales en una sola consulta,
+    ordenadas por created_at (más recientes primero). `after` es el id de la
+    última lista recibida (paginación por keyset); CURSOR_INVALIDO si esa
+    lista ya no existe (el subquery daría NULL y una página vacía, como si
+    fuera el final).
+    """
+    q = db.query(Lista, ListaUsuario.rol)\
+        .outerjoin(ListaUsuario, and_(ListaUsuario.id == Lista.id, ListaUsuario.usuario_id == usuario_id))\
+        .filter(Lista.id.in_(_ids_visibles(usuario_id)))
+
+    if after is not None:
+        cursor = db.query(Lista.created_at).filter(Lista.id == after).scalar_subquery()
+        q = q.filter(tuple_(Lista.created_at, Lista.id) < tuple_(cursor, after))
+
+    q = q.order_by(Lista.created_at.desc(), Lista.id.desc())
+    if limit:
+        q = q.limit(limit)
 
     out = []
-    for l in propias:
-        tr, tc, tp = resumen_lista(db, l.id)
-        out.append((l, True, "dueno", tr, tc, tp))
-    for l in compartidas:
-        lu = db.query(ListaUsuario).filter(ListaUsuario.id == l.id, ListaUsuario.usuario_id == usuario_id).first()
-        rol = lu.rol if lu else "editor"
-        tr, tc, tp = resumen_lista(db, l.id)
-        out.append((l, False, rol, tr, tc, tp))
-    out.sort(key=lambda x: x[0].created_at, reverse=True)
+    for l, rol in q.all():
+        es_dueno = l.usuario_id == usuario_id
+        out.append((
+            l, es_dueno, "dueno" if es_dueno else (rol or "editor"),
+            int(l.total_refs), int(l.total_comprado), int(l.total_pendiente),
+        ))
+    # solo una página vacía necesita distinguir "fin" de "cursor desconocido"
+    if not out and after is not None and not db.query(Lista.id).filter(Lista.id == after).first():
+        raise ValueError("CURSOR_INVALIDO")
     return out
 
+def firma_listas(db: Session, usuario_id) -> str:
+    """
+    Huella de las listas visibles para el usuario (ids, versiones y roles) sin
+    tocar `lista_item`: cambia con cualquier escritura en alguna de ellas.
+    """
+    clave = func.concat(Lista.id, ":", Lista.version, ":", func.coalesce(ListaUsuario.rol, ""))
+    row = db.query(func.count(Lista.id), func.md5(func.string_agg(clave, aggregate_order_by(",", Lista.id))))\
+        .outerjoin(ListaUsuario, and_(ListaUsuario.id == Lista.id, ListaUsuario.usuario_id == usuario_id))\
+        .filter(Lista.id.in_(_ids_visibles(usuario_id)))\
+        .first()
+    return f"{row[0]}-{row[1] or ''}"
+
 def crear_lista(db: Session, usuario_id, nombre: str, foto: str | None):
     l = Lista(nombre=nombre.strip(), foto=foto, usuario_id=usuario_id)
     db.add(l)
@@ -59,132 +193,794 @@ def crear_lista(db: Session, usuario_id, nombre: str, foto: str | None):
 
 def borrar_lista(db: Session, lista_id: UUID):
     db.query(Lista).filter(Lista.id == lista_id).delete()
+    permisos.invalidar(db, lista_id)
+    # tombstone de la lista; los de sus items ya no sirven
+    db.query(ListaItemBorrado).filter(ListaItemBorrado.lista_id == lista_id).delete()
+    db.add(ListaBorrada(id=lista_id))
+    publicar(db, lista_id, "lista_borrada")
     return True
 
+def _productos_cambiaron(db: Session):
+    # productos nuevos: caché local de prefijos ya; catálogo de todos los
+    # workers (recarga completa) al hacer commit
+    cache_productos.limpiar()
+    invalidar_catalogo(db, "productos")
+
 def buscar_productos(db: Session, q: str, limit: int = 10):
-    qn = a_mayusculas(q)
-    rows = db.query(Producto).filter(Producto.nombre.ilike(f"%{qn}%")).order_by(Producto.nombre.asc()).limit(limit).all()
-    out = []
-    for p in rows:
-        pp = db.query(ProductoPrecio).filter(ProductoPrecio.producto_id == p.id).first()
-        unidad_ultima = (
-            db.query(ListaItem.unidad_id, Unidad.nombre)
-            .outerjoin(Unidad, Unidad.id == ListaItem.unidad_id)
-            .filter(
-                ListaItem.producto_id == p.id,
-                ListaItem.unidad_id.isnot(None),
-            )
-            .order_by(ListaItem.updated_at.desc(), ListaItem.created_at.desc())
-            .first()
-        )
-        uid = unidad_ultima[0] if unidad_ultima else None
-        unom = unidad_ultima[1] if unidad_ultima else None
-        out.append((p, pp.precio if pp else 0, uid, unom))
-    return out
+    """
+    Autocomplete: productos cuyo nombre normalizado contiene `q` (índice
+    trigram), prefijos primero, con último precio y última unidad en una
+    sola consulta. Devuelve (id, nombre, precio, unidad_id, unidad).
+    """
+    qn = normalizar_busqueda(q)
+    filas = catalogo.buscar_productos(qn, limit)
+    if filas is None:
+        filas = cache_productos.obtener(qn, limit)
+    if filas is None:
+        es_prefijo = Producto.nombre_norm.startswith(qn, autoescape=True)
+        top = db.query(Producto.id, Producto.nombre, Producto.nombre_norm, es_prefijo.label("es_prefijo"))
+        if qn:
+            top = top.filter(Producto.nombre_norm.contains(qn, autoescape=True))
+        top = top.order_by(es_prefijo.desc(), Producto.nombre.asc()).limit(limit).subquery()
 
-def crear_o_obtener_producto(db: Session, usuario_id, nombre: str) -> Producto:
-    n = a_mayusculas(nombre)
-    p = db.query(Producto).filter(Producto.nombre == n).first()
-    if p:
-        return p
-    p = Producto(nombre=n, usuario_id=usuario_id)
-    db.add(p)
-    db.flush()
-    return p
+        filas = db.query(
+            top.c.nombre, top.c.nombre_norm, top.c.id,
+            func.coalesce(ProductoPrecio.precio, 0), ProductoUnidadUltima.unidad_id, Unidad.nombre,
+        )\
+            .outerjoin(ProductoPrecio, ProductoPrecio.producto_id == top.c.id)\
+            .outerjoin(ProductoUnidadUltima, ProductoUnidadUltima.producto_id == top.c.id)\
+            .outerjoin(Unidad, Unidad.id == ProductoUnidadUltima.unidad_id)\
+            .order_by(top.c.es_prefijo.desc(), top.c.nombre.asc())\
+            .all()
+        filas = [tuple(r) for r in filas]
+        cache_productos.guardar(qn, limit, filas)
+    return [(pid, nombre, int(precio), uid, unom) for nombre, _, pid, precio, uid, unom in filas]
 
-def registrar_ultimo_precio(db: Session, producto_id: int, precio: int, usuario_id):
-    if precio is None:
-        return
-    if precio < 0:
+def _upsert_productos(usuario_id, nombres: list[str]):
+    """
+    INSERT ... ON CONFLICT sobre la clave única `nombre_norm` (mayúsculas sin
+    tildes): dos usuarios que agregan "ARROZ" a la vez obtienen el mismo id.
+    El DO UPDATE no cambia nada; existe para que RETURNING traiga también las
+    filas que ya estaban. `creado` = la fila es nueva (xmax = 0).
+    """
+    stmt = pg_insert(Producto).values([{"nombre": n, "usuario_id": usuario_id} for n in nombres])
+    return stmt.on_conflict_do_update(
+        index_elements=[Producto.nombre_norm],
+        set_={"nombre": Producto.nombre},
+    ).returning(Producto.id, Producto.nombre, Producto.nombre_norm, literal_column("xmax = 0").label("creado"))
+
+def crear_o_obtener_producto(db: Session, usuario_id, nombre: str):
+    """Fila (id, nombre, nombre_norm, creado); `nombre` es el ya registrado si existía."""
+    row = db.execute(_upsert_productos(usuario_id, [a_mayusculas(nombre)])).one()
+    if row.creado:
+        _productos_cambiaron(db)
+    return row
+
+# resume las filas de la CTE `obs` (producto_id, precio, registrado_en) recién
+# insertadas en el historial; se compone dentro de otras sentencias
+_RESUMIR_OBS = """
+INSERT INTO producto_precio_resumen AS r
+  (producto_id, periodo, inicio, n, minimo, maximo, mediana, ultimo, ultimo_en, conteos)
+SELECT obs.producto_id, p.periodo,
+       date_trunc(p.unidad, obs.registrado_en AT TIME ZONE precios_zona())::date,
+       1, obs.precio, obs.precio, obs.precio, obs.precio, obs.registrado_en,
+       jsonb_build_object(obs.precio::text, 1)
+FROM obs CROSS JOIN (VALUES ('dia', 'day'), ('semana', 'week')) AS p(periodo, unidad)
+ON CONFLICT (producto_id, periodo, inicio) DO UPDATE SET
+  n = r.n + 1,
+  minimo = LEAST(r.minimo, EXCLUDED.minimo),
+  maximo = GREATEST(r.maximo, EXCLUDED.maximo),
+  ultimo = CASE WHEN EXCLUDED.ultimo_en >= r.ultimo_en THEN EXCLUDED.ultimo ELSE r.ultimo END,
+  ultimo_en = GREATEST(r.ultimo_en, EXCLUDED.ultimo_en),
+  conteos = precio_conteos_sumar(r.conteos, EXCLUDED.ultimo),
+  mediana = precio_conteos_mediana(precio_conteos_sumar(r.conteos, EXCLUDED.ultimo))
+"""
+
+_SQL_HISTORIAL_PRECIOS = text("""
+WITH obs AS (
+  INSERT INTO producto_precio_historial (producto_id, precio, usuario_id)
+  SELECT o.producto_id, o.precio, CAST(:usuario_id AS uuid)
+  FROM unnest(CAST(:productos AS bigint[]), CAST(:precios AS bigint[])) AS o(producto_id, precio)
+  RETURNING producto_id, precio, registrado_en
+)""" + _RESUMIR_OBS)
+
+def registrar_historial_precios(db: Session, usuario_id, precios: dict):
+    """
+    Agrega observaciones {producto_id: precio} al historial y actualiza los
+    resúmenes por día y semana en la misma sentencia (sin releer el historial).
+    """
+    precios = {pid: int(p) for pid, p in precios.items() if p is not None and p > 0}
+    if not precios:
         return
-    pp = db.query(ProductoPrecio).filter(ProductoPrecio.producto_id == producto_id).first()
-    if not pp:
-        pp = ProductoPrecio(producto_id=producto_id, precio=precio, usuario_id=usuario_id)
-        db.add(pp)
-    else:
-        pp.precio = precio
-        pp.usuario_id = usuario_id
-    return pp
-
-def item_tocados(db: Session, item_id):
-    # devuelve lista de nombres (para circulitos)
-    rows = db.query(Usuario.nombre, Usuario.correo)\
-        .join(ItemActividad, ItemActividad.usuario_id == Usuario.id)\
-        .filter(ItemActividad.id == item_id)\
+    db.execute(_SQL_HISTORIAL_PRECIOS, {
+        "usuario_id": usuario_id,
+        "productos": list(precios), "precios": list(precios.values()),
+    })
+
+def serie_precios(db: Session, producto_id: int, periodo: str, desde: date):
+    return db.query(
+        ProductoPrecioResumen.inicio, ProductoPrecioResumen.n,
+        ProductoPrecioResumen.minimo, ProductoPrecioResumen.mediana,
+        ProductoPrecioResumen.maximo, ProductoPrecioResumen.ultimo,
+    )\
+        .filter(
+            ProductoPrecioResumen.producto_id == producto_id,
+            ProductoPrecioResumen.periodo == periodo,
+            ProductoPrecioResumen.inicio >= desde,
+        )\
+        .order_by(ProductoPrecioResumen.inicio.asc())\
         .all()
-    res = []
-    for n, c in rows:
-        res.append(n or c.split("@")[0].upper())
-    return res[:6]
-
-def agregar_item(db: Session, lista_id: UUID, usuario_id, producto: str, cantidad, unidad_id, precio: int):
-    p = crear_o_obtener_producto(db, usuario_id, producto)
-    # Evitar duplicado por regla
-    existente = db.query(ListaItem).filter(ListaItem.lista_id == lista_id, ListaItem.producto_id == p.id).first()
-    if existente:
-        raise ValueError("ITEM_DUPLICADO")
 
-    it = ListaItem(
-        lista_id=lista_id,
-        producto_id=p.id,
-        unidad_id=unidad_id,
-        cantidad=cantidad,
-        precio=precio or 0,
-        comprado=False,
-        usuario_id=usuario_id,
-        updated_by=usuario_id,
+def costo_estimado(db: Session, lista_id: UUID, usuario_id):
+    """
+    Items de la lista con el resumen de la semana más reciente de su producto
+    (mediana, mínimo y máximo), en una consulta por el índice del resumen.
+    """
+    if not rol_en_lista(db, lista_id, usuario_id):
+        raise ValueError("SIN_ACCESO")
+    semana = select(
+        ProductoPrecioResumen.mediana, ProductoPrecioResumen.minimo,
+        ProductoPrecioResumen.maximo, ProductoPrecioResumen.inicio,
+    )\
+        .where(
+            ProductoPrecioResumen.producto_id == ListaItem.producto_id,
+            ProductoPrecioResumen.periodo == "semana",
+        )\
+        .order_by(ProductoPrecioResumen.inicio.desc())\
+        .limit(1)\
+        .lateral("semana")
+    return db.query(
+        ListaItem.id, ListaItem.producto_id, Producto.nombre, ListaItem.cantidad, ListaItem.precio,
+        ListaItem.comprado, semana.c.mediana, semana.c.minimo, semana.c.maximo, semana.c.inicio,
+    )\
+        .join(Producto, Producto.id == ListaItem.producto_id)\
+        .outerjoin(semana, true())\
+        .filter(ListaItem.lista_id == lista_id)\
+        .order_by(Producto.nombre.asc())\
+        .all()
+
+def backfill_unidad_ultima(db: Session) -> int:
+    # recalcula la proyección completa desde lista_item (última unidad por producto)
+    ultima = select(ListaItem.producto_id, ListaItem.unidad_id, ListaItem.updated_by, ListaItem.updated_at)\
+        .where(ListaItem.unidad_id.isnot(None))\
+        .distinct(ListaItem.producto_id)\
+        .order_by(ListaItem.producto_id, ListaItem.updated_at.desc(), ListaItem.created_at.desc())
+    stmt = pg_insert(ProductoUnidadUltima).from_select(
+        ["producto_id", "unidad_id", "usuario_id", "updated_at"], ultima,
     )
-    db.add(it)
-    db.flush()
+    filas = db.execute(stmt.on_conflict_do_update(
+        index_elements=[ProductoUnidadUltima.producto_id],
+        set_={
+            "unidad_id": stmt.excluded.unidad_id,
+            "usuario_id": stmt.excluded.usuario_id,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ).returning(ProductoUnidadUltima.producto_id)).all()
+    _productos_cambiaron(db)
+    return len(filas)
+
+def _nombre_tocado(nombre, correo) -> str:
+    return nombre or correo.split("@")[0].upper()
+
+# avanza el cursor de las listas donde el usuario tocó items y marca esos
+# items como cambiados: el ETag del detalle (versión de la lista) y /cambios
+# reflejan su nombre nuevo en "tocado_por". Listas bloqueadas en orden de id.
+_SQL_NOMBRE_USUARIO = text("""
+WITH afectadas AS (
+  SELECT id FROM lista
+  WHERE id IN (
+    SELECT li.lista_id FROM item ia JOIN lista_item li ON li.id = ia.id
+    WHERE ia.usuario_id = CAST(:usuario_id AS uuid)
+  )
+  ORDER BY id
+  FOR UPDATE
+), listas AS (
+  UPDATE lista l SET version = l.version + 1 FROM afectadas a WHERE l.id = a.id
+  RETURNING l.id, l.version
+)
+UPDATE lista_item li SET cambio = l.version
+FROM listas l, item ia
+WHERE li.lista_id = l.id AND ia.id = li.id AND ia.usuario_id = CAST(:usuario_id AS uuid)
+""")
+
+def nombre_usuario_cambiado(db: Session, usuario_id):
+    db.execute(_SQL_NOMBRE_USUARIO, {"usuario_id": usuario_id})
+
+def items_tocados(db: Session, lista_id: UUID, maximo: int = 6, item_ids=None) -> dict:
+    # nombres (para circulitos) de todos los items de la lista en una sola consulta
+    rn = func.row_number().over(
+        partition_by=ItemActividad.id,
+        order_by=(ItemActividad.updated_at.asc(), ItemActividad.usuario_id.asc()),
+    ).label("rn")
+    sub = db.query(ItemActividad.id.label("item_id"), Usuario.nombre, Usuario.correo, rn)\
+        .join(Usuario, Usuario.id == ItemActividad.usuario_id)\
+        .join(ListaItem, ListaItem.id == ItemActividad.id)\
+        .filter(ListaItem.lista_id == lista_id)
+    if item_ids is not None:
+        sub = sub.filter(ItemActividad.id.in_(item_ids))
+    sub = sub.subquery()
+    rows = db.query(sub.c.item_id, sub.c.nombre, sub.c.correo)\
+        .filter(sub.c.rn <= maximo)\
+        .order_by(sub.c.item_id, sub.c.rn)\
+        .all()
+    res = {}
+    for item_id, n, c in rows:
+        res.setdefault(item_id, []).append(_nombre_tocado(n, c))
+    return res
+
+def _lista_y_rol(db: Session, lista_id: UUID, usuario_id):
+    row = db.query(Lista, ListaUsuario.rol)\
+        .outerjoin(ListaUsuario, and_(ListaUsuario.id == Lista.id, ListaUsuario.usuario_id == usuario_id))\
+        .filter(Lista.id == lista_id)\
+        .first()
+    if not row:
+        return None, None
+    l, rol = row
+    if l.usuario_id == usuario_id:
+        rol = "dueno"
+    k = permisos.clave(lista_id, usuario_id)
+    permisos.memo(db)[k] = rol
+    cache_roles.guardar(k, rol)
+    return l, rol
+
+def _items_lista(db: Session, lista_id: UUID, desde: int | None = None):
+    q = db.query(ListaItem, Producto.nombre, Unidad.nombre)\
+        .join(Producto, Producto.id == ListaItem.producto_id)\
+        .outerjoin(Unidad, Unidad.id == ListaItem.unidad_id)\
+        .filter(ListaItem.lista_id == lista_id)
+    if desde is not None:
+        q = q.filter(ListaItem.cambio > desde)
+    return q.order_by(Producto.nombre.asc()).all()
+
+def version_lista(db: Session, lista_id: UUID, usuario_id):
+    """(lista, rol) con una sola consulta; para ETag antes de cargar items."""
+    l, rol = _lista_y_rol(db, lista_id, usuario_id)
+    if not rol:
+        raise ValueError("SIN_ACCESO")
+    return l, rol
+
+def detalle_lista(db: Session, lista_id: UUID, usuario_id, precargada: tuple | None = None):
+    """
+    Carga el detalle completo de una lista en un número fijo de consultas:
+    lista + rol (con totales), items con producto/unidad y "tocado_por" de
+    todos los items. `precargada` es el (lista, rol) de `version_lista`.
+    """
+    l, rol = precargada or _lista_y_rol(db, lista_id, usuario_id)
+    if not rol:
+        raise ValueError("SIN_ACCESO")
+
+    items = _items_lista(db, lista_id)
+    tocados = items_tocados(db, lista_id) if items else {}
+
+    totales = (int(l.total_refs), int(l.total_comprado), int(l.total_pendiente))
+    return l, rol, items, tocados, totales
+
+def cambios_lista(db: Session, lista_id: UUID, usuario_id, desde: int):
+    """
+    Cambios de la lista posteriores al cursor `desde`: items modificados o
+    agregados e ids de items borrados. Si los tombstones de ese rango ya se
+    purgaron, `completo=True` y se devuelven todos los items.
+    Devuelve None si la lista fue borrada.
+    """
+    l, rol = _lista_y_rol(db, lista_id, usuario_id)
+    if not l:
+        if db.query(ListaBorrada.id).filter(ListaBorrada.id == lista_id).first():
+            return None
+        raise ValueError("SIN_ACCESO")
+    if not rol:
+        raise ValueError("SIN_ACCESO")
+
+    completo = desde < int(l.cambio_purgado)
+    items, borrados, tocados = [], [], {}
+    if completo or desde < int(l.version):
+        items = _items_lista(db, lista_id, None if completo else desde)
+        if items:
+            tocados = items_tocados(db, lista_id, item_ids=[it.id for it, _, _ in items])
+        if not completo:
+            borrados = [x[0] for x in db.query(ListaItemBorrado.id).filter(
+                ListaItemBorrado.lista_id == lista_id, ListaItemBorrado.cambio > desde,
+            ).all()]
+    return l, rol, completo, items, tocados, borrados
+
+def purgar_tombstones(db: Session, dias: int) -> int:
+    """
+    Borra tombstones con más de `dias` días. En cada lista afectada se anota
+    el mayor cursor purgado: los clientes con un cursor anterior reciben la
+    lista completa.
+    """
+    res = db.execute(text("""
+WITH purgados AS (
+  DELETE FROM lista_item_borrado
+  WHERE borrado_at < NOW() - make_interval(days => :dias)
+  RETURNING lista_id, cambio
+)
+UPDATE lista l
+SET cambio_purgado = GREATEST(l.cambio_purgado, p.maximo)
+FROM (SELECT lista_id, MAX(cambio) AS maximo FROM purgados GROUP BY lista_id) p
+WHERE p.lista_id = l.id
+    """), {"dias": dias})
+    db.query(ListaBorrada).filter(ListaBorrada.borrada_at < func.now() - timedelta(days=dias)).delete()
+    return res.rowcount
 
-    # actividad
-    act = ItemActividad(id=it.id, usuario_id=usuario_id, accion="agrego")
-    db.add(act)
+# Escrituras de un item en una sola sentencia: CTEs encadenadas que bloquean,
+# ajustan totales y cursor de la lista, escriben el item, la actividad y las
+# proyecciones del producto. `publicar` es el segundo viaje a la base.
+# Como en ajustar_totales, la fila de la lista se bloquea antes que el item y
+# el producto: cada CTE lee de la anterior, así el orden no queda al planner.
+_SQL_AGREGAR_ITEM = """
+WITH totales AS (
+  UPDATE lista SET
+    total_refs = total_refs + 1,
+    total_pendiente = total_pendiente + CAST(:precio AS bigint) * CAST(:cantidad AS numeric),
+    version = version + 1
+  WHERE id = CAST(:lista_id AS uuid)
+  RETURNING total_refs, total_comprado, total_pendiente, version
+), prod AS (
+  -- get-or-create sobre la clave única nombre_norm (ver _upsert_productos)
+  INSERT INTO producto (nombre, usuario_id) SELECT :nombre, CAST(:usuario_id AS uuid) FROM totales
+  ON CONFLICT (nombre_norm) DO UPDATE SET nombre = producto.nombre
+  RETURNING id, nombre, xmax = 0 AS creado
+), nuevo AS (
+  INSERT INTO lista_item (id, lista_id, producto_id, unidad_id, cantidad, precio, comprado, usuario_id, updated_by, cambio)
+  SELECT CAST(:item_id AS uuid), CAST(:lista_id AS uuid), prod.id, CAST(:unidad_id AS smallint),
+         CAST(:cantidad AS numeric), CAST(:precio AS bigint), false,
+         CAST(:usuario_id AS uuid), CAST(:usuario_id AS uuid), totales.version
+  FROM prod, totales
+  ON CONFLICT (lista_id, producto_id) DO NOTHING
+  RETURNING id, producto_id, version
+), actividad AS (
+  INSERT INTO item (id, usuario_id, accion) SELECT id, CAST(:usuario_id AS uuid), 'agrego' FROM nuevo
+)"""
 
-    if precio and precio > 0:
-        registrar_ultimo_precio(db, p.id, precio, usuario_id)
+_SQL_PATCH_ITEM = """
+WITH bloqueo AS (
+  SELECT id FROM lista WHERE id = CAST(:lista_id AS uuid) FOR UPDATE
+), viejo AS (
+  SELECT id, producto_id, precio, cantidad, comprado, unidad_id, updated_at, version,
+         COALESCE(CAST(:precio AS bigint), precio) AS precio_n,
+         COALESCE(CAST(:cantidad AS numeric), cantidad) AS cantidad_n,
+         COALESCE(CAST(:comprado AS boolean), comprado) AS comprado_n,
+         COALESCE(CAST(:unidad_id AS smallint), unidad_id) AS unidad_n
+  FROM lista_item
+  WHERE id = CAST(:item_id AS uuid) AND lista_id = (SELECT id FROM bloqueo)
+  FOR UPDATE
+), vigente AS (
+  -- If-Match: versión del item que vio el cliente (también en la cola offline)
+  SELECT * FROM viejo
+  WHERE CAST(:version AS bigint) IS NULL OR version = CAST(:version AS bigint)
+), totales AS (
+  UPDATE lista l SET
+    total_comprado = l.total_comprado + d.comprado,
+    total_pendiente = l.total_pendiente + d.pendiente,
+    version = l.version + 1
+  FROM (
+    SELECT CASE WHEN comprado_n THEN precio_n * cantidad_n ELSE 0 END
+         - CASE WHEN comprado THEN precio * cantidad ELSE 0 END AS comprado,
+           CASE WHEN comprado_n THEN 0 ELSE precio_n * cantidad_n END
+         - CASE WHEN comprado THEN 0 ELSE precio * cantidad END AS pendiente
+    FROM vigente
+  ) d
+  WHERE l.id = CAST(:lista_id AS uuid)
+  RETURNING l.total_refs, l.total_comprado, l.total_pendiente, l.version
+), nuevo AS (
+  UPDATE lista_item li SET
+    precio = v.precio_n, cantidad = v.cantidad_n, comprado = v.comprado_n, unidad_id = v.unidad_n,
+    updated_by = CAST(:usuario_id AS uuid), updated_at = NOW(), cambio = t.version, version = li.version + 1
+  FROM vigente v, totales t
+  WHERE li.id = v.id
+  RETURNING li.id, li.producto_id, li.version
+)"""
 
-    return it, p
+_CTE_ACTIVIDAD = """, actividad AS (
+  INSERT INTO item (id, usuario_id, accion) SELECT id, CAST(:usuario_id AS uuid), :accion FROM nuevo
+  ON CONFLICT (id, usuario_id) DO UPDATE SET accion = EXCLUDED.accion, updated_at = NOW()
+)"""
 
-def patch_item(db: Session, lista_id: UUID, item_id: UUID, usuario_id, patch: dict):
-    it = db.query(ListaItem).filter(ListaItem.id == item_id, ListaItem.lista_id == lista_id).first()
-    if not it:
+# {fuente}: filas (producto_id, precio) del producto del item escrito
+_CTE_ULTIMO_PRECIO = """, ultimo_precio AS (
+  INSERT INTO producto_precio (producto_id, precio, usuario_id)
+  SELECT producto_id, precio, CAST(:usuario_id AS uuid) FROM ({fuente}) f
+  ON CONFLICT (producto_id) DO UPDATE SET
+    precio = EXCLUDED.precio, usuario_id = EXCLUDED.usuario_id, updated_at = NOW()
+), obs AS (
+  INSERT INTO producto_precio_historial (producto_id, precio, usuario_id)
+  SELECT producto_id, precio, CAST(:usuario_id AS uuid) FROM ({observacion}) f
+  RETURNING producto_id, precio, registrado_en
+), resumen AS ({resumir})"""
+
+_CTE_ULTIMA_UNIDAD = """, ultima_unidad AS (
+  INSERT INTO producto_unidad_ultima (producto_id, unidad_id, usuario_id)
+  SELECT producto_id, unidad_id, CAST(:usuario_id AS uuid) FROM ({fuente}) f
+  ON CONFLICT (producto_id) DO UPDATE SET
+    unidad_id = EXCLUDED.unidad_id, usuario_id = EXCLUDED.usuario_id, updated_at = NOW()
+)"""
+
+def _aviso_catalogo(nuevo: str, ultimos: str, producto: str, precio: str, unidad: str) -> str:
+    # pg_notify de catalogo.invalidar ("productos" si `nuevo`) o de
+    # catalogo.avisar_ultimos (si `ultimos`) dentro de la misma sentencia
+    return f"""CASE
+         WHEN {nuevo} THEN pg_notify(:canal_catalogo, 'productos')
+         WHEN {ultimos} THEN pg_notify(:canal_catalogo, json_build_array(json_build_array({producto}, {precio}, {unidad}))::text)
+       END AS aviso"""
+
+def agregar_item(db: Session, lista_id: UUID, usuario_id, producto: str, cantidad, unidad_id, precio: int, item_id: UUID | None = None):
+    """
+    Crea (si hace falta) el producto y agrega el item en una sentencia.
+    Devuelve la fila (id, producto_id, version); ITEM_DUPLICADO si ya está.
+    """
+    nombre = a_mayusculas(producto)
+    precio = int(precio or 0)
+    sql = _SQL_AGREGAR_ITEM
+    if precio > 0:
+        sql += _CTE_ULTIMO_PRECIO.format(
+            fuente="SELECT producto_id, CAST(:precio AS bigint) AS precio FROM nuevo",
+            observacion="SELECT producto_id, CAST(:precio AS bigint) AS precio FROM nuevo",
+            resumir=_RESUMIR_OBS,
+        )
+    if unidad_id is not None:
+        sql += _CTE_ULTIMA_UNIDAD.format(fuente="SELECT producto_id, CAST(:unidad_id AS smallint) AS unidad_id FROM nuevo")
+    toca_catalogo = precio > 0 or unidad_id is not None
+    aviso = _aviso_catalogo(
+        "nuevo.id IS NOT NULL AND prod.creado", "nuevo.id IS NOT NULL" if toca_catalogo else "false",
+        "prod.id", "NULLIF(CAST(:precio AS bigint), 0)", "CAST(:unidad_id AS smallint)",
+    )
+    sql += f"""
+SELECT nuevo.id, prod.id AS producto_id, prod.nombre AS producto, nuevo.version,
+       t.total_refs, t.total_comprado, t.total_pendiente, t.version AS cursor,
+       prod.creado AS producto_nuevo,
+       {aviso}
+FROM (SELECT 1) uno LEFT JOIN prod ON true LEFT JOIN nuevo ON true LEFT JOIN totales t ON true"""
+    row = db.execute(text(sql), {
+        "nombre": nombre, "usuario_id": usuario_id, "lista_id": lista_id, "item_id": item_id or uuid.uuid4(),
+        "unidad_id": unidad_id, "cantidad": cantidad, "precio": precio,
+        "canal_catalogo": CANAL_CATALOGO,
+    }).one()
+    if row.cursor is None:
         raise ValueError("NO_EXISTE")
+    if row.id is None:
+        # el UPDATE de totales se revierte con la transacción (o el SAVEPOINT de sync)
+        raise ValueError("ITEM_DUPLICADO")
+    if toca_catalogo or row.producto_nuevo:
+        cache_productos.limpiar()
 
+    totales = {
+        "total_refs": int(row.total_refs), "total_comprado": int(row.total_comprado),
+        "total_pendiente": int(row.total_pendiente), "cursor": int(row.cursor),
+    }
+    publicar(db, lista_id, "item_agregado", usuario_id=usuario_id, totales=totales, item={
+        "id": row.id, "producto_id": row.producto_id, "producto": row.producto, "unidad_id": unidad_id,
+        "cantidad": cantidad, "precio": precio, "comprado": False, "version": int(row.version),
+    })
+    return row
+
+def patch_item(db: Session, lista_id: UUID, item_id: UUID, usuario_id, patch: dict, version: int | None = None):
+    """
+    Aplica `patch` al item en una sentencia. Con `version` (If-Match, o la
+    que lleva cada op de la cola offline) falla con CONFLICTO si el item ya
+    no está en esa versión.
+    Devuelve la fila (id, producto_id, version).
+    """
+    cambios = {k: v for k, v in patch.items() if k in ("cantidad", "unidad_id", "precio", "comprado") and v is not None}
     accion = None
-    if patch.get("cantidad") is not None:
-        it.cantidad = patch["cantidad"]
-        accion = "cant"
-    if patch.get("unidad_id") is not None:
-        it.unidad_id = patch["unidad_id"]
-    if patch.get("precio") is not None:
-        it.precio = patch["precio"]
-        accion = "precio"
-        if it.precio >= 0:
-            registrar_ultimo_precio(db, it.producto_id, int(it.precio), usuario_id)
-    if patch.get("comprado") is not None:
-        it.comprado = patch["comprado"]
-        accion = "comprado"
-
-    it.updated_by = usuario_id
-    it.updated_at = func.now()
+    for campo, nombre in (("cantidad", "cant"), ("precio", "precio"), ("comprado", "comprado")):
+        if campo in cambios:
+            accion = nombre
 
+    sql = _SQL_PATCH_ITEM
     if accion:
-        # UPSERT actividad (PK compuesta item_id + usuario_id)
-        act = db.query(ItemActividad).filter(ItemActividad.id == item_id, ItemActividad.usuario_id == usuario_id).first()
-        if not act:
-            act = ItemActividad(id=item_id, usuario_id=usuario_id, accion=accion)
-            db.add(act)
-        else:
-            act.accion = accion
-            act.updated_at = func.now()
+        sql += _CTE_ACTIVIDAD
+    avisos, precio_aviso, unidad_aviso = [], "NULL", "NULL"
+    if "precio" in cambios:
+        sql += _CTE_ULTIMO_PRECIO.format(
+            fuente="SELECT v.producto_id, v.precio_n AS precio FROM vigente v JOIN nuevo ON true",
+            # reenvíos del mismo precio (p. ej. la cola offline) no son observaciones nuevas
+            observacion="SELECT v.producto_id, v.precio_n AS precio FROM vigente v JOIN nuevo ON true"
+                        " WHERE v.precio_n <> v.precio AND v.precio_n > 0",
+            resumir=_RESUMIR_OBS,
+        )
+        avisos.append("true")
+        precio_aviso = "viejo.precio_n"
+    if "unidad_id" in cambios:
+        sql += _CTE_ULTIMA_UNIDAD.format(
+            fuente="SELECT v.producto_id, v.unidad_n AS unidad_id FROM vigente v JOIN nuevo ON true"
+                   " WHERE v.unidad_n IS DISTINCT FROM v.unidad_id",
+        )
+        avisos.append("viejo.unidad_n IS DISTINCT FROM viejo.unidad_id")
+        unidad_aviso = "CASE WHEN viejo.unidad_n IS DISTINCT FROM viejo.unidad_id THEN viejo.unidad_n END"
+    condicion = f"nuevo.id IS NOT NULL AND ({' OR '.join(avisos)})" if avisos else "false"
+    sql += f"""
+SELECT viejo.id IS NOT NULL AS existe, nuevo.id, nuevo.producto_id, nuevo.version,
+       t.total_refs, t.total_comprado, t.total_pendiente, t.version AS cursor,
+       {condicion} AS catalogo,
+       {_aviso_catalogo("false", condicion, "viejo.producto_id", precio_aviso, unidad_aviso)}
+FROM (SELECT 1) uno LEFT JOIN viejo ON true LEFT JOIN nuevo ON true LEFT JOIN totales t ON true"""
+    row = db.execute(text(sql), {
+        "item_id": item_id, "lista_id": lista_id, "usuario_id": usuario_id, "accion": accion,
+        "cantidad": cambios.get("cantidad"), "unidad_id": cambios.get("unidad_id"),
+        "precio": cambios.get("precio"), "comprado": cambios.get("comprado"),
+        "version": version, "canal_catalogo": CANAL_CATALOGO,
+    }).one()
+    if not row.existe:
+        raise ValueError("NO_EXISTE")
+    if row.id is None:
+        raise ValueError("CONFLICTO")
+    if row.catalogo:
+        cache_productos.limpiar()
 
-    return it
+    totales = {
+        "total_refs": int(row.total_refs), "total_comprado": int(row.total_comprado),
+        "total_pendiente": int(row.total_pendiente), "cursor": int(row.cursor),
+    }
+    publicar(db, lista_id, "item_actualizado", usuario_id=usuario_id, totales=totales,
+             item={"id": row.id, **cambios, "version": int(row.version)})
+    return row
 
-def borrar_item(db: Session, lista_id: UUID, item_id: UUID):
-    db.query(ListaItem).filter(ListaItem.id == item_id, ListaItem.lista_id == lista_id).delete()
+def borrar_item(db: Session, lista_id: UUID, item_id: UUID, version: int | None = None):
+    # bloquea la lista antes que el item (ver ajustar_totales)
+    if not ajustar_totales(db, lista_id, avanzar=False):
+        return True
+    cond = [ListaItem.id == item_id, ListaItem.lista_id == lista_id]
+    if version is not None:
+        cond.append(ListaItem.version == version)
+    row = db.execute(
+        delete(ListaItem)
+        .where(*cond)
+        .returning(ListaItem.precio, ListaItem.cantidad, ListaItem.comprado)
+    ).first()
+    if not row and version is not None:
+        existe = db.query(ListaItem.id).filter(ListaItem.id == item_id, ListaItem.lista_id == lista_id).first()
+        if existe:
+            raise ValueError("CONFLICTO")
+    if row:
+        tc, tp = _aporte_item(row.precio, row.cantidad, row.comprado)
+        totales = ajustar_totales(db, lista_id, refs=-1, comprado=-tc, pendiente=-tp)
+        if totales:
+            db.add(ListaItemBorrado(id=item_id, lista_id=lista_id, cambio=totales["cursor"]))
+        publicar(db, lista_id, "item_borrado", totales=totales, item={"id": item_id})
     return True
 
+def items_desde_texto(texto: str) -> list[dict]:
+    """
+    Lista pegada como texto: un producto por línea, con cantidad opcional al
+    inicio ("2 ARROZ", "- 3 LECHE"). Ignora líneas vacías y viñetas.
+    """
+    out = []
+    for linea in (texto or "").splitlines():
+        linea = linea.strip().lstrip("-*•·").strip()
+        if not linea:
+            continue
+        partes = linea.split(maxsplit=1)
+        cantidad = Decimal(1)
+        if len(partes) == 2:
+            try:
+                n = Decimal(partes[0].replace(",", "."))
+            except ArithmeticError:
+                n = None
+            if n is not None and n.is_finite():
+                cantidad = n if n > 0 else Decimal(1)
+                linea = partes[1]
+        out.append({"producto": linea[:200], "cantidad": cantidad, "unidad_id": None, "precio": 0})
+    return out
+
+# clave de cada nombre con la expresión de la columna generada nombre_norm;
+# un nombre por clave (ON CONFLICT DO UPDATE no toca una fila dos veces),
+# ordenados por clave para bloquear siempre en el mismo orden
+_SQL_OBTENER_O_CREAR_PRODUCTOS = """
+WITH entrada AS (
+  SELECT nombre, {clave} AS clave FROM unnest(CAST(:nombres AS text[])) AS e(nombre)
+), up AS (
+  INSERT INTO producto (nombre, usuario_id)
+  SELECT DISTINCT ON (clave) nombre, CAST(:usuario_id AS uuid) FROM entrada ORDER BY clave, nombre
+  ON CONFLICT (nombre_norm) DO UPDATE SET nombre = producto.nombre
+  RETURNING id, nombre_norm, xmax = 0 AS creado
+)
+SELECT e.nombre, up.id, up.creado FROM entrada e JOIN up ON up.nombre_norm = e.clave
+""".format(clave=Producto.__table__.c.nombre_norm.computed.sqltext.text)
+
+def _obtener_o_crear_productos(db: Session, usuario_id, nombres: list[str]) -> dict:
+    """
+    nombre -> id con un solo upsert. Cada nombre se empareja con su fila por
+    el nombre_norm que devuelve la base, no por normalizar_busqueda (que
+    podría no coincidir): nombres con la misma clave reciben el mismo id.
+    """
+    rows = db.execute(text(_SQL_OBTENER_O_CREAR_PRODUCTOS), {"nombres": nombres, "usuario_id": usuario_id}).all()
+    if any(r.creado for r in rows):
+        _productos_cambiaron(db)
+    return {r.nombre: r.id for r in rows}
+
+def agregar_items_lote(db: Session, lista_id: UUID, usuario_id, items: list[dict]):
+    """
+    Agrega muchos items en pocas sentencias: productos, items, actividad,
+    precios y unidades en bloque, y un solo ajuste de totales.
+    Devuelve ([(item_id, producto)], [productos duplicados]).
+    """
+    duplicados, unicos, claves = [], {}, set()
+    for x in items:
+        nombre = a_mayusculas(x["producto"])
+        if not nombre:
+            continue
+        clave = normalizar_busqueda(nombre)
+        if clave in claves:
+            duplicados.append(nombre)
+        else:
+            claves.add(clave)
+            unicos[nombre] = x
+    if not unicos:
+        return [], duplicados
+
+    # bloquea la lista y toma el cursor antes de insertar
+    t = ajustar_totales(db, lista_id)
+    if not t:
+        raise ValueError("NO_EXISTE")
+    cursor = t["cursor"]
+    ids = _obtener_o_crear_productos(db, usuario_id, list(unicos))
+    vistos = set()
+    for nombre in list(unicos):
+        # misma clave en la base que otro nombre del lote
+        if ids[nombre] in vistos:
+            duplicados.append(nombre)
+            del unicos[nombre]
+        vistos.add(ids[nombre])
+
+    filas = [{
+        "lista_id": lista_id,
+        "producto_id": ids[nombre],
+        "unidad_id": x.get("unidad_id"),
+        "cantidad": x.get("cantidad") or 1,
+        "precio": x.get("precio") or 0,
+        "comprado": False,
+        "usuario_id": usuario_id,
+        "updated_by": usuario_id,
+        "cambio": cursor,
+    } for nombre, x in unicos.items()]
+    insertados = db.execute(
+        pg_insert(ListaItem)
+        .values(filas)
+        .on_conflict_do_nothing(index_elements=[ListaItem.lista_id, ListaItem.producto_id])
+        .returning(ListaItem.id, ListaItem.producto_id)
+    ).all()
+    item_por_producto = {pid: iid for iid, pid in insertados}
+    nombre_por_id = {pid: n for n, pid in ids.items()}
+    duplicados += [n for n in unicos if ids[n] not in item_por_producto]
+    if not insertados:
+        return [], duplicados
+
+    nuevas = [f for f in filas if f["producto_id"] in item_por_producto]
+    db.execute(pg_insert(ItemActividad).values([
+        {"id": item_por_producto[f["producto_id"]], "usuario_id": usuario_id, "accion": "agrego"} for f in nuevas
+    ]).on_conflict_do_nothing())
+
+    precios = [{"producto_id": f["producto_id"], "precio": f["precio"], "usuario_id": usuario_id} for f in nuevas if f["precio"] > 0]
+    if precios:
+        stmt = pg_insert(ProductoPrecio).values(precios)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[ProductoPrecio.producto_id],
+            set_={"precio": stmt.excluded.precio, "usuario_id": stmt.excluded.usuario_id, "updated_at": func.now()},
+        ))
+        registrar_historial_precios(db, usuario_id, {x["producto_id"]: x["precio"] for x in precios})
+    unidades = [{"producto_id": f["producto_id"], "unidad_id": f["unidad_id"], "usuario_id": usuario_id} for f in nuevas if f["unidad_id"] is not None]
+    if unidades:
+        stmt = pg_insert(ProductoUnidadUltima).values(unidades)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[ProductoUnidadUltima.producto_id],
+            set_={"unidad_id": stmt.excluded.unidad_id, "usuario_id": stmt.excluded.usuario_id, "updated_at": func.now()},
+        ))
+    if precios or unidades:
+        cache_productos.limpiar()
+        avisar_ultimos(db, [
+            (f["producto_id"], f["precio"] if f["precio"] > 0 else None, f["unidad_id"])
+            for f in nuevas if f["precio"] > 0 or f["unidad_id"] is not None
+        ])
+
+    pendiente = sum((_aporte_item(f["precio"], f["cantidad"], False)[1] for f in nuevas), Decimal(0))
+    totales = ajustar_totales(db, lista_id, refs=len(nuevas), pendiente=pendiente, avanzar=False)
+    publicar(db, lista_id, "items_agregados", usuario_id=usuario_id, totales=totales, n=len(nuevas))
+    agregados = [(item_por_producto[f["producto_id"]], nombre_por_id[f["producto_id"]]) for f in nuevas]
+    return agregados, duplicados
+
+def marcar_items_lote(db: Session, lista_id: UUID, usuario_id, comprado: bool, item_ids=None) -> int:
+    """
+    Marca (o desmarca) como comprados todos los items de la lista, o solo
+    `item_ids`, con un UPDATE ... RETURNING. Devuelve cuántos cambiaron.
+    """
+    t = ajustar_totales(db, lista_id)
+    if not t:
+        raise ValueError("NO_EXISTE")
+    cursor = t["cursor"]
+    cond = [ListaItem.lista_id == lista_id, ListaItem.comprado != comprado]
+    if item_ids is not None:
+        cond.append(ListaItem.id.in_(item_ids))
+    rows = db.execute(
+        update(ListaItem)
+        .where(*cond)
+        .values(comprado=comprado, updated_by=usuario_id, updated_at=func.now(), cambio=cursor,
+                version=ListaItem.version + 1)
+        .returning(ListaItem.id, ListaItem.precio, ListaItem.cantidad)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not rows:
+        return 0
+
+    movido = sum((_aporte_item(r.precio, r.cantidad, False)[1] for r in rows), Decimal(0))
+    signo = 1 if comprado else -1
+    totales = ajustar_totales(db, lista_id, comprado=signo * movido, pendiente=-signo * movido, avanzar=False)
+
+    stmt = pg_insert(ItemActividad).values([{"id": r.id, "usuario_id": usuario_id, "accion": "comprado"} for r in rows])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ItemActividad.id, ItemActividad.usuario_id],
+        set_={"accion": stmt.excluded.accion, "updated_at": func.now()},
+    ))
+    # sin ids: NOTIFY admite ~8 KB; el cliente recarga
+    publicar(db, lista_id, "items_actualizados", usuario_id=usuario_id, totales=totales, comprado=comprado, n=len(rows))
+    return len(rows)
+
+def _aplicar_op(db: Session, lista_id: UUID, usuario_id, op: dict) -> dict:
+    tipo = op["tipo"]
+    if tipo == "agregar":
+        if not op.get("producto"):
+            raise ValueError("INVALIDA")
+        it = agregar_item(
+            db, lista_id, usuario_id, a_mayusculas(op["producto"]), op.get("cantidad") or 1,
+            op.get("unidad_id"), op.get("precio") or 0, item_id=op.get("item_id"),
+        )
+        return {"estado": "aplicado", "item_id": str(it.id)}
+    if not op.get("item_id"):
+        raise ValueError("INVALIDA")
+    if tipo == "patch":
+        patch = {k: op.get(k) for k in ("cantidad", "unidad_id", "precio", "comprado") if op.get(k) is not None}
+        patch_item(db, lista_id, op["item_id"], usuario_id, patch, version=op.get("version"))
+    elif tipo == "borrar":
+        borrar_item(db, lista_id, op["item_id"], version=op.get("version"))
+    else:
+        raise ValueError("INVALIDA")
+    return {"estado": "aplicado", "item_id": str(op["item_id"])}
+
+def aplicar_sync(db: Session, lista_id: UUID, usuario_id, ops: list[dict]) -> list[dict]:
+    """
+    Aplica en orden mutaciones encoladas offline. Cada una tiene un id
+    generado por el cliente: si ya se aplicó, se devuelve el resultado
+    guardado sin repetir el trabajo. Los "patch" y "borrar" llevan la
+    versión del item sobre la que se hicieron (el cliente la avanza con cada
+    op que encola), así ops seguidas sobre un item no chocan entre sí y solo
+    un cambio ajeno da CONFLICTO, a esa op y a las siguientes del mismo item.
+    Cada op corre en un SAVEPOINT, así un conflicto no aborta el resto del
+    lote.
+    """
+    ya = dict(db.query(Mutacion.id, Mutacion.resultado).filter(
+        Mutacion.id.in_([op["id"] for op in ops]), Mutacion.usuario_id == usuario_id,
+    ).all()) if ops else {}
+
+    resultados, en_conflicto = [], set()
+    for op in ops:
+        if op["id"] in ya:
+            resultados.append({"id": op["id"], **ya[op["id"]], "repetida": True})
+            continue
+        try:
+            with db.begin_nested():
+                if op.get("item_id") in en_conflicto:
+                    # se hizo sobre una op rechazada: su versión ya no dice nada
+                    raise ValueError("CONFLICTO")
+                res = _aplicar_op(db, lista_id, usuario_id, op)
+                db.add(Mutacion(id=op["id"], usuario_id=usuario_id, lista_id=lista_id, resultado=res))
+        except (ValueError, IntegrityError) as e:
+            estado = {"ITEM_DUPLICADO": "duplicado", "NO_EXISTE": "no_existe", "CONFLICTO": "conflicto"}.get(str(e), "invalida")
+            if estado == "conflicto":
+                en_conflicto.add(op["item_id"])
+            res = {"estado": estado, "item_id": str(op["item_id"]) if op.get("item_id") else None}
+            # resultado determinista: también se guarda para los reintentos
+            try:
+                with db.begin_nested():
+                    db.add(Mutacion(id=op["id"], usuario_id=usuario_id, lista_id=lista_id, resultado=res))
+            except IntegrityError:
+                # id ya usado por otro usuario (la PK es global): no se guarda
+                res = {"estado": "invalida", "item_id": res["item_id"]}
+        ya[op["id"]] = res
+        resultados.append({"id": op["id"], **res})
+    return resultados
+
+def purgar_mutaciones(db: Session, dias: int) -> int:
+    return db.query(Mutacion).filter(Mutacion.created_at < func.now() - timedelta(days=dias)).delete(synchronize_session=False)
+
 def crear_link(db: Session, lista_id: UUID, usuario_id, rol: str = "editor"):
     rol = (rol or "editor").lower()
     prefijo = "l_" if rol == "lector" else "e_"
@@ -215,4 +1011,5 @@ def aceptar_link(db: Session, token: str, usuario_id):
         db.add(ListaUsuario(id=lk.lista_id, usuario_id=usuario_id, rol=rol_link))
     elif existe.rol != rol_link:
         existe.rol = rol_link
+    permisos.invalidar(db, lk.lista_id, usuario_id)
     return lk.lista_id, rol_link
@@ -0,0 +1,26 @@
+"""
+Versiones async de todas las funciones públicas de `crud`.
+
+Cada función recibe una AsyncSession en lugar de una Session y ejecuta la
+versión sync con `AsyncSession.run_sync`, así la lógica vive en un solo lugar:
+
+    rol = await crud_async.rol_en_lista(db, lista_id, usuario_id)
+"""
+import functools
+import inspect
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+
+
+def _envolver(fn):
+    @functools.wraps(fn)
+    async def envoltura(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return envoltura
+
+
+for _nombre, _fn in inspect.getmembers(crud, inspect.isfunction):
+    if _fn.__module__ == crud.__name__ and not _nombre.startswith("_"):
+        globals()[_nombre] = _envolver(_fn)
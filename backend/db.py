@@ -1,14 +1,102 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import metricas
 
 DB_URL = os.getenv("DB_URL")
 if not DB_URL:
     raise RuntimeError("DB_URL no está configurada")
+# Modo async: endpoints `async def` sobre AsyncSession (psycopg async)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+# Pool de conexiones (por proceso: multiplicar por el número de workers)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))     # segundos esperando conexión
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # segundos, -1 = nunca
+# Ping en cada checkout (un round trip extra por petición); por defecto se usa
+# el chequeo periódico de DB_HEALTH_INTERVAL.
+DB_PRE_PING = os.getenv("DB_PRE_PING", "0") == "1"
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "30"))  # segundos, 0 = desactivado
+# Detrás de PgBouncer en modo transacción: sin prepared statements del servidor
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+class MetricasPool:
+    """Espera acumulada al obtener conexiones del pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, segundos: float):
+        with self._lock:
+            self.esperas += 1
+            self.espera_total += segundos
+            if segundos > self.espera_max:
+                self.espera_max = segundos
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.esperas,
+                "espera_total_s": round(self.espera_total, 6),
+                "espera_prom_ms": round(self.espera_total / self.esperas * 1000, 3) if self.esperas else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+            }
+
+
+class _EsperaMedida:
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - t0
+            self.metricas.registrar(espera)
+            metricas.anotar_pool(espera)
 
-engine = create_engine(DB_URL, pool_pre_ping=True)
+
+class PoolMedido(_EsperaMedida, QueuePool):
+    metricas = MetricasPool()
+
+
+class AsyncPoolMedido(_EsperaMedida, AsyncAdaptedQueuePool):
+    metricas = MetricasPool()
+
+
+def _opciones_engine(poolclass) -> dict:
+    opciones = {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_PRE_PING,
+    }
+    if DB_PGBOUNCER:
+        opciones["connect_args"] = {"prepare_threshold": None}
+    return opciones
+
+
+engine = create_engine(DB_URL, **_opciones_engine(PoolMedido))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(DB_URL, **_opciones_engine(AsyncPoolMedido)) if DB_ASYNC else None
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False) if DB_ASYNC else None
+
+# conteo y tiempo de sentencias por petición (metricas.py)
+metricas.instalar(engine)
+if async_engine is not None:
+    metricas.instalar(async_engine.sync_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,3 +105,69 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_db_async():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def estado_pool(eng) -> dict:
+    pool = eng.pool
+    return {
+        "tamano": pool.size(),
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        **pool.metricas.resumen(),
+    }
+
+
+_salud = {"ok": None, "ultimo": None, "error": None}
+_detener_salud = threading.Event()
+
+
+def chequear_salud():
+    """
+    Un SELECT 1 con una conexión del pool. Si falla se descartan todas las
+    conexiones (dispose) para que las siguientes peticiones abran nuevas.
+    """
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        _salud.update(ok=True, error=None)
+    except Exception as e:
+        _salud.update(ok=False, error=type(e).__name__)
+        engine.dispose()
+        if async_engine is not None:
+            # conexiones async: se sueltan sin cerrarlas desde este hilo
+            async_engine.sync_engine.dispose(close=False)
+    _salud["ultimo"] = time.time()
+
+
+def iniciar_chequeo_salud():
+    if DB_HEALTH_INTERVAL <= 0:
+        return
+
+    def ciclo():
+        while not _detener_salud.wait(DB_HEALTH_INTERVAL):
+            chequear_salud()
+
+    _detener_salud.clear()
+    threading.Thread(target=ciclo, name="db-salud", daemon=True).start()
+
+
+def detener_chequeo_salud():
+    _detener_salud.set()
+
+
+def diagnostico() -> dict:
+    out = {
+        "pgbouncer": DB_PGBOUNCER,
+        "pre_ping": DB_PRE_PING,
+        "salud": dict(_salud),
+        "sync": estado_pool(engine),
+    }
+    if async_engine is not None:
+        out["async"] = estado_pool(async_engine.sync_engine)
+    return out
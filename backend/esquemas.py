@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from uuid import UUID
 from decimal import Decimal
+from datetime import date
 
 class RegistroIn(BaseModel):
     correo: EmailStr
@@ -42,6 +43,39 @@ class ProductoOut(BaseModel):
     unidad_id_ultima: Optional[int] = None
     unidad_ultima: Optional[str] = None
 
+class PrecioPeriodoOut(BaseModel):
+    inicio: date         # día, o lunes de la semana
+    n: int               # observaciones
+    minimo: int
+    mediana: int
+    maximo: int
+    ultimo: int
+
+class SeriePreciosOut(BaseModel):
+    producto_id: int
+    periodo: Literal["dia", "semana"]
+    puntos: List[PrecioPeriodoOut]
+
+class CostoItemOut(BaseModel):
+    id: UUID
+    producto_id: int
+    producto: str
+    cantidad: Decimal
+    precio: int                       # el de la lista
+    comprado: bool
+    precio_estimado: int              # mediana de la última semana con datos, o `precio`
+    minimo: Optional[int] = None
+    maximo: Optional[int] = None
+    semana: Optional[date] = None     # None = sin historial
+
+class CostoEstimadoOut(BaseModel):
+    lista_id: UUID
+    total_estimado: int
+    total_minimo: int
+    total_maximo: int
+    sin_historial: int
+    items: List[CostoItemOut]
+
 class UnidadOut(BaseModel):
     id: int
     nombre: str
@@ -56,6 +90,7 @@ class ItemOut(BaseModel):
     precio: int
     comprado: bool
     tocado_por: List[str] = []
+    version: int = 0
 
 class ListaDetalleOut(BaseModel):
     id: UUID
@@ -67,6 +102,18 @@ class ListaDetalleOut(BaseModel):
     total_refs: int
     total_comprado: int
     total_pendiente: int
+    cursor: int = 0
+
+class CambiosOut(BaseModel):
+    id: UUID
+    cursor: int
+    borrada: bool = False
+    completo: bool = False   # True: reemplazar la copia local con `items`
+    items: List[ItemOut] = []
+    borrados: List[UUID] = []
+    total_refs: int = 0
+    total_comprado: int = 0
+    total_pendiente: int = 0
 
 class ItemCrearIn(BaseModel):
     producto: str = Field(min_length=1, max_length=200)  # en MAYÚSCULA
@@ -80,6 +127,49 @@ class ItemPatchIn(BaseModel):
     precio: Optional[int] = Field(default=None, ge=0)
     comprado: Optional[bool] = None
 
+class ItemsLoteIn(BaseModel):
+    items: List[ItemCrearIn] = Field(default_factory=list, max_length=500)
+    texto: Optional[str] = Field(default=None, max_length=20000)  # un producto por línea
+
+class ItemLoteOut(BaseModel):
+    id: UUID
+    producto: str
+
+class ItemsLoteOut(BaseModel):
+    agregados: List[ItemLoteOut]
+    duplicados: List[str]
+
+class ItemsLotePatchIn(BaseModel):
+    comprado: bool
+    item_ids: Optional[List[UUID]] = Field(default=None, max_length=500)  # None = todos
+
+class OpSyncIn(BaseModel):
+    id: UUID                                   # generado por el cliente (idempotencia)
+    tipo: Literal["agregar", "patch", "borrar"]
+    item_id: Optional[UUID] = None             # en "agregar" puede venir del cliente
+    version: Optional[int] = None              # versión del item sobre la que se hizo ("patch"/"borrar")
+    producto: Optional[str] = Field(default=None, max_length=200)
+    cantidad: Optional[Decimal] = Field(default=None, gt=0)
+    unidad_id: Optional[int] = None
+    precio: Optional[int] = Field(default=None, ge=0)
+    comprado: Optional[bool] = None
+
+class SyncIn(BaseModel):
+    ops: List[OpSyncIn] = Field(max_length=200)
+
+class ResultadoOpOut(BaseModel):
+    id: UUID
+    estado: str          # aplicado | duplicado | no_existe | conflicto | invalida
+    item_id: Optional[UUID] = None
+    repetida: bool = False
+
+class SyncOut(BaseModel):
+    resultados: List[ResultadoOpOut]
+    cursor: int
+    total_refs: int
+    total_comprado: int
+    total_pendiente: int
+
 class LinkOut(BaseModel):
     url: str
     token: str
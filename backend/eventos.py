@@ -0,0 +1,141 @@
+"""
+Eventos en tiempo real por lista (SSE) alimentados por Postgres LISTEN/NOTIFY.
+
+`crud` publica con `pg_notify` dentro de la misma transacción de la escritura,
+así el evento solo sale si se hace commit. En cada proceso, un hilo escucha el
+canal con una conexión dedicada y reparte los eventos a los suscriptores
+(colas asyncio) de la lista correspondiente. La misma conexión escucha los
+canales registrados con `distribuidor.escuchar` (p. ej. invalidación del
+catálogo en memoria).
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import psycopg
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from db import DB_URL
+
+CANAL = "lista_eventos"
+# Conexión para LISTEN: no puede pasar por PgBouncer en modo transacción
+DB_LISTEN_URL = os.getenv("DB_LISTEN_URL") or DB_URL
+EVENTOS_COLA_MAX = int(os.getenv("EVENTOS_COLA_MAX", "100"))
+
+
+def publicar(db: Session, lista_id, tipo: str, **datos):
+    payload = json.dumps({"lista_id": str(lista_id), "tipo": tipo, **datos}, default=str)
+    db.execute(select(func.pg_notify(CANAL, payload)))
+
+
+class _Suscriptor:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=EVENTOS_COLA_MAX)
+
+    def _poner(self, evento: dict):
+        # corre en el loop del suscriptor
+        if self.cola.full():
+            # cliente lento: se descarta lo pendiente y se pide recargar
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            evento = {"lista_id": evento.get("lista_id"), "tipo": "recargar"}
+        self.cola.put_nowait(evento)
+
+    def entregar(self, evento: dict):
+        self.loop.call_soon_threadsafe(self._poner, evento)
+
+
+class Distribuidor:
+    def __init__(self):
+        self._subs = {}      # lista_id -> set[_Suscriptor]
+        self._oyentes = {}   # canal -> callback(payload); None tras (re)conectar
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def _arrancar(self):
+        # con self._lock tomado
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._escuchar, name="lista-eventos", daemon=True)
+            self._hilo.start()
+
+    def escuchar(self, canal: str, callback):
+        """
+        Registra otro canal. Debe hacerse antes de arrancar el hilo (startup);
+        repetir el mismo registro (otro startup en el proceso) no hace nada.
+        """
+        with self._lock:
+            if self._oyentes.get(canal) == callback:
+                return
+            if self._hilo is not None and self._hilo.is_alive():
+                raise RuntimeError("los canales se registran antes de iniciar el distribuidor")
+            self._oyentes[canal] = callback
+
+    def iniciar(self):
+        with self._lock:
+            self._arrancar()
+
+    def suscribir(self, lista_id) -> _Suscriptor:
+        sub = _Suscriptor(asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(str(lista_id), set()).add(sub)
+            self._arrancar()
+        return sub
+
+    def desuscribir(self, lista_id, sub: _Suscriptor):
+        with self._lock:
+            subs = self._subs.get(str(lista_id))
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[str(lista_id)]
+
+    def _repartir(self, payload: str):
+        try:
+            evento = json.loads(payload)
+        except ValueError:
+            return
+        with self._lock:
+            subs = list(self._subs.get(evento.get("lista_id"), ()))
+        for sub in subs:
+            sub.entregar(evento)
+
+    def _recargar_todos(self):
+        with self._lock:
+            todos = [(lid, sub) for lid, subs in self._subs.items() for sub in subs]
+        for lid, sub in todos:
+            sub.entregar({"lista_id": lid, "tipo": "recargar"})
+
+    def _escuchar(self):
+        conninfo = make_url(DB_LISTEN_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        espera = 1.0
+        reconexion = False
+        while True:
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as conn:
+                    oyentes = dict(self._oyentes)
+                    for canal in (CANAL, *oyentes):
+                        conn.execute(f"LISTEN {canal}")
+                    espera = 1.0
+                    if reconexion:
+                        self._recargar_todos()
+                    reconexion = True
+                    # lo escrito antes de este LISTEN no llegó como aviso
+                    for callback in oyentes.values():
+                        callback(None)
+                    for n in conn.notifies():
+                        if n.channel == CANAL:
+                            self._repartir(n.payload)
+                        elif n.channel in oyentes:
+                            oyentes[n.channel](n.payload)
+            except Exception:
+                # reconexión con backoff; al volver se pide recargar (eventos perdidos)
+                time.sleep(espera)
+                espera = min(espera * 2, 30.0)
+
+
+distribuidor = Distribuidor()
@@ -0,0 +1,196 @@
+"""
+Instrumentación por petición: número de sentencias SQL, tiempo en la base,
+espera por conexión del pool, autenticación y serialización de la respuesta.
+
+El middleware de app.py abre una `Medicion` en un ContextVar. Los hooks de
+SQLAlchemy, el pool (db.py) y `usuario_actual` (auth.py) suman sobre ella
+desde el hilo o greenlet donde corren: Starlette copia el contexto al
+threadpool, así que todos ven el mismo objeto. Al cerrar la petición se
+acumula en `registro` (exportado en formato Prometheus) y se devuelve
+como `Server-Timing`.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))  # 0 = sin log de consultas lentas
+
+log_lentas = logging.getLogger("listas.sql.lentas")
+
+# límites (segundos) del histograma de duración por ruta
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Medicion:
+    __slots__ = ("scope", "consultas", "db", "pool", "auth", "serializacion", "fin_endpoint")
+
+    def __init__(self, scope: dict | None = None):
+        self.scope = scope or {}
+        self.consultas = 0
+        self.db = 0.0
+        self.pool = 0.0
+        self.auth = 0.0
+        self.serializacion = 0.0
+        self.fin_endpoint = None
+
+    @property
+    def ruta(self) -> str:
+        # plantilla de la ruta (no el path con ids) para acotar las series
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "(sin ruta)"
+
+
+_actual: ContextVar[Medicion | None] = ContextVar("medicion_peticion", default=None)
+
+
+def abrir(scope: dict) -> tuple[Medicion, object]:
+    m = Medicion(scope)
+    return m, _actual.set(m)
+
+
+def cerrar(token):
+    _actual.reset(token)
+
+
+def anotar_pool(segundos: float):
+    m = _actual.get()
+    if m is not None:
+        m.pool += segundos
+
+
+def marcar_fin_endpoint():
+    m = _actual.get()
+    if m is not None:
+        m.fin_endpoint = time.perf_counter()
+
+
+@contextmanager
+def medir_auth():
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        m = _actual.get()
+        if m is not None:
+            m.auth += time.perf_counter() - t0
+
+
+def anotar_serializacion(inicio_render: float):
+    # desde que el endpoint devolvió (validación del response_model incluida)
+    # o, si no pasó por `ruta`, solo el render del JSON
+    m = _actual.get()
+    if m is not None:
+        m.serializacion += time.perf_counter() - (m.fin_endpoint or inicio_render)
+
+
+# ---------------- SQLAlchemy ----------------
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("t_consulta", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    pila = conn.info.get("t_consulta")
+    if not pila:
+        return
+    dt = time.perf_counter() - pila.pop()
+    m = _actual.get()
+    if m is not None:
+        m.consultas += 1
+        m.db += dt
+    if SLOW_QUERY_MS > 0 and dt * 1000 >= SLOW_QUERY_MS:
+        log_lentas.warning(
+            "consulta lenta %.1f ms en %s: %s",
+            dt * 1000, m.ruta if m else "-", " ".join(statement.split())[:2000],
+        )
+
+
+def instalar(*engines):
+    for e in engines:
+        event.listen(e, "before_cursor_execute", _antes)
+        event.listen(e, "after_cursor_execute", _despues)
+
+
+# ---------------- agregado por ruta ----------------
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = {}   # (metodo, ruta, estado) -> n
+        self.rutas = {}        # (metodo, ruta) -> acumulados
+
+    def observar(self, metodo: str, ruta: str, estado: int, m: Medicion, duracion: float):
+        with self._lock:
+            k = (metodo, ruta, str(estado))
+            self.peticiones[k] = self.peticiones.get(k, 0) + 1
+            r = self.rutas.get((metodo, ruta))
+            if r is None:
+                r = self.rutas[(metodo, ruta)] = {
+                    "n": 0, "duracion": 0.0, "consultas": 0, "db": 0.0, "pool": 0.0,
+                    "auth": 0.0, "serializacion": 0.0, "buckets": [0] * len(BUCKETS),
+                }
+            r["n"] += 1
+            r["duracion"] += duracion
+            r["consultas"] += m.consultas
+            r["db"] += m.db
+            r["pool"] += m.pool
+            r["auth"] += m.auth
+            r["serializacion"] += m.serializacion
+            for i, limite in enumerate(BUCKETS):
+                if duracion <= limite:
+                    r["buckets"][i] += 1
+
+    def prometheus(self) -> str:
+        with self._lock:
+            peticiones = dict(self.peticiones)
+            rutas = {k: {**v, "buckets": list(v["buckets"])} for k, v in self.rutas.items()}
+
+        def etq(**kw):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in kw.items()) + "}"
+
+        lineas = [
+            "# HELP listas_peticiones_total Peticiones atendidas.",
+            "# TYPE listas_peticiones_total counter",
+        ]
+        for (metodo, ruta, estado), n in sorted(peticiones.items()):
+            lineas.append(f"listas_peticiones_total{etq(metodo=metodo, ruta=ruta, estado=estado)} {n}")
+
+        lineas += [
+            "# HELP listas_peticion_segundos Duración de la petición.",
+            "# TYPE listas_peticion_segundos histogram",
+        ]
+        for (metodo, ruta), r in sorted(rutas.items()):
+            for limite, n in zip(BUCKETS, r["buckets"]):
+                lineas.append(f"listas_peticion_segundos_bucket{etq(metodo=metodo, ruta=ruta, le=limite)} {n}")
+            lineas.append(f"listas_peticion_segundos_bucket{etq(metodo=metodo, ruta=ruta, le='+Inf')} {r['n']}")
+            lineas.append(f"listas_peticion_segundos_sum{etq(metodo=metodo, ruta=ruta)} {r['duracion']:.6f}")
+            lineas.append(f"listas_peticion_segundos_count{etq(metodo=metodo, ruta=ruta)} {r['n']}")
+
+        for nombre, clave, ayuda in (
+            ("listas_consultas_total", "consultas", "Sentencias SQL ejecutadas."),
+            ("listas_db_segundos_total", "db", "Tiempo en la base de datos."),
+            ("listas_pool_espera_segundos_total", "pool", "Espera por una conexión del pool."),
+            ("listas_auth_segundos_total", "auth", "Tiempo resolviendo usuario_actual."),
+            ("listas_serializacion_segundos_total", "serializacion", "Tiempo serializando la respuesta."),
+        ):
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+            for (metodo, ruta), r in sorted(rutas.items()):
+                valor = r[clave]
+                lineas.append(f"{nombre}{etq(metodo=metodo, ruta=ruta)} {valor if clave == 'consultas' else f'{valor:.6f}'}")
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+
+def server_timing(m: Medicion, duracion: float) -> str:
+    return ", ".join((
+        f'db;dur={m.db * 1000:.1f};desc="{m.consultas} consultas"',
+        f"pool;dur={m.pool * 1000:.1f}",
+        f"auth;dur={m.auth * 1000:.1f}",
+        f"ser;dur={m.serializacion * 1000:.1f}",
+        f"total;dur={duracion * 1000:.1f}",
+    ))
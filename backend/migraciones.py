@@ -0,0 +1,123 @@
+"""
+Migraciones versionadas del esquema.
+
+Cada archivo `bd/migraciones/NNNN_descripcion.sql` se aplica una sola vez y
+queda registrado en `esquema_version`. Los archivos deben ser idempotentes:
+en una base nueva `00_esquema.sql` ya creó el esquema actual y la migración
+solo se registra.
+
+En el arranque, si la base ya está al día basta una consulta (máximo de la
+PK de `esquema_version`). Si faltan migraciones se aplican en una única
+transacción bajo un advisory lock, así varios workers que arrancan a la vez
+no las ejecutan en paralelo: el primero aplica y los demás solo verifican.
+
+Uso:
+    python migraciones.py           # aplica las pendientes
+    python migraciones.py --estado  # lista aplicadas y pendientes
+"""
+import os
+import re
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from db import engine
+
+MIGRACIONES_DIR = os.getenv(
+    "MIGRACIONES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bd", "migraciones"),
+)
+LOCK_MIGRACIONES = 7254001  # clave del pg_advisory_xact_lock
+
+_NOMBRE = re.compile(r"^(\d+)_[\w-]+\.sql$")
+
+
+def disponibles(directorio: str = MIGRACIONES_DIR):
+    """[(version, nombre_archivo, ruta)] ordenado por versión."""
+    out = []
+    for nombre in os.listdir(directorio):
+        m = _NOMBRE.match(nombre)
+        if m:
+            out.append((int(m.group(1)), nombre, os.path.join(directorio, nombre)))
+    out.sort()
+    versiones = [v for v, _, _ in out]
+    if len(versiones) != len(set(versiones)):
+        raise RuntimeError(f"Versiones de migración repetidas en {directorio}")
+    return out
+
+
+def version_actual(conn) -> int:
+    # Camino rápido: una lectura del índice de la PK. Si la tabla aún no existe
+    # se informa 0 y el llamador pasa al camino lento.
+    try:
+        with conn.begin_nested():
+            return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM public.esquema_version")).scalar()
+    except ProgrammingError:
+        return 0
+
+
+def _crear_tabla_version(conn):
+    conn.execute(text("""
+CREATE TABLE IF NOT EXISTS public.esquema_version (
+  version     INTEGER PRIMARY KEY,
+  nombre      TEXT NOT NULL,
+  aplicada_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+    """))
+
+
+def migrar(directorio: str = MIGRACIONES_DIR):
+    """Aplica las migraciones pendientes. Devuelve los nombres aplicados."""
+    pendientes = disponibles(directorio)
+    if not pendientes:
+        return []
+    ultima = pendientes[-1][0]
+
+    with engine.connect() as conn:
+        with conn.begin():
+            if version_actual(conn) >= ultima:
+                return []
+
+        with conn.begin():
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_MIGRACIONES})
+            _crear_tabla_version(conn)
+            aplicadas = set(conn.execute(text("SELECT version FROM public.esquema_version")).scalars())
+            hechas = []
+            for version, nombre, ruta in pendientes:
+                if version in aplicadas:
+                    continue
+                with open(ruta, encoding="utf-8") as f:
+                    conn.exec_driver_sql(f.read())
+                conn.execute(
+                    text("INSERT INTO public.esquema_version (version, nombre) VALUES (:v, :n)"),
+                    {"v": version, "n": nombre},
+                )
+                hechas.append(nombre)
+            return hechas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica las migraciones versionadas de bd/migraciones")
+    parser.add_argument("--estado", action="store_true", help="solo muestra aplicadas y pendientes")
+    args = parser.parse_args()
+
+    if args.estado:
+        with engine.connect() as conn:
+            try:
+                with conn.begin():
+                    aplicadas = set(conn.execute(text("SELECT version FROM public.esquema_version")).scalars())
+            except ProgrammingError:
+                aplicadas = set()
+        for version, nombre, _ in disponibles():
+            print(f"{'aplicada ' if version in aplicadas else 'pendiente'}  {nombre}")
+        return
+
+    hechas = migrar()
+    for nombre in hechas:
+        print(f"aplicada {nombre}")
+    print(f"{len(hechas)} migración(es) aplicadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 from sqlalchemy import (
-    Column, String, Text, Boolean, BigInteger, SmallInteger, ForeignKey,
-    Numeric, DateTime, UniqueConstraint
+    Column, String, Text, Boolean, BigInteger, SmallInteger, Integer, ForeignKey,
+    Numeric, DateTime, Date, UniqueConstraint, Computed
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from db import Base
@@ -42,6 +42,12 @@ class Producto(Base):
     __tablename__ = "producto"
     id = Column(BigInteger, primary_key=True)
     nombre = Column(String(200), nullable=False)
+    # nombre en mayúsculas y sin tildes: clave única (ux_producto_nombre_norm)
+    # y búsqueda (índice trigram)
+    nombre_norm = Column(
+        Text,
+        Computed("translate(upper(nombre), 'ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÇ', 'AAAAAEEEEIIIIOOOOOUUUUC')", persisted=True),
+    )
     usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
@@ -52,6 +58,36 @@ class ProductoPrecio(Base):
     usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id"))
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+class ProductoPrecioHistorial(Base):
+    # solo inserción: cada precio registrado en un item
+    __tablename__ = "producto_precio_historial"
+    id = Column(BigInteger, primary_key=True)
+    producto_id = Column(BigInteger, ForeignKey("producto.id", ondelete="CASCADE"), nullable=False)
+    precio = Column(BigInteger, nullable=False)
+    usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id", ondelete="SET NULL"))
+    registrado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class ProductoPrecioResumen(Base):
+    # resumen por periodo ('dia' | 'semana'), mantenido en crud.registrar_historial_precios
+    __tablename__ = "producto_precio_resumen"
+    producto_id = Column(BigInteger, ForeignKey("producto.id", ondelete="CASCADE"), primary_key=True)
+    periodo = Column(String(10), primary_key=True)
+    inicio = Column(Date, primary_key=True)
+    n = Column(Integer, nullable=False)
+    minimo = Column(BigInteger, nullable=False)
+    maximo = Column(BigInteger, nullable=False)
+    mediana = Column(BigInteger, nullable=False)
+    ultimo = Column(BigInteger, nullable=False)
+    ultimo_en = Column(DateTime(timezone=True), nullable=False)
+    conteos = Column(JSONB, nullable=False)   # {"precio": n}
+
+class ProductoUnidadUltima(Base):
+    __tablename__ = "producto_unidad_ultima"
+    producto_id = Column(BigInteger, ForeignKey("producto.id", ondelete="CASCADE"), primary_key=True)
+    unidad_id = Column(SmallInteger, ForeignKey("unidad.id", ondelete="CASCADE"), nullable=False)
+    usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
 class Lista(Base):
     __tablename__ = "lista"
 
@@ -60,6 +96,14 @@ class Lista(Base):
     foto = Column(String, nullable=True)
     usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Totales desnormalizados (se mantienen en crud al escribir items)
+    total_refs = Column(Integer, nullable=False, server_default="0")
+    total_comprado = Column(Numeric(18, 3), nullable=False, server_default="0")
+    total_pendiente = Column(Numeric(18, 3), nullable=False, server_default="0")
+    # Cursor de cambios: aumenta en cada escritura de items de la lista
+    version = Column(BigInteger, nullable=False, server_default="0")
+    # Mayor cursor cuyos tombstones ya se purgaron
+    cambio_purgado = Column(BigInteger, nullable=False, server_default="0")
 
 class ListaUsuario(Base):
     __tablename__ = "lista_usuario"
@@ -90,14 +134,40 @@ class ListaItem(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_by = Column(UUID(as_uuid=True), ForeignKey("usuario.id"))
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # `lista.version` de la última escritura del item
+    cambio = Column(BigInteger, nullable=False, server_default="0")
+    # versión propia del item (If-Match en PATCH); +1 en cada escritura
+    version = Column(BigInteger, nullable=False, server_default="0")
 
     __table_args__ = (
         UniqueConstraint("lista_id", "producto_id", name="ux_lista_producto"),
     )
 
+class ListaItemBorrado(Base):
+    # tombstones para la sincronización incremental
+    __tablename__ = "lista_item_borrado"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    lista_id = Column(UUID(as_uuid=True), nullable=False)
+    cambio = Column(BigInteger, nullable=False)
+    borrado_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class ListaBorrada(Base):
+    __tablename__ = "lista_borrada"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    borrada_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
 class ItemActividad(Base):
     __tablename__ = "item"
     id = Column(UUID(as_uuid=True), ForeignKey("lista_item.id", ondelete="CASCADE"), primary_key=True)
     usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id", ondelete="CASCADE"), primary_key=True)
     accion = Column(String(20), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class Mutacion(Base):
+    # claves de idempotencia de la cola offline (/listas/{id}/sync)
+    __tablename__ = "mutacion"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False)
+    lista_id = Column(UUID(as_uuid=True), nullable=False)
+    resultado = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
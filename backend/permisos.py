@@ -0,0 +1,122 @@
+"""
+Caché de roles por (lista, usuario) para `crud.rol_en_lista`.
+
+Dos niveles:
+- memo de la petición en `Session.info`: el rol se resuelve una vez aunque
+  el endpoint y crud lo consulten varias veces;
+- LRU con TTL corto por proceso: las ráfagas de toques (marcar comprado)
+  no pagan la consulta de permisos en cada petición.
+
+Los cambios de rol (`aceptar_link`) y `borrar_lista` invalidan al momento y
+otra vez tras el commit, para que una lectura concurrente no deje en caché
+el valor anterior. Los demás workers se enteran por `pg_notify` en la misma
+transacción: escuchan el canal CANAL con el hilo de `eventos.distribuidor`
+y borran la entrada al recibir el aviso (si la conexión de LISTEN se cae,
+vacían toda la caché).
+"""
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+ROLES_CACHE_TTL = float(os.getenv("ROLES_CACHE_TTL", "5"))      # segundos, 0 = desactivado
+ROLES_CACHE_MAX = int(os.getenv("ROLES_CACHE_MAX", "10000"))    # pares (lista, usuario)
+
+CANAL = "roles"
+
+FALTA = object()
+
+
+def clave(lista_id, usuario_id) -> tuple[str, str]:
+    return str(lista_id).lower(), str(usuario_id)
+
+
+class CacheRoles:
+    # LRU con TTL; guarda también "sin acceso" (None)
+    def __init__(self, ttl: float, maximo: int):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._datos = OrderedDict()  # (lista, usuario) -> (expira, rol)
+        self._lock = threading.Lock()
+
+    def obtener(self, k: tuple):
+        if self.ttl <= 0:
+            return FALTA
+        with self._lock:
+            entrada = self._datos.get(k)
+            if not entrada:
+                return FALTA
+            expira, rol = entrada
+            if expira <= time.monotonic():
+                del self._datos[k]
+                return FALTA
+            self._datos.move_to_end(k)
+            return rol
+
+    def guardar(self, k: tuple, rol: str | None):
+        if self.ttl <= 0 or self.maximo <= 0:
+            return
+        with self._lock:
+            self._datos[k] = (time.monotonic() + self.ttl, rol)
+            self._datos.move_to_end(k)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, lista_id, usuario_id=None):
+        # sin usuario: todas las entradas de la lista
+        with self._lock:
+            if usuario_id is not None:
+                self._datos.pop(clave(lista_id, usuario_id), None)
+                return
+            lista = str(lista_id).lower()
+            for k in [k for k in self._datos if k[0] == lista]:
+                del self._datos[k]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+cache_roles = CacheRoles(ROLES_CACHE_TTL, ROLES_CACHE_MAX)
+
+
+def memo(db: Session) -> dict:
+    return db.info.setdefault("roles", {})
+
+
+def invalidar(db: Session, lista_id, usuario_id=None):
+    """
+    Invalida ya (memo y caché), de nuevo cuando la sesión haga commit y en
+    los demás workers con el aviso que sale con ese commit.
+    """
+    lista = str(lista_id).lower()
+    roles = memo(db)
+    for k in [k for k in roles if k[0] == lista and (usuario_id is None or k[1] == str(usuario_id))]:
+        del roles[k]
+    cache_roles.invalidar(lista_id, usuario_id)
+    db.info.setdefault("roles_pendientes", []).append((lista_id, usuario_id))
+    payload = json.dumps({"lista_id": lista, "usuario_id": None if usuario_id is None else str(usuario_id)})
+    db.execute(select(func.pg_notify(CANAL, payload)))
+
+
+def al_notificar(payload: str | None):
+    # hilo de LISTEN; None = reconexión (pudieron perderse avisos)
+    try:
+        aviso = json.loads(payload) if payload else None
+        cache_roles.invalidar(aviso["lista_id"], aviso["usuario_id"])
+    except (ValueError, TypeError, KeyError):
+        cache_roles.limpiar()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tras_commit(db: Session):
+    for lista_id, usuario_id in db.info.pop("roles_pendientes", []):
+        cache_roles.invalidar(lista_id, usuario_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendientes(db: Session):
+    db.info.pop("roles_pendientes", None)
@@ -0,0 +1,31 @@
+"""
+Purga tombstones (items y listas borradas) usados por la sincronización
+incremental `/listas/{id}/cambios` y las claves de idempotencia de la cola
+offline (`/listas/{id}/sync`).
+
+Uso:
+    python purgar_tombstones.py --dias 30
+"""
+import argparse
+
+from db import SessionLocal
+import crud
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purga tombstones antiguos de la sincronización incremental")
+    parser.add_argument("--dias", type=int, default=30, help="antigüedad mínima a purgar (días)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        n = crud.purgar_tombstones(db, args.dias)
+        m = crud.purgar_mutaciones(db, args.dias)
+        db.commit()
+        print(f"{n} lista(s) con tombstones purgados, {m} mutación(es) purgadas")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Reconciliación de totales desnormalizados de `lista`.
+
+Uso:
+    python reconciliar.py            # solo reporta desfases
+    python reconciliar.py --reparar  # corrige los desfases encontrados
+"""
+import argparse
+
+from db import SessionLocal
+import crud
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecta y repara desfases en los totales de las listas")
+    parser.add_argument("--reparar", action="store_true", help="corrige los totales con desfase")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        rows = crud.reconciliar_totales(db, reparar=args.reparar)
+        for lista_id, tr, tc, tp, rr, rc, rp in rows:
+            print(f"{lista_id}: refs {tr}->{rr} comprado {tc}->{rc} pendiente {tp}->{rp}")
+        if args.reparar:
+            db.commit()
+        print(f"{len(rows)} lista(s) con desfase" + (" reparadas" if args.reparar and rows else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Respuesta JSON de la API codificada con orjson.
+
+orjson codifica UUID y datetime de forma nativa; Decimal se emite como
+texto, igual que la serialización de pydantic en los response_model. Los
+endpoints con filas ya tipadas (detalle, cambios, listas) devuelven esta
+respuesta directamente y evitan la revalidación del response_model.
+"""
+import time
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+import metricas
+
+
+def _default(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError(f"{type(valor).__name__} no es serializable a JSON")
+
+
+def a_json(contenido) -> bytes:
+    return orjson.dumps(contenido, default=_default)
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse con orjson que anota el tiempo de serialización de la petición."""
+
+    def render(self, content) -> bytes:
+        t0 = time.perf_counter()
+        try:
+            return a_json(content)
+        finally:
+            metricas.anotar_serializacion(t0)
@@ -0,0 +1,88 @@
+"""
+Número de sentencias SQL por petición (contador de `metricas`, expuesto en
+Server-Timing) en los endpoints calientes. Una consulta por item (N+1) o un
+viaje de más a la base rompe estos números.
+
+Requiere DB_URL apuntando a una base de prueba con el esquema creado
+(bd/00_esquema.sql); sin ella se salta.
+"""
+import os
+import re
+import uuid
+
+import pytest
+
+if not os.getenv("DB_URL"):
+    pytest.skip("DB_URL no configurada", allow_module_level=True)
+
+from fastapi.testclient import TestClient
+
+import app as aplicacion
+
+_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+def consultas(r) -> int:
+    assert r.status_code == 200, r.text
+    return int(_CONSULTAS.search(r.headers["server-timing"]).group(1))
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    with TestClient(aplicacion.app) as c:
+        r = c.post("/api/listas/auth/registro", json={
+            "correo": f"consultas-{uuid.uuid4().hex[:12]}@example.com",
+            "nombre": "PRUEBA CONSULTAS", "password": "secreto-123",
+        })
+        assert r.status_code == 200, r.text
+        yield c
+
+
+@pytest.fixture
+def lista(cliente):
+    lid = cliente.post("/api/listas/listas", json={"nombre": "MERCADO"}).json()["id"]
+    yield lid
+    cliente.delete(f"/api/listas/listas/{lid}")
+
+
+def agregar(cliente, lista, n: int, desde: int = 0):
+    return [
+        cliente.post(f"/api/listas/listas/{lista}/items", json={
+            "producto": f"PRODUCTO CONSULTAS {uuid.uuid4().hex[:8]} {i}",
+            "cantidad": 1, "precio": 1000 + i, "unidad_id": 1,
+        })
+        for i in range(desde, desde + n)
+    ]
+
+
+def test_detalle_no_depende_de_los_items(cliente, lista):
+    agregar(cliente, lista, 1)
+    uno = consultas(cliente.get(f"/api/listas/listas/{lista}"))
+    agregar(cliente, lista, 9, desde=1)
+    diez = consultas(cliente.get(f"/api/listas/listas/{lista}"))
+    # versión + rol, items con producto y unidad, "tocado_por"
+    assert (uno, diez) == (3, 3)
+
+
+def test_listas(cliente, lista):
+    agregar(cliente, lista, 3)
+    cliente.get("/api/listas/listas")
+    # firma para el ETag y listas con totales
+    assert consultas(cliente.get("/api/listas/listas")) == 2
+
+
+def test_agregar_item(cliente, lista):
+    # la primera escritura resuelve el rol; luego queda en caché
+    agregar(cliente, lista, 1)
+    # sentencia del item y NOTIFY de eventos
+    assert [consultas(r) for r in agregar(cliente, lista, 3, desde=1)] == [2, 2, 2]
+
+
+def test_patch_item(cliente, lista):
+    agregar(cliente, lista, 3)
+    items = cliente.get(f"/api/listas/listas/{lista}").json()["items"]
+    n = [
+        consultas(cliente.patch(f"/api/listas/listas/{lista}/items/{it['id']}", json={"comprado": True, "precio": 2500}))
+        for it in items
+    ]
+    assert n == [2, 2, 2]
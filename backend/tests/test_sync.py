@@ -0,0 +1,64 @@
+"""
+Cola offline (/sync): ids de mutación generados por el cliente.
+
+Requiere DB_URL apuntando a una base de prueba con el esquema creado
+(bd/00_esquema.sql); sin ella se salta.
+"""
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("DB_URL"):
+    pytest.skip("DB_URL no configurada", allow_module_level=True)
+
+from fastapi.testclient import TestClient
+
+import app as aplicacion
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    with TestClient(aplicacion.app) as c:
+        yield c
+
+
+def registrar(cliente):
+    # la cookie de sesión queda en el cliente: las peticiones siguientes son de este usuario
+    r = cliente.post("/api/listas/auth/registro", json={
+        "correo": f"sync-{uuid.uuid4().hex[:12]}@example.com",
+        "nombre": "PRUEBA SYNC", "password": "secreto-123",
+    })
+    assert r.status_code == 200, r.text
+    return cliente.post("/api/listas/listas", json={"nombre": "MERCADO"}).json()["id"]
+
+
+def sync(cliente, lista, *ops):
+    r = cliente.post(f"/api/listas/listas/{lista}/sync", json={"ops": list(ops)})
+    assert r.status_code == 200, r.text
+    return [x["estado"] for x in r.json()["resultados"]]
+
+
+def agregar(producto: str, op_id=None) -> dict:
+    return {"id": str(op_id or uuid.uuid4()), "tipo": "agregar", "producto": producto, "cantidad": 1}
+
+
+def test_reintento_devuelve_el_resultado_guardado(cliente):
+    lista = registrar(cliente)
+    op = agregar(f"PRODUCTO SYNC {uuid.uuid4().hex[:8]}")
+    assert sync(cliente, lista, op) == ["aplicado"]
+    r = cliente.post(f"/api/listas/listas/{lista}/sync", json={"ops": [op]})
+    assert r.json()["resultados"][0]["repetida"] is True
+    assert r.json()["total_refs"] == 1
+
+
+def test_id_de_otro_usuario_es_invalida(cliente):
+    op_id = uuid.uuid4()
+    lista_a = registrar(cliente)
+    assert sync(cliente, lista_a, agregar(f"PRODUCTO SYNC {uuid.uuid4().hex[:8]}", op_id)) == ["aplicado"]
+
+    lista_b = registrar(cliente)
+    otra = agregar(f"PRODUCTO SYNC {uuid.uuid4().hex[:8]}")
+    assert sync(cliente, lista_b, agregar(f"PRODUCTO SYNC {uuid.uuid4().hex[:8]}", op_id), otra) == ["invalida", "aplicado"]
+    # la op rechazada no dejó nada en la lista
+    assert cliente.get(f"/api/listas/listas/{lista_b}").json()["total_refs"] == 1
@@ -0,0 +1,100 @@
+"""
+verificador_google contra el servidor local de certificados de
+bench/google_local.py (sin Internet).
+"""
+import time
+
+import pytest
+
+from bench.google_local import ServidorCertificados
+from verificador_google import VerificadorGoogle, TokenInvalido, CertificadosNoDisponibles
+
+AUD = "listas-test.apps.googleusercontent.com"
+
+
+@pytest.fixture
+def servidor():
+    s = ServidorCertificados().iniciar()
+    yield s
+    s.detener()
+
+
+def test_cache_no_descarga_otra_vez(servidor):
+    v = VerificadorGoogle(servidor.url)
+    assert v.verificar(servidor.firmar(AUD, sub="1"), AUD)["sub"] == "1"
+    assert servidor.descargas == 1
+    for i in range(5):
+        v.verificar(servidor.firmar(AUD, sub=str(i)), AUD)
+    assert servidor.descargas == 1
+
+
+def test_rotacion_recarga_una_vez(servidor):
+    v = VerificadorGoogle(servidor.url)
+    v.verificar(servidor.firmar(AUD), AUD)
+    servidor.rotar()
+    # inmediatamente después de la carga anterior: el kid nuevo no espera
+    assert v.verificar(servidor.firmar(AUD, sub="2"), AUD)["sub"] == "2"
+    v.verificar(servidor.firmar(AUD, sub="3"), AUD)
+    assert servidor.descargas == 2
+
+
+def test_kid_ausente_no_repite_descarga(servidor):
+    v = VerificadorGoogle(servidor.url)
+    v.verificar(servidor.firmar(AUD), AUD)
+    otro = ServidorCertificados()
+    ajeno = otro.firmar(AUD)
+    otro.detener()
+    for _ in range(3):
+        with pytest.raises(TokenInvalido):
+            v.verificar(ajeno, AUD)
+    assert servidor.descargas == 2
+
+
+@pytest.mark.parametrize("claims", [
+    {"audiencia": "otra-app.apps.googleusercontent.com"},
+    {"audiencia": AUD, "iss": "https://accounts.example.com"},
+    {"audiencia": AUD, "vigencia": -3600},
+])
+def test_rechaza_aud_iss_exp(servidor, claims):
+    v = VerificadorGoogle(servidor.url)
+    with pytest.raises(TokenInvalido):
+        v.verificar(servidor.firmar(**claims), AUD)
+
+
+def test_rechaza_token_malformado(servidor):
+    with pytest.raises(TokenInvalido):
+        VerificadorGoogle(servidor.url).verificar("no-es-un-jwt", AUD)
+
+
+def test_descarga_fallida_usa_certificados_anteriores():
+    # max-age=0: cada verificación intenta renovar
+    servidor = ServidorCertificados(max_age=0).iniciar()
+    v = VerificadorGoogle(servidor.url)
+    v.verificar(servidor.firmar(AUD), AUD)
+    token = servidor.firmar(AUD, sub="4")
+    servidor.detener()
+    assert v.verificar(token, AUD)["sub"] == "4"
+    assert v.descargas == 1
+
+
+def test_sin_certificados_y_sin_servidor():
+    servidor = ServidorCertificados()
+    token = servidor.firmar(AUD)
+    v = VerificadorGoogle(servidor.url)
+    servidor.detener()
+    with pytest.raises(CertificadosNoDisponibles):
+        v.verificar(token, AUD)
+
+
+def test_renovacion_con_max_age_cero_no_descarga_sin_pausa():
+    servidor = ServidorCertificados(max_age=0).iniciar()
+    v = VerificadorGoogle(servidor.url)
+    v.iniciar()
+    try:
+        v.verificar(servidor.firmar(AUD), AUD)
+        time.sleep(0.5)
+    finally:
+        v.detener()
+        servidor.detener()
+    # la del hilo (o la primera verificación) y nada más hasta GOOGLE_CERTS_MIN_CICLO
+    assert servidor.descargas <= 2
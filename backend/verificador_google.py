@@ -0,0 +1,205 @@
+"""
+Verificación local de ID tokens de Google con los certificados en caché.
+
+`google_id_token.verify_oauth2_token` descarga los certificados de firma en
+cada llamada: un handshake TLS y un GET por login. Aquí se descargan con una
+`requests.Session` persistente y se guardan lo que indica su
+`Cache-Control: max-age`. Un hilo los renueva GOOGLE_CERTS_ANTES segundos
+antes de que venzan, y nunca más de una vez cada GOOGLE_CERTS_MIN_CICLO
+segundos (max-age=0 o Age >= max-age no lo ponen a descargar sin pausa). La firma se comprueba en el proceso con
+`google.auth.jwt.decode`.
+
+Si llega un token con un `kid` desconocido (Google rotó las claves) se
+recargan en línea de inmediato. Si tras recargar el `kid` sigue sin estar, ese
+mismo `kid` no provoca otra descarga hasta pasados GOOGLE_CERTS_MIN_RECARGA
+segundos.
+Si una descarga falla se siguen usando los certificados anteriores.
+
+bench/google_local.py levanta un servidor de certificados local para probar
+el login sin salir a Internet (GOOGLE_CERTS_URL).
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth import jwt
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_CERTS_TIMEOUT = float(os.getenv("GOOGLE_CERTS_TIMEOUT", "5"))           # segundos por descarga
+GOOGLE_CERTS_ANTES = float(os.getenv("GOOGLE_CERTS_ANTES", "300"))             # renovar N s antes de vencer
+GOOGLE_CERTS_TTL = float(os.getenv("GOOGLE_CERTS_TTL", "300"))                 # si la respuesta no trae max-age
+GOOGLE_CERTS_MIN_RECARGA = float(os.getenv("GOOGLE_CERTS_MIN_RECARGA", "30"))  # entre recargas por el mismo kid ausente
+GOOGLE_CERTS_MIN_CICLO = float(os.getenv("GOOGLE_CERTS_MIN_CICLO", "60"))       # mínimo entre renovaciones del hilo
+GOOGLE_CLOCK_SKEW = int(os.getenv("GOOGLE_CLOCK_SKEW", "10"))                  # segundos de tolerancia en iat/exp
+
+EMISORES = ("accounts.google.com", "https://accounts.google.com")
+
+log = logging.getLogger("listas.google")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+class CertificadosNoDisponibles(Exception):
+    pass
+
+
+def vigencia(headers, defecto: float = GOOGLE_CERTS_TTL) -> float:
+    """Segundos de caché: Cache-Control max-age menos Age."""
+    m = _MAX_AGE.search(headers.get("Cache-Control", ""))
+    if not m:
+        return defecto
+    try:
+        edad = float(headers.get("Age") or 0)
+    except ValueError:
+        edad = 0.0
+    return max(0.0, int(m.group(1)) - edad)
+
+
+class VerificadorGoogle:
+    def __init__(self, url: str = GOOGLE_CERTS_URL, http: requests.Session | None = None):
+        self.url = url
+        self.http = http or self._sesion()
+        self._lock = threading.Lock()          # protege certs/vence
+        self._carga = threading.Lock()         # una sola descarga a la vez
+        self._certs = {}                       # kid -> certificado PEM
+        self._vence = 0.0                      # time.monotonic()
+        self._vigencia = 0.0
+        self._kid_ausente = {}                 # kid -> time.monotonic() de la última recarga sin él
+        self.descargas = 0
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    @staticmethod
+    def _sesion() -> requests.Session:
+        s = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        s.mount("https://", adaptador)
+        s.mount("http://", adaptador)
+        return s
+
+    # ---------------- certificados ----------------
+    def cargar(self) -> dict:
+        try:
+            r = self.http.get(self.url, timeout=GOOGLE_CERTS_TIMEOUT)
+            r.raise_for_status()
+            certs = r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise CertificadosNoDisponibles(str(e)) from e
+        ahora = time.monotonic()
+        dura = vigencia(r.headers)
+        with self._lock:
+            self._certs = certs
+            self._vigencia = dura
+            self._vence = ahora + dura
+            self.descargas += 1
+        # el hilo reprograma la próxima renovación
+        self._despertar.set()
+        return certs
+
+    def _cargar_si(self, necesita) -> dict:
+        # `necesita(certs, vence)` se evalúa otra vez con el lock de carga: si
+        # otro hilo ya descargó mientras se esperaba, no se repite
+        with self._carga:
+            with self._lock:
+                certs, vence = self._certs, self._vence
+            if not necesita(certs, vence):
+                return certs
+            try:
+                return self.cargar()
+            except CertificadosNoDisponibles:
+                if not certs:
+                    raise
+                log.warning("no se pudieron renovar los certificados de Google; se usan los anteriores", exc_info=True)
+                with self._lock:
+                    # sin reintentar en cada login; el hilo sigue probando con backoff
+                    self._vence = time.monotonic() + GOOGLE_CERTS_MIN_RECARGA
+                return certs
+
+    def certificados(self) -> dict:
+        with self._lock:
+            certs, vence = self._certs, self._vence
+        if certs and time.monotonic() < vence:
+            return certs
+        return self._cargar_si(lambda c, v: not c or time.monotonic() >= v)
+
+    def _por_kid(self, kid: str) -> dict:
+        with self._lock:
+            ausente = self._kid_ausente.get(kid)
+            certs = self._certs
+        if ausente is not None and time.monotonic() - ausente < GOOGLE_CERTS_MIN_RECARGA:
+            return certs
+        certs = self._cargar_si(lambda c, _: kid not in c)
+        if kid not in certs:
+            ahora = time.monotonic()
+            with self._lock:
+                # solo se recuerdan los fallos recientes
+                self._kid_ausente = {
+                    k: t for k, t in self._kid_ausente.items() if ahora - t < GOOGLE_CERTS_MIN_RECARGA
+                }
+                self._kid_ausente[kid] = ahora
+        return certs
+
+    # ---------------- verificación ----------------
+    def verificar(self, token: str, audiencia: str) -> dict:
+        """Claims del ID token; TokenInvalido si la firma, audiencia, vigencia o emisor no son válidos."""
+        try:
+            kid = jwt.decode_header(token).get("kid")
+        except (ValueError, TypeError) as e:
+            raise TokenInvalido(str(e)) from e
+        certs = self.certificados()
+        if kid and kid not in certs:
+            certs = self._por_kid(kid)
+        try:
+            info = jwt.decode(token, certs=certs, audience=audiencia, clock_skew_in_seconds=GOOGLE_CLOCK_SKEW)
+        except ValueError as e:
+            raise TokenInvalido(str(e)) from e
+        if info.get("iss") not in EMISORES:
+            raise TokenInvalido(f"emisor inválido: {info.get('iss')}")
+        return info
+
+    # ---------------- renovación en segundo plano ----------------
+    def _ciclo(self):
+        espera_error = 5.0
+        proxima = 0.0  # tras una carga correcta no se renueva antes (max-age=0, Age >= max-age)
+        while not self._detener.is_set():
+            with self._lock:
+                vence, dura = self._vence, self._vigencia
+            # con max-age corto se renueva a mitad de la vigencia
+            ahora = time.monotonic()
+            espera = max(vence - min(GOOGLE_CERTS_ANTES, dura / 2), proxima) - ahora
+            if espera > 0:
+                self._despertar.clear()
+                self._despertar.wait(espera)
+                continue
+            try:
+                with self._carga:
+                    self.cargar()
+                proxima = time.monotonic() + GOOGLE_CERTS_MIN_CICLO
+                espera_error = 5.0
+            except CertificadosNoDisponibles:
+                log.warning("no se pudieron descargar los certificados de Google", exc_info=True)
+                self._detener.wait(espera_error)
+                espera_error = min(espera_error * 2, 300.0)
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ciclo, name="google-certs", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+
+
+verificador = VerificadorGoogle()
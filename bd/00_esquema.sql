@@ -2,6 +2,7 @@
 -- Esquema principal: listas de mercado compartidas
 
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Usuarios
 CREATE TABLE IF NOT EXISTS usuario (
@@ -37,7 +38,11 @@ CREATE TABLE IF NOT EXISTS producto (
   id            BIGSERIAL PRIMARY KEY,
   nombre        VARCHAR(200) NOT NULL,
   usuario_id    UUID REFERENCES usuario(id),
-  created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+  created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  -- nombre en mayúsculas sin tildes (autocomplete)
+  nombre_norm   TEXT GENERATED ALWAYS AS (
+    translate(upper(nombre), 'ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÇ', 'AAAAAEEEEIIIIOOOOOUUUUC')
+  ) STORED
 );
 
 -- Último precio por producto (COP)
@@ -48,13 +53,77 @@ CREATE TABLE IF NOT EXISTS producto_precio (
   updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Historial de precios (solo inserción) y resúmenes por día/semana
+CREATE TABLE IF NOT EXISTS producto_precio_historial (
+  id             BIGSERIAL PRIMARY KEY,
+  producto_id    BIGINT NOT NULL REFERENCES producto(id) ON DELETE CASCADE,
+  precio         BIGINT NOT NULL,
+  usuario_id     UUID REFERENCES usuario(id) ON DELETE SET NULL,
+  registrado_en  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- periodo: 'dia' | 'semana' (inicio = lunes); conteos = {"precio": n} para la mediana exacta
+CREATE TABLE IF NOT EXISTS producto_precio_resumen (
+  producto_id  BIGINT NOT NULL REFERENCES producto(id) ON DELETE CASCADE,
+  periodo      VARCHAR(10) NOT NULL,
+  inicio       DATE NOT NULL,
+  n            INTEGER NOT NULL,
+  minimo       BIGINT NOT NULL,
+  maximo       BIGINT NOT NULL,
+  mediana      BIGINT NOT NULL,
+  ultimo       BIGINT NOT NULL,
+  ultimo_en    TIMESTAMPTZ NOT NULL,
+  conteos      JSONB NOT NULL,
+  PRIMARY KEY (producto_id, periodo, inicio)
+);
+
+-- zona horaria de los cortes por día/semana del historial de precios; la usan
+-- las migraciones y crud. Cambiarla obliga a recalcular producto_precio_resumen.
+CREATE OR REPLACE FUNCTION precios_zona() RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT 'America/Bogota'::text
+$$;
+
+CREATE OR REPLACE FUNCTION precio_conteos_sumar(c JSONB, precio BIGINT) RETURNS JSONB
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT c || jsonb_build_object(precio::text, COALESCE((c ->> precio::text)::int, 0) + 1)
+$$;
+
+CREATE OR REPLACE FUNCTION precio_conteos_mediana(c JSONB) RETURNS BIGINT
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT precio FROM (
+    SELECT key::bigint AS precio,
+           SUM(value::bigint) OVER (ORDER BY key::bigint) AS acumulado,
+           SUM(value::bigint) OVER () AS total
+    FROM jsonb_each_text(c)
+  ) h
+  WHERE acumulado * 2 >= total
+  ORDER BY precio
+  LIMIT 1
+$$;
+
+-- Última unidad usada por producto (autocomplete)
+CREATE TABLE IF NOT EXISTS producto_unidad_ultima (
+  producto_id BIGINT PRIMARY KEY REFERENCES producto(id) ON DELETE CASCADE,
+  unidad_id   SMALLINT NOT NULL REFERENCES unidad(id) ON DELETE CASCADE,
+  usuario_id  UUID REFERENCES usuario(id),
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 -- Listas
 CREATE TABLE IF NOT EXISTS lista (
   id              UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   nombre          VARCHAR(200) NOT NULL,
   foto            TEXT,
   usuario_id      UUID NOT NULL REFERENCES usuario(id),
-  created_at       TIMESTAMPTZ NOT NULL DEFAULT NOW()
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  -- Totales desnormalizados, mantenidos al escribir items
+  total_refs      INTEGER NOT NULL DEFAULT 0,
+  total_comprado  NUMERIC(18,3) NOT NULL DEFAULT 0,
+  total_pendiente NUMERIC(18,3) NOT NULL DEFAULT 0,
+  -- Cursor de cambios (sincronización incremental)
+  version         BIGINT NOT NULL DEFAULT 0,
+  cambio_purgado  BIGINT NOT NULL DEFAULT 0
 );
 
 -- Compartir lista (por usuario)
@@ -89,10 +158,25 @@ CREATE TABLE IF NOT EXISTS lista_item (
   created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   updated_by      UUID REFERENCES usuario(id),
   updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  cambio          BIGINT NOT NULL DEFAULT 0,     -- lista.version de la última escritura
+  version         BIGINT NOT NULL DEFAULT 0,     -- versión del item (If-Match)
 
   UNIQUE (lista_id, producto_id)
 );
 
+-- Tombstones para sincronización incremental (sin FK: sobreviven al borrado)
+CREATE TABLE IF NOT EXISTS lista_item_borrado (
+  id          UUID PRIMARY KEY,
+  lista_id    UUID NOT NULL,
+  cambio      BIGINT NOT NULL,
+  borrado_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS lista_borrada (
+  id          UUID PRIMARY KEY,
+  borrada_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 -- Para mostrar “circulitos” de quienes han tocado el item (cantidad/precio/comprado)
 CREATE TABLE IF NOT EXISTS item (
   id       UUID NOT NULL REFERENCES lista_item(id) ON DELETE CASCADE,
@@ -102,5 +186,27 @@ CREATE TABLE IF NOT EXISTS item (
   PRIMARY KEY (id, usuario_id)
 );
 
+-- Claves de idempotencia de la cola offline (se purgan por antigüedad)
+CREATE TABLE IF NOT EXISTS mutacion (
+  id          UUID PRIMARY KEY,                -- generado por el cliente
+  usuario_id  UUID NOT NULL REFERENCES usuario(id) ON DELETE CASCADE,
+  lista_id    UUID NOT NULL,
+  resultado   JSONB NOT NULL,
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_mutacion_created ON mutacion(created_at);
 CREATE INDEX IF NOT EXISTS idx_lista_usr_usuario ON lista_usuario(usuario_id);
-CREATE INDEX IF NOT EXISTS idx_item_lista ON lista_item(lista_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_item_lista ON lista_item(lista_id);
+CREATE INDEX IF NOT EXISTS idx_item_lista_cambio ON lista_item(lista_id, cambio);
+CREATE INDEX IF NOT EXISTS idx_item_borrado_lista_cambio ON lista_item_borrado(lista_id, cambio);
+CREATE INDEX IF NOT EXISTS idx_lista_usuario ON lista(usuario_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_item_producto_updated ON lista_item(producto_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_link_lista ON lista_link(lista_id);
+CREATE INDEX IF NOT EXISTS idx_item_actividad_orden ON item(id, updated_at, usuario_id);
+-- clave única de producto: get-or-create con ON CONFLICT (nombre_norm)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_producto_nombre_norm ON producto(nombre_norm);
+CREATE INDEX IF NOT EXISTS idx_precio_historial_producto ON producto_precio_historial(producto_id, registrado_en DESC);
+-- Autocomplete: trigram para '%q%' y text_pattern_ops para prefijos cortos
+CREATE INDEX IF NOT EXISTS idx_producto_nombre_norm_trgm ON producto USING gin (nombre_norm gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_producto_nombre_norm_prefijo ON producto (nombre_norm text_pattern_ops);
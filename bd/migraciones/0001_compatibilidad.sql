@@ -0,0 +1,181 @@
+-- 0001_compatibilidad.sql
+-- Ajustes para bases desplegadas antes de 00_esquema.sql actual (antes se
+-- aplicaban en cada arranque desde app.py). Idempotente: en una base creada
+-- con 00_esquema.sql no hace nada.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DO $$
+BEGIN
+  IF to_regclass('public.lista') IS NOT NULL THEN
+    IF EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista'
+        AND column_name = 'usuario_ud'
+    ) AND NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista'
+        AND column_name = 'usuario_id'
+    ) THEN
+      ALTER TABLE public.lista RENAME COLUMN usuario_ud TO usuario_id;
+    END IF;
+
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista'
+        AND column_name = 'created_at'
+    ) THEN
+      ALTER TABLE public.lista
+      ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+    END IF;
+
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista'
+        AND column_name = 'total_refs'
+    ) THEN
+      ALTER TABLE public.lista
+      ADD COLUMN total_refs INTEGER NOT NULL DEFAULT 0,
+      ADD COLUMN total_comprado NUMERIC(18,3) NOT NULL DEFAULT 0,
+      ADD COLUMN total_pendiente NUMERIC(18,3) NOT NULL DEFAULT 0;
+
+      UPDATE public.lista l
+      SET total_refs = t.refs,
+          total_comprado = t.comprado,
+          total_pendiente = t.pendiente
+      FROM (
+        SELECT lista_id,
+               COUNT(*) AS refs,
+               COALESCE(SUM(precio * cantidad) FILTER (WHERE comprado), 0) AS comprado,
+               COALESCE(SUM(precio * cantidad) FILTER (WHERE NOT comprado), 0) AS pendiente
+        FROM public.lista_item
+        GROUP BY lista_id
+      ) t
+      WHERE t.lista_id = l.id;
+    END IF;
+
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista'
+        AND column_name = 'version'
+    ) THEN
+      ALTER TABLE public.lista
+      ADD COLUMN version BIGINT NOT NULL DEFAULT 0,
+      ADD COLUMN cambio_purgado BIGINT NOT NULL DEFAULT 0;
+    END IF;
+  END IF;
+
+  IF to_regclass('public.lista_item') IS NOT NULL THEN
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'lista_item'
+        AND column_name = 'cambio'
+    ) THEN
+      ALTER TABLE public.lista_item ADD COLUMN cambio BIGINT NOT NULL DEFAULT 0;
+      CREATE INDEX IF NOT EXISTS idx_item_lista_cambio ON public.lista_item(lista_id, cambio);
+    END IF;
+
+    IF to_regclass('public.lista_item_borrado') IS NULL THEN
+      CREATE TABLE public.lista_item_borrado (
+        id          UUID PRIMARY KEY,
+        lista_id    UUID NOT NULL,
+        cambio      BIGINT NOT NULL,
+        borrado_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+      );
+      CREATE INDEX idx_item_borrado_lista_cambio ON public.lista_item_borrado(lista_id, cambio);
+    END IF;
+
+    IF to_regclass('public.lista_borrada') IS NULL THEN
+      CREATE TABLE public.lista_borrada (
+        id          UUID PRIMARY KEY,
+        borrada_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+      );
+    END IF;
+  END IF;
+
+  IF to_regclass('public.mutacion') IS NULL AND to_regclass('public.usuario') IS NOT NULL THEN
+    CREATE TABLE public.mutacion (
+      id          UUID PRIMARY KEY,
+      usuario_id  UUID NOT NULL REFERENCES public.usuario(id) ON DELETE CASCADE,
+      lista_id    UUID NOT NULL,
+      resultado   JSONB NOT NULL,
+      created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE INDEX idx_mutacion_created ON public.mutacion(created_at);
+  END IF;
+
+  IF to_regclass('public.usuario') IS NOT NULL THEN
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'usuario'
+        AND column_name = 'created_at'
+    ) THEN
+      ALTER TABLE public.usuario
+      ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+    END IF;
+
+    IF EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'usuario'
+        AND column_name = 'password'
+    ) THEN
+      ALTER TABLE public.usuario ALTER COLUMN password DROP NOT NULL;
+    END IF;
+  END IF;
+
+  IF to_regclass('public.producto') IS NOT NULL THEN
+    IF NOT EXISTS (
+      SELECT 1
+      FROM information_schema.columns
+      WHERE table_schema = 'public'
+        AND table_name = 'producto'
+        AND column_name = 'nombre_norm'
+    ) THEN
+      ALTER TABLE public.producto
+      ADD COLUMN nombre_norm TEXT GENERATED ALWAYS AS (
+        translate(upper(nombre), 'ÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÇ', 'AAAAAEEEEIIIIOOOOOUUUUC')
+      ) STORED;
+    END IF;
+
+    IF to_regclass('public.idx_producto_nombre_norm_trgm') IS NULL THEN
+      CREATE INDEX idx_producto_nombre_norm_trgm ON public.producto USING gin (nombre_norm gin_trgm_ops);
+    END IF;
+
+    IF to_regclass('public.idx_producto_nombre_norm_prefijo') IS NULL THEN
+      CREATE INDEX idx_producto_nombre_norm_prefijo ON public.producto (nombre_norm text_pattern_ops);
+    END IF;
+  END IF;
+
+  IF to_regclass('public.producto_unidad_ultima') IS NULL
+     AND to_regclass('public.lista_item') IS NOT NULL THEN
+    CREATE TABLE public.producto_unidad_ultima (
+      producto_id BIGINT PRIMARY KEY REFERENCES public.producto(id) ON DELETE CASCADE,
+      unidad_id   SMALLINT NOT NULL REFERENCES public.unidad(id) ON DELETE CASCADE,
+      usuario_id  UUID REFERENCES public.usuario(id),
+      updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+
+    INSERT INTO public.producto_unidad_ultima (producto_id, unidad_id, usuario_id, updated_at)
+    SELECT DISTINCT ON (producto_id) producto_id, unidad_id, updated_by, updated_at
+    FROM public.lista_item
+    WHERE unidad_id IS NOT NULL
+    ORDER BY producto_id, updated_at DESC, created_at DESC;
+  END IF;
+END
+$$;
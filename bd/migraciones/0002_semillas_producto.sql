@@ -0,0 +1,36 @@
+-- 0002_semillas_producto.sql
+-- Catálogo inicial de productos.
+
+INSERT INTO public.producto (nombre, usuario_id)
+SELECT p.nombre, NULL::uuid
+FROM (VALUES
+  ('AREPAS'),
+  ('HUEVOS'),
+  ('ARROZ'),
+  ('FRIJOL'),
+  ('LENTEJA'),
+  ('ACEITE'),
+  ('SAL'),
+  ('AZUCAR'),
+  ('PANELA'),
+  ('CAFE'),
+  ('LECHE'),
+  ('QUESO'),
+  ('MANTEQUILLA'),
+  ('POLLO'),
+  ('CARNE DE RES'),
+  ('CHORIZO'),
+  ('PAPA'),
+  ('PLATANO'),
+  ('YUCA'),
+  ('TOMATE'),
+  ('CEBOLLA'),
+  ('AJO'),
+  ('CILANTRO'),
+  ('ZANAHORIA'),
+  ('BANANO'),
+  ('NARANJA')
+) AS p(nombre)
+WHERE NOT EXISTS (
+  SELECT 1 FROM public.producto e WHERE e.nombre = p.nombre
+);
@@ -0,0 +1,14 @@
+-- 0003_indices_consultas.sql
+-- Índices para los filtros y órdenes que usa crud.py.
+
+-- listar_listas / firma_listas / es_dueno: listas propias más recientes primero
+CREATE INDEX IF NOT EXISTS idx_lista_usuario ON public.lista(usuario_id, created_at DESC, id DESC);
+
+-- backfill_unidad_ultima (DISTINCT ON producto_id, updated_at DESC) y cascada al borrar producto
+CREATE INDEX IF NOT EXISTS idx_item_producto_updated ON public.lista_item(producto_id, updated_at DESC);
+
+-- cascada de borrar_lista sobre lista_link (token ya tiene índice único)
+CREATE INDEX IF NOT EXISTS idx_link_lista ON public.lista_link(lista_id);
+
+-- items_tocados: row_number() por item ordenado por updated_at sin ordenar en memoria
+CREATE INDEX IF NOT EXISTS idx_item_actividad_orden ON public.item(id, updated_at, usuario_id);
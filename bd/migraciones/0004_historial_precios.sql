@@ -0,0 +1,73 @@
+-- 0004_historial_precios.sql
+-- Historial de precios (solo inserción) y resúmenes por día/semana que
+-- crud mantiene en la misma sentencia que registra cada observación.
+
+CREATE TABLE IF NOT EXISTS public.producto_precio_historial (
+  id             BIGSERIAL PRIMARY KEY,
+  producto_id    BIGINT NOT NULL REFERENCES public.producto(id) ON DELETE CASCADE,
+  precio         BIGINT NOT NULL,
+  usuario_id     UUID REFERENCES public.usuario(id) ON DELETE SET NULL,
+  registrado_en  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_precio_historial_producto
+  ON public.producto_precio_historial(producto_id, registrado_en DESC);
+
+-- periodo: 'dia' | 'semana' (inicio = lunes); conteos = {"precio": n} para la mediana exacta
+CREATE TABLE IF NOT EXISTS public.producto_precio_resumen (
+  producto_id  BIGINT NOT NULL REFERENCES public.producto(id) ON DELETE CASCADE,
+  periodo      VARCHAR(10) NOT NULL,
+  inicio       DATE NOT NULL,
+  n            INTEGER NOT NULL,
+  minimo       BIGINT NOT NULL,
+  maximo       BIGINT NOT NULL,
+  mediana      BIGINT NOT NULL,
+  ultimo       BIGINT NOT NULL,
+  ultimo_en    TIMESTAMPTZ NOT NULL,
+  conteos      JSONB NOT NULL,
+  PRIMARY KEY (producto_id, periodo, inicio)
+);
+
+-- zona horaria de los cortes por día/semana del historial de precios; la usan
+-- las migraciones y crud. Cambiarla obliga a recalcular producto_precio_resumen.
+CREATE OR REPLACE FUNCTION public.precios_zona() RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT 'America/Bogota'::text
+$$;
+
+-- suma una observación al histograma de precios
+CREATE OR REPLACE FUNCTION public.precio_conteos_sumar(c JSONB, precio BIGINT) RETURNS JSONB
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT c || jsonb_build_object(precio::text, COALESCE((c ->> precio::text)::int, 0) + 1)
+$$;
+
+-- mediana inferior del histograma (el menor precio con la mitad acumulada)
+CREATE OR REPLACE FUNCTION public.precio_conteos_mediana(c JSONB) RETURNS BIGINT
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT precio FROM (
+    SELECT key::bigint AS precio,
+           SUM(value::bigint) OVER (ORDER BY key::bigint) AS acumulado,
+           SUM(value::bigint) OVER () AS total
+    FROM jsonb_each_text(c)
+  ) h
+  WHERE acumulado * 2 >= total
+  ORDER BY precio
+  LIMIT 1
+$$;
+
+-- El último precio conocido de cada producto pasa a ser su primera observación
+-- (cortes en la zona de precios_zona())
+INSERT INTO public.producto_precio_historial (producto_id, precio, usuario_id, registrado_en)
+SELECT pp.producto_id, pp.precio, pp.usuario_id, pp.updated_at
+FROM public.producto_precio pp
+WHERE pp.precio > 0
+  AND NOT EXISTS (SELECT 1 FROM public.producto_precio_historial h WHERE h.producto_id = pp.producto_id);
+
+INSERT INTO public.producto_precio_resumen
+  (producto_id, periodo, inicio, n, minimo, maximo, mediana, ultimo, ultimo_en, conteos)
+SELECT h.producto_id, p.periodo,
+       date_trunc(p.unidad, h.registrado_en AT TIME ZONE public.precios_zona())::date,
+       1, h.precio, h.precio, h.precio, h.precio, h.registrado_en,
+       jsonb_build_object(h.precio::text, 1)
+FROM public.producto_precio_historial h
+CROSS JOIN (VALUES ('dia', 'day'), ('semana', 'week')) AS p(periodo, unidad)
+ON CONFLICT (producto_id, periodo, inicio) DO NOTHING;
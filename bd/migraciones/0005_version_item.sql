@@ -0,0 +1,4 @@
+-- 0005_version_item.sql
+-- Versión por item para concurrencia optimista (If-Match en PATCH de items).
+
+ALTER TABLE public.lista_item ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
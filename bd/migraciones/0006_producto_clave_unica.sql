@@ -0,0 +1,112 @@
+-- 0006_producto_clave_unica.sql
+-- Clave única de producto: nombre_norm (mayúsculas sin tildes). Antes hay que
+-- fusionar los duplicados: por clave se conserva el id menor y sus items,
+-- precios, unidades e historial pasan a él.
+
+CREATE TEMP TABLE producto_duplicado ON COMMIT DROP AS
+SELECT id, conservar FROM (
+  SELECT id, MIN(id) OVER (PARTITION BY nombre_norm) AS conservar FROM public.producto
+) p
+WHERE id <> conservar;
+
+-- listas tocadas: nuevo cursor para que los clientes vean los cambios
+CREATE TEMP TABLE lista_afectada ON COMMIT DROP AS
+SELECT DISTINCT li.lista_id
+FROM public.lista_item li
+JOIN producto_duplicado d ON d.id = li.producto_id;
+
+UPDATE public.lista l SET version = l.version + 1
+FROM lista_afectada a
+WHERE l.id = a.lista_id;
+
+-- (lista, producto conservado) repetido: queda el item del producto conservado o el más reciente
+CREATE TEMP TABLE item_sobrante ON COMMIT DROP AS
+SELECT id, lista_id FROM (
+  SELECT li.id, li.lista_id,
+         row_number() OVER (
+           PARTITION BY li.lista_id, COALESCE(d.conservar, li.producto_id)
+           ORDER BY (d.id IS NULL) DESC, li.updated_at DESC, li.id
+         ) AS n
+  FROM public.lista_item li
+  LEFT JOIN producto_duplicado d ON d.id = li.producto_id
+  WHERE li.lista_id IN (SELECT lista_id FROM lista_afectada)
+) x
+WHERE n > 1;
+
+INSERT INTO public.lista_item_borrado (id, lista_id, cambio)
+SELECT s.id, s.lista_id, l.version
+FROM item_sobrante s
+JOIN public.lista l ON l.id = s.lista_id
+ON CONFLICT (id) DO NOTHING;
+
+DELETE FROM public.lista_item WHERE id IN (SELECT id FROM item_sobrante);
+
+UPDATE public.lista_item li
+SET producto_id = d.conservar, cambio = l.version, version = li.version + 1
+FROM producto_duplicado d, public.lista l
+WHERE li.producto_id = d.id AND l.id = li.lista_id;
+
+UPDATE public.lista l
+SET total_refs = t.refs, total_comprado = t.comprado, total_pendiente = t.pendiente
+FROM (
+  SELECT a.lista_id, COUNT(li.id) AS refs,
+         COALESCE(SUM(li.precio * li.cantidad) FILTER (WHERE li.comprado), 0) AS comprado,
+         COALESCE(SUM(li.precio * li.cantidad) FILTER (WHERE NOT li.comprado), 0) AS pendiente
+  FROM lista_afectada a
+  LEFT JOIN public.lista_item li ON li.lista_id = a.lista_id
+  GROUP BY a.lista_id
+) t
+WHERE l.id = t.lista_id;
+
+-- último precio y última unidad: gana el más reciente entre el conservado y sus duplicados
+INSERT INTO public.producto_precio (producto_id, precio, usuario_id, updated_at)
+SELECT DISTINCT ON (d.conservar) d.conservar, pp.precio, pp.usuario_id, pp.updated_at
+FROM producto_duplicado d
+JOIN public.producto_precio pp ON pp.producto_id = d.id
+ORDER BY d.conservar, pp.updated_at DESC
+ON CONFLICT (producto_id) DO UPDATE SET
+  precio = EXCLUDED.precio, usuario_id = EXCLUDED.usuario_id, updated_at = EXCLUDED.updated_at
+WHERE EXCLUDED.updated_at > public.producto_precio.updated_at;
+
+INSERT INTO public.producto_unidad_ultima (producto_id, unidad_id, usuario_id, updated_at)
+SELECT DISTINCT ON (d.conservar) d.conservar, pu.unidad_id, pu.usuario_id, pu.updated_at
+FROM producto_duplicado d
+JOIN public.producto_unidad_ultima pu ON pu.producto_id = d.id
+ORDER BY d.conservar, pu.updated_at DESC
+ON CONFLICT (producto_id) DO UPDATE SET
+  unidad_id = EXCLUDED.unidad_id, usuario_id = EXCLUDED.usuario_id, updated_at = EXCLUDED.updated_at
+WHERE EXCLUDED.updated_at > public.producto_unidad_ultima.updated_at;
+
+-- historial: se mueve y los resúmenes del conservado se recalculan desde él
+UPDATE public.producto_precio_historial h
+SET producto_id = d.conservar
+FROM producto_duplicado d
+WHERE h.producto_id = d.id;
+
+DELETE FROM public.producto_precio_resumen
+WHERE producto_id IN (SELECT conservar FROM producto_duplicado);
+
+INSERT INTO public.producto_precio_resumen
+  (producto_id, periodo, inicio, n, minimo, maximo, mediana, ultimo, ultimo_en, conteos)
+SELECT producto_id, periodo, inicio, SUM(c)::int, MIN(precio), MAX(precio),
+       public.precio_conteos_mediana(jsonb_object_agg(precio::text, c)),
+       (array_agg(precio ORDER BY ultimo_en DESC))[1], MAX(ultimo_en),
+       jsonb_object_agg(precio::text, c)
+FROM (
+  SELECT h.producto_id, p.periodo,
+         date_trunc(p.unidad, h.registrado_en AT TIME ZONE public.precios_zona())::date AS inicio,
+         h.precio, COUNT(*) AS c, MAX(h.registrado_en) AS ultimo_en
+  FROM public.producto_precio_historial h
+  CROSS JOIN (VALUES ('dia', 'day'), ('semana', 'week')) AS p(periodo, unidad)
+  WHERE h.producto_id IN (SELECT conservar FROM producto_duplicado)
+  GROUP BY 1, 2, 3, 4
+) t
+GROUP BY producto_id, periodo, inicio;
+
+-- la cascada se lleva precio, unidad y resúmenes de los duplicados
+DELETE FROM public.producto WHERE id IN (SELECT id FROM producto_duplicado);
+
+-- get-or-create de crud (ON CONFLICT (nombre_norm)); reemplaza la búsqueda por nombre exacto
+CREATE UNIQUE INDEX IF NOT EXISTS ux_producto_nombre_norm ON public.producto(nombre_norm);
+-- índice de versiones anteriores de 0003 (bases que ya la aplicaron)
+DROP INDEX IF EXISTS public.idx_producto_nombre;
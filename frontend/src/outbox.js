@@ -0,0 +1,155 @@
+import { api } from "./api"
+
+// Cola offline de mutaciones (IndexedDB). Cada op lleva un id generado aquí:
+// el backend (/sync) lo usa como clave de idempotencia, así reintentar no
+// repite trabajo. Los "patch" y "borrar" llevan la versión del item sobre la
+// que se hicieron; si otra persona lo cambió antes, el backend responde
+// "conflicto" y la op queda apartada (`conflicto: true`) hasta que el usuario
+// la reintente o la descarte.
+
+const DB_NOMBRE = "listas-offline"
+const STORE = "outbox"
+const MAX_LOTE = 200
+
+function abrir() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(DB_NOMBRE, 1)
+    req.onupgradeneeded = () => {
+      const store = req.result.createObjectStore(STORE, { keyPath: "seq", autoIncrement: true })
+      store.createIndex("lista_id", "lista_id")
+    }
+    req.onsuccess = () => resolve(req.result)
+    req.onerror = () => reject(req.error)
+  })
+}
+
+async function transaccion(modo, fn) {
+  const db = await abrir()
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(STORE, modo)
+    const resultado = fn(tx.objectStore(STORE))
+    tx.oncomplete = () => resolve(resultado?.result ?? resultado)
+    tx.onerror = () => reject(tx.error)
+  })
+}
+
+export function nuevoId() {
+  return crypto.randomUUID()
+}
+
+export function hayIndexedDB() {
+  return typeof indexedDB !== "undefined"
+}
+
+export async function encolar(listaId, op) {
+  const registro = { id: nuevoId(), ...op, lista_id: listaId }
+  await transaccion("readwrite", (store) => store.add(registro))
+  return registro
+}
+
+async function todas(listaId) {
+  const ops = await transaccion("readonly", (store) =>
+    listaId ? store.index("lista_id").getAll(listaId) : store.getAll()
+  )
+  return (ops || []).sort((a, b) => a.seq - b.seq)
+}
+
+export async function pendientes(listaId) {
+  return (await todas(listaId)).filter((x) => !x.conflicto)
+}
+
+export async function conflictos(listaId) {
+  return (await todas(listaId)).filter((x) => x.conflicto)
+}
+
+async function quitar(seqs) {
+  await transaccion("readwrite", (store) => {
+    for (const seq of seqs) store.delete(seq)
+  })
+}
+
+async function apartar(ops) {
+  await transaccion("readwrite", (store) => {
+    for (const op of ops) store.put({ ...op, conflicto: true })
+  })
+}
+
+// Vuelve a encolar las ops en conflicto sobre las versiones actuales del
+// servidor ({item_id: version}); las de un mismo item se encadenan. Llevan
+// id nuevo: el backend guarda el "conflicto" del id anterior.
+export async function reintentarConflictos(listaId, versiones) {
+  const actual = { ...versiones }
+  const ops = (await conflictos(listaId)).map(({ conflicto, ...op }) => {
+    op = { ...op, id: nuevoId() }
+    if (op.tipo === "agregar" || !(op.item_id in actual)) return op
+    const version = actual[op.item_id]
+    if (op.tipo === "patch") actual[op.item_id] = version + 1
+    return { ...op, version }
+  })
+  await transaccion("readwrite", (store) => {
+    for (const op of ops) store.put(op)
+  })
+}
+
+export async function descartarConflictos(listaId) {
+  await quitar((await conflictos(listaId)).map((x) => x.seq))
+}
+
+// Ops que un 422 de /sync señala (detail[].loc = ["body", "ops", i, ...])
+function opsInvalidas(respuesta, ops) {
+  if (respuesta.status !== 422 || !Array.isArray(respuesta.data?.detail)) return []
+  const indices = new Set(
+    respuesta.data.detail
+      .map((x) => x?.loc)
+      .filter((loc) => Array.isArray(loc) && loc[0] === "body" && loc[1] === "ops" && Number.isInteger(loc[2]))
+      .map((loc) => loc[2])
+  )
+  return ops.filter((_, i) => indices.has(i))
+}
+
+// Envía las ops pendientes de una lista en orden. Si no hay red, quedan en
+// cola; las que vuelven en conflicto se apartan en lugar de borrarse, junto
+// con las siguientes del mismo item (se hicieron sobre la rechazada). Solo se
+// descartan las ops que el servidor rechaza una a una (422 sobre esa op); si
+// rechaza la petición entera (401/403/404...) la cola queda intacta y el
+// error se lanza para mostrarlo. Devuelve la última respuesta y cuántas ops
+// se descartaron por inválidas.
+export async function vaciar(listaId) {
+  let ultimo = null
+  let invalidas = 0
+  const itemsEnConflicto = new Set()
+  for (;;) {
+    const todas = (await pendientes(listaId)).slice(0, MAX_LOTE)
+    if (todas.length === 0) return { ultimo, invalidas }
+    const ops = todas.filter((x) => !itemsEnConflicto.has(x.item_id))
+    const enConflicto = new Set(todas.filter((x) => itemsEnConflicto.has(x.item_id)).map((x) => x.id))
+    try {
+      if (ops.length) {
+        const cuerpo = ops.map(({ seq, lista_id, ...op }) => op)
+        const r = await api.post(`/api/listas/listas/${listaId}/sync`, { ops: cuerpo })
+        ultimo = r.data
+        for (const x of r.data.resultados) {
+          if (x.estado === "conflicto") enConflicto.add(x.id)
+        }
+      }
+    } catch (e) {
+      // sin respuesta = sin red, o error de la petición: la cola no se toca
+      const malas = e?.response ? opsInvalidas(e.response, ops) : []
+      if (!malas.length) throw e
+      invalidas += malas.length
+      await quitar(malas.map((x) => x.seq))
+      continue
+    }
+    const apartadas = todas.filter((x) => enConflicto.has(x.id))
+    for (const x of apartadas) itemsEnConflicto.add(x.item_id)
+    await apartar(apartadas)
+    await quitar(todas.filter((x) => !enConflicto.has(x.id)).map((x) => x.seq))
+  }
+}
+
+export async function vaciarTodo() {
+  const listas = new Set((await pendientes()).map((x) => x.lista_id))
+  for (const listaId of listas) {
+    await vaciar(listaId)
+  }
+}
@@ -1,5 +1,15 @@
 import React, { useEffect, useRef, useState } from "react"
 import { api } from "../api"
+import {
+  conflictos as conflictosOffline,
+  descartarConflictos,
+  encolar,
+  hayIndexedDB,
+  nuevoId,
+  pendientes,
+  reintentarConflictos,
+  vaciar,
+} from "../outbox"
 import { useNavigate, useParams } from "react-router-dom"
 import {
   Plus,
@@ -41,6 +51,18 @@ function cantidadEntera(valor) {
   return Math.max(1, Math.round(n))
 }
 
+// Totales calculados en el cliente mientras hay cambios sin sincronizar
+function totalesLocales(items) {
+  let comprado = 0
+  let pendiente = 0
+  for (const x of items) {
+    const subtotal = Number(x.precio || 0) * Number(x.cantidad || 0)
+    if (x.comprado) comprado += subtotal
+    else pendiente += subtotal
+  }
+  return { total_refs: items.length, total_comprado: comprado, total_pendiente: pendiente }
+}
+
 function extraerMensajeError(error, fallback = "Error") {
   const detail = error?.response?.data?.detail
   if (typeof detail === "string") return detail
@@ -56,6 +78,8 @@ export default function ListaDetalle() {
   const { id } = useParams()
   const nav = useNavigate()
   const toastTimerRef = useRef(null)
+  const eventosAbiertosRef = useRef(false)
+  const enColaRef = useRef(0)
 
   const [data, setData] = useState(null)
   const [producto, setProducto] = useState("")
@@ -68,6 +92,7 @@ export default function ListaDetalle() {
   const [cantidadesEdit, setCantidadesEdit] = useState({})
   const [preciosEdit, setPreciosEdit] = useState({})
   const [msg, setMsg] = useState("")
+  const [conflictos, setConflictos] = useState([])
   const [filtro, setFiltro] = useState("")
   const [mostrarSubir, setMostrarSubir] = useState(false)
 
@@ -114,6 +139,186 @@ export default function ListaDetalle() {
     }
   }, [id, nav])
 
+  // Con el canal de eventos abierto, los cambios propios llegan como delta;
+  // sin él se recarga el detalle completo.
+  const refrescar = async () => {
+    if (!eventosAbiertosRef.current) await cargar()
+  }
+
+  const aplicarLocal = (cambiarItems) => {
+    setData((d) => {
+      if (!d) return d
+      const items = cambiarItems(d.items)
+      return { ...d, ...totalesLocales(items), items }
+    })
+  }
+
+  // Intenta la mutación en línea; sin red (o con cambios ya en cola, para no
+  // desordenarlos) la guarda en la cola offline y la aplica localmente.
+  // En línea, los cambios a un item existente también se aplican ya, con la
+  // versión que devuelve el servidor: con SSE abierto `refrescar` no recarga
+  // y la siguiente edición no puede salir con la versión vieja (409 falso).
+  // Devuelve true si quedó en cola.
+  const mutar = async (op, enLinea, local) => {
+    const encolarOp = async () => {
+      await encolar(id, op)
+      enColaRef.current += 1
+      // la versión local avanza como lo hará en el servidor: la siguiente op
+      // encolada sobre el mismo item parte de ella
+      aplicarLocal((items) =>
+        local(items).map((x) =>
+          op.tipo === "patch" && x.id === op.item_id ? { ...x, version: (x.version ?? 0) + 1 } : x
+        )
+      )
+      mostrarToast("📴 Sin conexión: el cambio se enviará al reconectar", "warning")
+      return true
+    }
+    if (hayIndexedDB() && (enColaRef.current > 0 || navigator.onLine === false)) return encolarOp()
+    try {
+      const r = await enLinea()
+      if (op.tipo !== "agregar") {
+        const version = r?.data?.version
+        aplicarLocal((items) =>
+          local(items).map((x) => (x.id === op.item_id && version != null ? { ...x, version } : x))
+        )
+      }
+      return false
+    } catch (e) {
+      if (!e?.response && hayIndexedDB()) return encolarOp()
+      throw e
+    }
+  }
+
+  // If-Match con la versión que se está viendo: 409 si otra persona cambió el item antes
+  const ifMatch = (item) => (item.version != null ? { "If-Match": `"${item.version}"` } : {})
+
+  const patchItem = (item, cambios) =>
+    api.patch(`/api/listas/listas/${id}/items/${item.id}`, cambios, { headers: ifMatch(item) })
+
+  const recargarSiConflicto = async (e) => {
+    if (e?.response?.status !== 409) return false
+    // con SSE abierto `refrescar` no recarga; aquí hace falta el estado actual
+    await cargar()
+    mostrarToast("⚠️ Otra persona cambió este producto: se recargó la lista", "warning")
+    return true
+  }
+
+  const sincronizar = async () => {
+    if (!hayIndexedDB()) return
+    try {
+      const { ultimo, invalidas } = await vaciar(id)
+      if (invalidas) {
+        mostrarToast(`⚠️ ${invalidas === 1 ? "Un cambio sin conexión no era válido y se descartó" : `${invalidas} cambios sin conexión no eran válidos y se descartaron`}`, "warning")
+      } else if (ultimo) {
+        mostrarToast("🔄 Cambios sin conexión sincronizados")
+      }
+      if (ultimo || invalidas) await cargar()
+    } catch (e) {
+      // sin red o error del servidor: se reintenta con el próximo "online"
+      const status = e?.response?.status
+      if (status >= 400 && status < 500) {
+        const detalle = typeof e.response.data?.detail === "string" ? e.response.data.detail : "solicitud rechazada"
+        mostrarToast(`❌ No se pudieron enviar los cambios sin conexión (${detalle}); siguen guardados`, "error")
+      }
+    }
+    enColaRef.current = (await pendientes(id)).length
+    setConflictos(await conflictosOffline(id))
+  }
+
+  const reintentarOffline = async () => {
+    const versiones = Object.fromEntries((data?.items || []).map((x) => [x.id, x.version ?? 0]))
+    await reintentarConflictos(id, versiones)
+    await sincronizar()
+  }
+
+  const descartarOffline = async () => {
+    await descartarConflictos(id)
+    setConflictos([])
+    await cargar()
+  }
+
+  const nombreOp = (op) => op.producto || data?.items?.find((x) => x.id === op.item_id)?.producto || "Producto"
+
+  useEffect(() => {
+    sincronizar()
+    const onOnline = () => sincronizar()
+    window.addEventListener("online", onOnline)
+    return () => window.removeEventListener("online", onOnline)
+  }, [id])
+
+  const aplicarEvento = (ev) => {
+    if (ev.tipo === "lista_borrada") {
+      nav("/")
+      return
+    }
+    if (ev.tipo === "item_actualizado" && ev.item && !("unidad_id" in ev.item)) {
+      const cambio = ev.item
+      setData((d) =>
+        d && {
+          ...d,
+          ...(ev.totales || {}),
+          items: d.items.map((x) => (x.id === cambio.id ? { ...x, ...cambio } : x)),
+        }
+      )
+      if ("cantidad" in cambio) {
+        setCantidadesEdit((prev) => ({ ...prev, [cambio.id]: String(cantidadEntera(cambio.cantidad)) }))
+      }
+      if ("precio" in cambio) {
+        setPreciosEdit((prev) => ({ ...prev, [cambio.id]: formatearMiles(String(cambio.precio || 0)) }))
+      }
+      return
+    }
+    if (ev.tipo === "item_borrado" && ev.item) {
+      setData((d) =>
+        d && {
+          ...d,
+          ...(ev.totales || {}),
+          items: d.items.filter((x) => x.id !== ev.item.id),
+        }
+      )
+      return
+    }
+    // item_agregado, cambio de unidad o "recargar": se trae el detalle completo
+    cargar().catch(() => {})
+  }
+
+  useEffect(() => {
+    if (typeof EventSource === "undefined") return
+    const es = new EventSource(`/api/listas/listas/${id}/eventos`, { withCredentials: true })
+    const onEvento = (e) => {
+      try {
+        aplicarEvento(JSON.parse(e.data))
+      } catch {
+        // evento malformado: se ignora
+      }
+    }
+    let abiertoAntes = false
+    es.onopen = () => {
+      // al reconectar pudieron perderse eventos
+      if (abiertoAntes) cargar().catch(() => {})
+      abiertoAntes = true
+      eventosAbiertosRef.current = true
+    }
+    es.onerror = () => {
+      eventosAbiertosRef.current = false
+    }
+    for (const tipo of [
+      "item_agregado",
+      "item_actualizado",
+      "item_borrado",
+      "items_agregados",
+      "items_actualizados",
+      "lista_borrada",
+      "recargar",
+    ]) {
+      es.addEventListener(tipo, onEvento)
+    }
+    return () => {
+      eventosAbiertosRef.current = false
+      es.close()
+    }
+  }, [id])
+
   useEffect(() => {
     const onScroll = () => setMostrarSubir(window.scrollY > 260)
     onScroll()
@@ -181,13 +386,27 @@ export default function ListaDetalle() {
       return
     }
 
+    const itemId = nuevoId()
+    const unidadNombre = unidadId ? unidadTexto : null
     try {
-      await api.post(`/api/listas/listas/${id}/items`, {
-        producto: prod,
-        cantidad: cant,
-        precio: pre,
-        unidad_id: unidadId,
-      })
+      const enCola = await mutar(
+        { tipo: "agregar", item_id: itemId, producto: prod, cantidad: cant, precio: pre, unidad_id: unidadId },
+        () =>
+          api.post(`/api/listas/listas/${id}/items`, {
+            producto: prod,
+            cantidad: cant,
+            precio: pre,
+            unidad_id: unidadId,
+          }),
+        (items) => [
+          ...items,
+          { id: itemId, producto: prod, unidad_id: unidadId, unidad: unidadNombre, cantidad: cant, precio: pre, comprado: false, tocado_por: [], version: 0 },
+        ]
+      )
+      if (enCola) {
+        setCantidadesEdit((prev) => ({ ...prev, [itemId]: String(cantidadEntera(cant)) }))
+        setPreciosEdit((prev) => ({ ...prev, [itemId]: formatearMiles(String(pre)) }))
+      }
       setProducto("")
       setCantidad("1")
       setPrecio("0")
@@ -195,8 +414,10 @@ export default function ListaDetalle() {
       setUnidadId(null)
       setSugProductos([])
       setSugUnidades([])
-      await cargar()
-      mostrarToast("✅ Registro agregado correctamente")
+      if (!enCola) {
+        await refrescar()
+        mostrarToast("✅ Registro agregado correctamente")
+      }
     } catch (e) {
       setMsg(extraerMensajeError(e, "Error"))
     }
@@ -204,8 +425,20 @@ export default function ListaDetalle() {
 
   const toggleComprado = async (item) => {
     if (!puedeEditar) return
-    await api.patch(`/api/listas/listas/${id}/items/${item.id}`, { comprado: !item.comprado })
-    await cargar()
+    const comprado = !item.comprado
+    let enCola
+    try {
+      enCola = await mutar(
+        { tipo: "patch", item_id: item.id, version: item.version, comprado },
+        () => patchItem(item, { comprado }),
+        (items) => items.map((x) => (x.id === item.id ? { ...x, comprado } : x))
+      )
+    } catch (e) {
+      if (await recargarSiConflicto(e)) return
+      throw e
+    }
+    if (enCola) return
+    await refrescar()
     mostrarToast("✅ Estado de compra actualizado")
   }
 
@@ -213,11 +446,22 @@ export default function ListaDetalle() {
     if (!puedeEditar || !itemAEliminar) return
     setEliminandoItem(true)
     try {
-      await api.delete(`/api/listas/listas/${id}/items/${itemAEliminar.id}`)
-      await cargar()
-      mostrarToast(`🗑️ ${itemAEliminar.producto} retirado de la lista`)
+      const borrado = itemAEliminar
+      const enCola = await mutar(
+        { tipo: "borrar", item_id: borrado.id, version: borrado.version },
+        () => api.delete(`/api/listas/listas/${id}/items/${borrado.id}`, { headers: ifMatch(borrado) }),
+        (items) => items.filter((x) => x.id !== borrado.id)
+      )
+      if (!enCola) {
+        await refrescar()
+        mostrarToast(`🗑️ ${borrado.producto} retirado de la lista`)
+      }
       setItemAEliminar(null)
     } catch (e) {
+      if (await recargarSiConflicto(e)) {
+        setItemAEliminar(null)
+        return
+      }
       setMsg(extraerMensajeError(e, "No se pudo eliminar el producto"))
     } finally {
       setEliminandoItem(false)
@@ -243,11 +487,17 @@ export default function ListaDetalle() {
     if (nuevaCantidad === actual) return
 
     try {
-      await api.patch(`/api/listas/listas/${id}/items/${item.id}`, { cantidad: nuevaCantidad })
-      await cargar()
+      const enCola = await mutar(
+        { tipo: "patch", item_id: item.id, version: item.version, cantidad: nuevaCantidad },
+        () => patchItem(item, { cantidad: nuevaCantidad }),
+        (items) => items.map((x) => (x.id === item.id ? { ...x, cantidad: nuevaCantidad } : x))
+      )
+      if (enCola) return
+      await refrescar()
       mostrarToast("💾 Cantidad actualizada")
     } catch (e) {
       setCantidadesEdit((prev) => ({ ...prev, [item.id]: String(actual) }))
+      if (await recargarSiConflicto(e)) return
       setMsg(extraerMensajeError(e, "No se pudo actualizar la cantidad"))
       mostrarToast("❌ No se pudo actualizar la cantidad", "error")
     }
@@ -269,11 +519,17 @@ export default function ListaDetalle() {
     }
 
     try {
-      await api.patch(`/api/listas/listas/${id}/items/${item.id}`, { precio: nuevoPrecio })
-      await cargar()
+      const enCola = await mutar(
+        { tipo: "patch", item_id: item.id, version: item.version, precio: nuevoPrecio },
+        () => patchItem(item, { precio: nuevoPrecio }),
+        (items) => items.map((x) => (x.id === item.id ? { ...x, precio: nuevoPrecio } : x))
+      )
+      if (enCola) return
+      await refrescar()
       mostrarToast("💾 Precio actualizado")
     } catch (e) {
       setPreciosEdit((prev) => ({ ...prev, [item.id]: formatearMiles(String(actual)) }))
+      if (await recargarSiConflicto(e)) return
       setMsg(extraerMensajeError(e, "No se pudo actualizar el precio"))
       mostrarToast("❌ No se pudo actualizar el precio", "error")
     }
@@ -373,6 +629,23 @@ export default function ListaDetalle() {
 
       {msg && <div className="alert alert-error mt-4"><span>⚠️ {msg}</span></div>}
 
+      {conflictos.length > 0 && (
+        <div className="alert alert-warning mt-4 flex flex-col sm:flex-row items-start sm:items-center gap-2">
+          <span className="flex-1">
+            ⚠️ Otra persona cambió {conflictos.length === 1 ? "un producto" : "productos"} que editaste sin conexión:{" "}
+            {[...new Set(conflictos.map(nombreOp))].join(", ")}
+          </span>
+          <div className="flex gap-2">
+            <button className="btn btn-sm btn-primary" onClick={reintentarOffline}>
+              Aplicar mis cambios
+            </button>
+            <button className="btn btn-sm btn-ghost" onClick={descartarOffline}>
+              Descartar
+            </button>
+          </div>
+        </div>
+      )}
+
       {!puedeEditar && (
         <div className="alert alert-info mt-4">
           <span>👀 Estás en modo lectura. Solo un Editor o Propietario puede agregar o retirar productos.</span>